@@ -28,5 +28,92 @@ class Settings:
     if not ELASTICSEARCH_URI:
         raise ValueError("❌ Environment variable ELASTICSEARCH_URI is not set or empty.")
     # ### --- END OF CHANGE --- ###
+    # Connection pool of the shared Elasticsearch clients (see services/es_client.py).
+    ES_CONNECTIONS_PER_NODE: int = int(os.getenv("ES_CONNECTIONS_PER_NODE", 10))
+    ES_REQUEST_TIMEOUT: float = float(os.getenv("ES_REQUEST_TIMEOUT", 30))
+    # Result cache for Elasticsearch-backed endpoints. Time ranges are aligned to
+    # QUERY_CACHE_BUCKET_SECONDS so repeated dashboard queries share entries.
+    QUERY_CACHE_MAX_MB: int = int(os.getenv("QUERY_CACHE_MAX_MB", 64))
+    QUERY_CACHE_TTL_SECONDS: float = float(os.getenv("QUERY_CACHE_TTL_SECONDS", 60))
+    QUERY_CACHE_BUCKET_SECONDS: int = int(os.getenv("QUERY_CACHE_BUCKET_SECONDS", 60))
+
+    # --- Packet pipeline tuning ---
+    # Maximum number of parsed packets waiting between the sniffer process and the handler thread.
+    PACKET_QUEUE_MAXSIZE: int = int(os.getenv("PACKET_QUEUE_MAXSIZE", 50000))
+    # EK line parser: "fast" extracts only the indexed fields, "json" decodes the whole document.
+    PACKET_PARSER: str = os.getenv("PACKET_PARSER", "fast")
+    # Number of EK parser processes. With more than one, a splitter process reads the pipe
+    # in chunks of PACKET_SPLIT_CHUNK_BYTES and the handler re-orders packets within
+    # PACKET_REORDER_WINDOW_MS.
+    PACKET_PARSER_WORKERS: int = int(os.getenv("PACKET_PARSER_WORKERS", 1))
+    PACKET_SPLIT_CHUNK_BYTES: int = int(os.getenv("PACKET_SPLIT_CHUNK_BYTES", 1024 * 1024))
+    PACKET_REORDER_WINDOW_MS: int = int(os.getenv("PACKET_REORDER_WINDOW_MS", 200))
+    # Packets travel to the handler thread in batches of this size...
+    PACKET_BATCH_SIZE: int = int(os.getenv("PACKET_BATCH_SIZE", 256))
+    # ...or whatever has been collected after this many seconds.
+    PACKET_BATCH_MAX_DELAY: float = float(os.getenv("PACKET_BATCH_MAX_DELAY", 0.05))
+    # Raw packet indexing into netguard-packets: "all", "sampled" (1 in PACKET_SAMPLE_EVERY) or "none".
+    PACKET_INDEX_MODE: str = os.getenv("PACKET_INDEX_MODE", "all")
+    PACKET_SAMPLE_EVERY: int = int(os.getenv("PACKET_SAMPLE_EVERY", 10))
+    # Each pipeline sink (Elasticsearch, live broadcast) buffers up to this many record batches.
+    PIPELINE_SINK_QUEUE_BATCHES: int = int(os.getenv("PIPELINE_SINK_QUEUE_BATCHES", 256))
+    # What the Elasticsearch sink does when its queue is full: drop_newest, drop_oldest or block.
+    PIPELINE_ES_DROP_POLICY: str = os.getenv("PIPELINE_ES_DROP_POLICY", "drop_newest")
+    # The live UI receives one frame of at most LIVE_FRAME_MAX_PACKETS packets every LIVE_FRAME_INTERVAL_MS.
+    LIVE_FRAME_INTERVAL_MS: int = int(os.getenv("LIVE_FRAME_INTERVAL_MS", 200))
+    LIVE_FRAME_MAX_PACKETS: int = int(os.getenv("LIVE_FRAME_MAX_PACKETS", 50))
+    # Each WebSocket client gets an outbound queue of this many messages; a client whose
+    # queue stays full for WS_SLOW_CLIENT_TIMEOUT seconds is disconnected.
+    WS_CLIENT_QUEUE_SIZE: int = int(os.getenv("WS_CLIENT_QUEUE_SIZE", 100))
+    WS_SLOW_CLIENT_TIMEOUT: float = float(os.getenv("WS_SLOW_CLIENT_TIMEOUT", 10))
+    # Local spool used while Elasticsearch is down or slow. Set PACKET_SPOOL_DIR to "" to disable.
+    PACKET_SPOOL_DIR: str = os.getenv("PACKET_SPOOL_DIR", "/var/lib/netguard/spool")
+    PACKET_SPOOL_SEGMENT_MB: int = int(os.getenv("PACKET_SPOOL_SEGMENT_MB", 64))
+    PACKET_SPOOL_MAX_MB: int = int(os.getenv("PACKET_SPOOL_MAX_MB", 2048))
+    # A bulk request slower than this diverts new batches to the spool.
+    PACKET_SPOOL_SLOW_FLUSH_SECONDS: float = float(os.getenv("PACKET_SPOOL_SLOW_FLUSH_SECONDS", 5.0))
+    # Daily packet/flow indices older than this many days are deleted.
+    PACKET_RETENTION_DAYS: int = int(os.getenv("PACKET_RETENTION_DAYS", 7))
+    FLOW_RETENTION_DAYS: int = int(os.getenv("FLOW_RETENTION_DAYS", 30))
+    INDEX_MAINTENANCE_INTERVAL: float = float(os.getenv("INDEX_MAINTENANCE_INTERVAL", 3600))
+    # Flow aggregation into netguard-flows. Timeouts are in seconds.
+    FLOW_TABLE_ENABLED: bool = os.getenv("FLOW_TABLE_ENABLED", "true").lower() == "true"
+    FLOW_IDLE_TIMEOUT: float = float(os.getenv("FLOW_IDLE_TIMEOUT", 30))
+    FLOW_ACTIVE_TIMEOUT: float = float(os.getenv("FLOW_ACTIVE_TIMEOUT", 300))
+    FLOW_TABLE_MAX_FLOWS: int = int(os.getenv("FLOW_TABLE_MAX_FLOWS", 200000))
+    # In-memory top-k / distinct-count sketches over the live stream, kept per minute.
+    SKETCH_WINDOW_MINUTES: int = int(os.getenv("SKETCH_WINDOW_MINUTES", 60))
+    SKETCH_TOP_K_CAPACITY: int = int(os.getenv("SKETCH_TOP_K_CAPACITY", 1000))
+    SKETCH_MAX_HOSTS: int = int(os.getenv("SKETCH_MAX_HOSTS", 2000))
+    SKETCH_HLL_PRECISION: int = int(os.getenv("SKETCH_HLL_PRECISION", 8))
+    # Per-protocol/port-class/direction rollups: how often closed buckets go to PostgreSQL, and how long they stay.
+    ROLLUP_FLUSH_SECONDS: float = float(os.getenv("ROLLUP_FLUSH_SECONDS", 60))
+    ROLLUP_MINUTE_RETENTION_DAYS: int = int(os.getenv("ROLLUP_MINUTE_RETENTION_DAYS", 7))
+    ROLLUP_HOUR_RETENTION_DAYS: int = int(os.getenv("ROLLUP_HOUR_RETENTION_DAYS", 365))
+    # A bulk request is sent when it holds this many documents...
+    PACKET_BULK_SIZE: int = int(os.getenv("PACKET_BULK_SIZE", 1000))
+    # ...or when its oldest document has waited this many seconds.
+    PACKET_BULK_FLUSH_SECONDS: float = float(os.getenv("PACKET_BULK_FLUSH_SECONDS", 2.0))
+    # Suricata alerts tailed from eve.json are inserted into PostgreSQL (and broadcast) in batches of at most this many.
+    ALERT_BATCH_SIZE: int = int(os.getenv("ALERT_BATCH_SIZE", 500))
+    # security_alerts is partitioned by day: partitions are created this many days ahead
+    # and dropped once older than ALERT_RETENTION_DAYS.
+    ALERT_PARTITIONS_AHEAD_DAYS: int = int(os.getenv("ALERT_PARTITIONS_AHEAD_DAYS", 7))
+    ALERT_RETENTION_DAYS: int = int(os.getenv("ALERT_RETENTION_DAYS", 90))
+    # In-memory threat-intel counters (see services/threat_counters.py): days kept, top-source
+    # counters per day and HyperLogLog precision of the distinct-source sketches.
+    THREAT_COUNTER_DAYS: int = int(os.getenv("THREAT_COUNTER_DAYS", 30))
+    THREAT_TOP_SOURCES_CAPACITY: int = int(os.getenv("THREAT_TOP_SOURCES_CAPACITY", 1000))
+    THREAT_HLL_PRECISION: int = int(os.getenv("THREAT_HLL_PRECISION", 12))
+    # GeoLite2 Country or City database used to enrich alerts, flows and hosts, and how many lookups to cache.
+    GEOIP_DB_PATH: str = os.getenv("GEOIP_DB_PATH", str(Path(__file__).resolve().parent.parent / "database" / "GeoLite2-Country.mmdb"))
+    GEOIP_CACHE_SIZE: int = int(os.getenv("GEOIP_CACHE_SIZE", 65536))
+    # IOC feed files (IPs, CIDRs, domains; see services/ioc_matcher.py), checked for changes every
+    # IOC_RELOAD_SECONDS. Traffic matching a feed raises an alert of IOC_ALERT_SEVERITY, at most once per
+    # source/destination/indicator every IOC_ALERT_DEDUP_SECONDS.
+    IOC_FEED_DIR: str = os.getenv("IOC_FEED_DIR", "/var/lib/netguard/ioc")
+    IOC_RELOAD_SECONDS: float = float(os.getenv("IOC_RELOAD_SECONDS", 60))
+    IOC_ALERT_SEVERITY: int = int(os.getenv("IOC_ALERT_SEVERITY", 2))
+    IOC_ALERT_DEDUP_SECONDS: float = float(os.getenv("IOC_ALERT_DEDUP_SECONDS", 300))
 
 settings = Settings()
@@ -3,7 +3,7 @@
 import os
 import sys
 import logging
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text, UniqueConstraint
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 logging.basicConfig(level=logging.INFO, stream=sys.stdout)
@@ -49,8 +49,51 @@ try:
         from app import models  # Import here to avoid circular dependencies
         logger.info("--- Creating database tables if they do not exist... ---")
         Base.metadata.create_all(bind=engine)
+        add_missing_columns()
+        add_missing_unique_constraints()
         logger.info("✅ Database tables are ready.")
 
+    def add_missing_columns():
+        """
+        create_all() never alters existing tables, so nullable columns added to a
+        model later are added here with ALTER TABLE ... ADD COLUMN IF NOT EXISTS.
+        """
+        existing_tables = set(inspect(engine).get_table_names())
+        with engine.begin() as conn:
+            for table in Base.metadata.sorted_tables:
+                if table.name not in existing_tables:
+                    continue
+                present = {column["name"] for column in inspect(conn).get_columns(table.name)}
+                for column in table.columns:
+                    if column.name in present or not column.nullable:
+                        continue
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN IF NOT EXISTS "{column.name}" {column_type}'))
+                    logger.info(f"Added column {table.name}.{column.name} ({column_type}).")
+
+    def add_missing_unique_constraints():
+        """
+        Adds named unique constraints that existing tables predate. Duplicate rows
+        are removed first, keeping the oldest (lowest id) of each group.
+        """
+        existing_tables = set(inspect(engine).get_table_names())
+        with engine.begin() as conn:
+            for table in Base.metadata.sorted_tables:
+                if table.name not in existing_tables or "id" not in table.c:
+                    continue
+                present = {constraint["name"] for constraint in inspect(conn).get_unique_constraints(table.name)}
+                for constraint in table.constraints:
+                    if not isinstance(constraint, UniqueConstraint) or not constraint.name or constraint.name in present:
+                        continue
+                    columns = [column.name for column in constraint.columns]
+                    same = " AND ".join(f'newer."{name}" = older."{name}"' for name in columns)
+                    removed = conn.execute(text(
+                        f'DELETE FROM {table.name} newer USING {table.name} older WHERE newer.id > older.id AND {same}'
+                    )).rowcount
+                    column_list = ", ".join(f'"{name}"' for name in columns)
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD CONSTRAINT {constraint.name} UNIQUE ({column_list})'))
+                    logger.info(f"Added unique constraint {constraint.name} to {table.name} ({removed} duplicate rows removed).")
+
 except Exception as e:
     logger.critical(f"FATAL: A critical error occurred while creating the database engine: {e}", exc_info=True)
     raise
\ No newline at end of file
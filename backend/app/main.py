@@ -13,11 +13,11 @@ from app.routers import (
     auth, debug, hosts, ports, security, threat_intel,
     zeek, packets, alerts, live_cockpit, investigation
 )
-from app.services import network_scanner, security_monitor, packet_capture
+from app.services import network_scanner, security_monitor, packet_capture, es_client, alert_service, alert_partitions
+from app.services.threat_counters import threat_counters
 from app.database import create_db_and_tables
 from app.config import settings
 from app.state import app_state
-from elasticsearch import Elasticsearch
 
 # --- Configure Logging ---
 logging.basicConfig(level="INFO", format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -35,19 +35,32 @@ async def lifespan(app: FastAPI):
 
     # 1. CREATE DATABASE TABLES
     create_db_and_tables()
+    try:
+        alert_partitions.migrate_legacy_table()
+    except Exception as e:
+        logger.error(f"❌ Could not convert security_alerts into a partitioned table: {e}", exc_info=True)
+    alert_partitions.run_maintenance()
 
     # 2. WAIT FOR ELASTICSEARCH
-    es_client = Elasticsearch(settings.ELASTICSEARCH_URI)
+    es_client.init_clients()
+    es = es_client.get_async_es()
     while True:
         try:
-            if es_client.ping():
+            if await es.ping():
                 logger.info("✅ Elasticsearch is connected and healthy.")
                 break
         except Exception:
             pass
         logger.warning("🟡 Elasticsearch not ready, waiting 5 seconds...")
         await asyncio.sleep(5)
-    es_client.close()
+
+    try:
+        await asyncio.to_thread(alert_service.install_ingest_pipeline)
+        logger.info(f"✅ Ingest pipeline '{alert_service.SURICATA_PIPELINE}' installed.")
+    except Exception as e:
+        # The es-setup service installs it before Filebeat starts; this only keeps it up to date.
+        logger.error(f"❌ Could not install ingest pipeline '{alert_service.SURICATA_PIPELINE}', retrying in the background: {e}")
+        alert_service.install_ingest_pipeline_in_background()
 
     app_state.main_event_loop = asyncio.get_running_loop()
 
@@ -56,29 +69,52 @@ async def lifespan(app: FastAPI):
 
     threading.Thread(target=security_monitor.start_security_monitor, daemon=True).start()
     threading.Thread(target=network_scanner.start_background_scanner, daemon=True).start()
+    # Seeds the threat-intel counters from the alerts already stored; new alerts are counted as they arrive.
+    threading.Thread(target=threat_counters.rebuild, daemon=True).start()
 
     # --- Packet Capture from Named Pipe ---
     try:
         pipe_path_in_container = "/stream/scapy.pcap"
         logger.info(f"✅ Scapy analysis service will read from shared stream: '{pipe_path_in_container}'")
 
-        packet_queue = multiprocessing.Queue()
+        # The queue carries batches of packet records, so its bound is expressed in batches.
+        packet_queue = multiprocessing.Queue(maxsize=max(1, settings.PACKET_QUEUE_MAXSIZE // settings.PACKET_BATCH_SIZE))
         stop_event = multiprocessing.Event()
         app.state.packet_capture_stop_event = stop_event
 
-        sniffer_process = multiprocessing.Process(
-            target=packet_capture.json_sniffer_process,
-            args=(packet_queue, pipe_path_in_container, stop_event),
-            daemon=True
-        )
+        if settings.PACKET_PARSER_WORKERS > 1:
+            # Multi-core ingest: one splitter feeds a pool of EK parser processes.
+            chunk_queue = multiprocessing.Queue(maxsize=settings.PACKET_PARSER_WORKERS * 4)
+            reader_processes = [multiprocessing.Process(
+                target=packet_capture.pipe_splitter_process,
+                args=(chunk_queue, pipe_path_in_container, stop_event),
+                daemon=True
+            )]
+            reader_processes += [
+                multiprocessing.Process(
+                    target=packet_capture.ek_parser_worker,
+                    args=(worker_id, chunk_queue, packet_queue, stop_event),
+                    daemon=True
+                )
+                for worker_id in range(settings.PACKET_PARSER_WORKERS)
+            ]
+            logger.info(f"Parsing the packet stream with {settings.PACKET_PARSER_WORKERS} worker processes.")
+        else:
+            reader_processes = [multiprocessing.Process(
+                target=packet_capture.json_sniffer_process,
+                args=(packet_queue, pipe_path_in_container, stop_event),
+                daemon=True
+            )]
         handler_thread = threading.Thread(
             target=packet_capture.data_handler_thread,
             args=(packet_queue, stop_event),
             daemon=True
         )
 
-        sniffer_process.start()
+        for process in reader_processes:
+            process.start()
         handler_thread.start()
+        app.state.packet_handler_thread = handler_thread
         logger.info("✅ Scapy analysis service started successfully.")
     except Exception as e:
         logger.error(f"❌ FATAL: Failed to start Scapy analysis service: {e}", exc_info=True)
@@ -90,6 +126,10 @@ async def lifespan(app: FastAPI):
     logger.info("--- Shutting Down ---")
     if hasattr(app.state, 'packet_capture_stop_event'):
         app.state.packet_capture_stop_event.set()
+    if hasattr(app.state, 'packet_handler_thread'):
+        # Let the pipeline flush through the shared Elasticsearch client before it is closed.
+        await asyncio.to_thread(app.state.packet_handler_thread.join, 30)
+    await es_client.close_clients()
     logger.info("✅ Shutdown complete.")
 
 
@@ -100,6 +140,8 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], allow_credentials=True,
     allow_methods=["*"], allow_headers=["*"],
+    # Read by the investigation page and alert pollers to request the next page of results.
+    expose_headers=["X-Next-Cursor"],
 )
 
 # --- Register API Routers ---
@@ -1,7 +1,7 @@
 # backend/app/models.py
 
 from app.database import Base
-from sqlalchemy import Column, Integer, String, DateTime, Index, Text, ForeignKey, JSON, Float
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Index, Text, ForeignKey, JSON, Float, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
 
@@ -44,6 +44,22 @@ class NetworkPacket(Base):
     ttl = Column(Integer, nullable=True)
     flags = Column(String(10), nullable=True)
 
+# Pre-aggregated traffic volume per time bucket, written by the packet pipeline
+# (see services/traffic_rollup.py). One row per bucket, dimension and value,
+# e.g. (60 s, 12:01, "protocol", "TCP").
+class TrafficRollup(Base):
+    __tablename__ = "traffic_rollups"
+    id = Column(Integer, primary_key=True)
+    resolution = Column(Integer, nullable=False)  # Bucket width in seconds
+    bucket = Column(DateTime, nullable=False)
+    dimension = Column(String(20), nullable=False)
+    value = Column(String(20), nullable=False)
+    bytes = Column(BigInteger, nullable=False, default=0)
+    packets = Column(BigInteger, nullable=False, default=0)
+    __table_args__ = (
+        UniqueConstraint("resolution", "dimension", "bucket", "value", name="uq_traffic_rollups_bucket"),
+    )
+
 class NetworkPort(Base):
     __tablename__ = "network_ports"
     id = Column(Integer, primary_key=True, index=True)
@@ -55,6 +71,11 @@ class NetworkPort(Base):
     host_id = Column(Integer, ForeignKey('hosts.id'), nullable=True)
     host = relationship("Host", back_populates="ports")
 
+    __table_args__ = (
+        # One row per open port of a host; the key the scanner upserts on.
+        UniqueConstraint("host_ip", "port_number", "protocol", name="uq_network_ports_host_port"),
+    )
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
@@ -100,11 +121,13 @@ class GvmScanTask(Base):
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
 
 
+# Partitioned by day on `timestamp` (see services/alert_partitions.py), so the
+# partition key is part of the primary key and queries should bound `timestamp`.
 class SecurityAlert(Base):
     __tablename__ = "security_alerts"
-    id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime, nullable=False, index=True)
-    source_ip = Column(String(45), index=True) 
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    timestamp = Column(DateTime, primary_key=True, nullable=False)
+    source_ip = Column(String(45)) 
     source_port = Column(Integer)
     destination_ip = Column(String(45), index=True) 
     destination_port = Column(Integer)
@@ -113,6 +136,15 @@ class SecurityAlert(Base):
     signature = Column(String(255))
     event_type = Column(String(50))
     raw_log = Column(Text, nullable=True)
+    # ISO code, or "Local" for private addresses; set at ingest by services/geoip.py.
+    source_country = Column(String(8), nullable=True)
+
+    __table_args__ = (
+        # Latest alerts first, overall and per attacker.
+        Index("ix_security_alerts_timestamp_desc", timestamp.desc()),
+        Index("ix_security_alerts_source_ip_timestamp", source_ip, timestamp.desc()),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
 
 
 class Host(Base):
@@ -125,5 +157,9 @@ class Host(Base):
     vendor = Column(String(255), nullable=True)
     status = Column(String(10), default='down', nullable=False)
     last_seen = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    country_code = Column(String(8), nullable=True)
+    country_name = Column(String(100), nullable=True)
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
     ports = relationship("NetworkPort", back_populates="host", cascade="all, delete-orphan")
     vulnerabilities = relationship("Vulnerability", back_populates="host", cascade="all, delete-orphan")
\ No newline at end of file
@@ -1,12 +1,27 @@
 # backend/app/routers/alerts.py
-from fastapi import APIRouter
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, Response
 from app.services import alert_service
 
 router = APIRouter()
 
 @router.get("/api/alerts")
-def read_alerts():
-    alerts = alert_service.get_latest_alerts()
+def read_alerts(
+    response: Response,
+    size: int = Query(20, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="The X-Next-Cursor header of a previous response; only newer alerts are returned."),
+):
+    """
+    Latest Suricata alerts, newest first. The response body is unchanged; the
+    cursor for the next poll is sent in the X-Next-Cursor header.
+    """
+    try:
+        alerts, next_cursor = alert_service.get_latest_alerts(size=size, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return {"alerts": alerts}
 
 # Don't forget to include this router in your main.py!
\ No newline at end of file
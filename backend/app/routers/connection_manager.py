@@ -1,55 +1,142 @@
 # app/routers/connection_manager.py
-# (FINAL, WORKING VERSION)
 from fastapi import WebSocket
 import logging
 import asyncio
+import time
+
+from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+
+class ClientConnection:
+    """
+    One connected WebSocket client with its own bounded outbound queue and a
+    sender task that drains it, so a slow client only ever delays itself.
+    """
+    def __init__(self, websocket: WebSocket, queue_size: int):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.sender_task: asyncio.Task = None
+        self.connected_at = time.time()
+        # When the queue first became full; reset as soon as the client catches up.
+        self.full_since = None
+
+        self.queued = 0
+        self.sent = 0
+        self.dropped = 0
+        self.latency_ms = 0.0
+
+    def stats(self) -> dict:
+        client = self.websocket.client
+        return {
+            "client": f"{client.host}:{client.port}" if client else None,
+            "connected_for_s": round(time.time() - self.connected_at, 1),
+            "queue_depth": self.queue.qsize(),
+            "queued": self.queued,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "avg_send_latency_ms": round(self.latency_ms, 2),
+        }
+
+
 class ConnectionManager:
     """
-    Manages active WebSocket connections and provides a simple way to broadcast
-    messages to all connected clients.
+    Manages active WebSocket connections and broadcasts messages to all of them.
+
+    Broadcasting never waits on a client: the message is put on each client's
+    queue and sent by that client's sender task. When a queue is full the
+    message is dropped for that client, and a client whose queue stays full for
+    longer than WS_SLOW_CLIENT_TIMEOUT seconds is disconnected.
     """
     def __init__(self):
-        # A list to hold all active WebSocket connections
-        self.active_connections: list[WebSocket] = []
+        self.clients: dict[WebSocket, ClientConnection] = {}
+        self.evicted = 0
+        self._loop: asyncio.AbstractEventLoop = None
+
+    @property
+    def active_connections(self) -> list[WebSocket]:
+        return list(self.clients)
 
     async def connect(self, websocket: WebSocket):
-        """Accepts a new WebSocket connection and adds it to our list."""
+        """Accepts a new WebSocket connection and starts its sender task."""
         await websocket.accept()
-        self.active_connections.append(websocket)
-        logger.info(f"New WebSocket client connected. Total clients: {len(self.active_connections)}")
+        self._loop = asyncio.get_running_loop()
+        client = ClientConnection(websocket, settings.WS_CLIENT_QUEUE_SIZE)
+        client.sender_task = asyncio.create_task(self._sender(client))
+        self.clients[websocket] = client
+        logger.info(f"New WebSocket client connected. Total clients: {len(self.clients)}")
 
     def disconnect(self, websocket: WebSocket):
-        """Removes a WebSocket connection from our list when a client disconnects."""
-        self.active_connections.remove(websocket)
-        logger.info(f"WebSocket client disconnected. Total clients: {len(self.active_connections)}")
+        """Forgets a WebSocket connection and stops its sender task. Safe to call twice."""
+        client = self.clients.pop(websocket, None)
+        if client is None:
+            return
+        if client.sender_task and client.sender_task is not asyncio.current_task():
+            client.sender_task.cancel()
+        logger.info(f"WebSocket client disconnected. Total clients: {len(self.clients)}")
 
     async def broadcast(self, message: str):
         """
-        Broadcasts a text message to all currently connected WebSocket clients.
-        
-        This is an 'async' function, making it directly compatible with the
-        'asyncio.run()' call from our background log-parsing thread.
+        Queues a text message for every connected client and returns at once.
+
+        May be awaited from any event loop; messages are always handed over to
+        the loop the clients live on.
         """
-        # We don't want a single disconnected client to stop the broadcast to others,
-        # so we iterate safely.
-        
-        disconnected_clients = []
-        for connection in self.active_connections:
+        if not self.clients:
+            return
+        if self._loop is not None and asyncio.get_running_loop() is not self._loop:
+            self._loop.call_soon_threadsafe(self._enqueue_all, message)
+            return
+        self._enqueue_all(message)
+
+    def _enqueue_all(self, message: str):
+        now = time.monotonic()
+        for websocket, client in list(self.clients.items()):
             try:
-                # The 'await' is crucial. It sends the message.
-                await connection.send_text(message)
-            except Exception as e:
-                # This typically happens if a client closed their browser tab.
-                # We can't send a message to a closed connection.
-                logger.warning(f"Failed to send message to a client (will disconnect): {e}")
-                disconnected_clients.append(connection)
-
-        # Clean up any connections that broke during the broadcast.
-        for client in disconnected_clients:
-            self.active_connections.remove(client)
+                client.queue.put_nowait((now, message))
+                client.queued += 1
+                continue
+            except asyncio.QueueFull:
+                client.dropped += 1
+
+            if client.full_since is None:
+                client.full_since = now
+            elif now - client.full_since > settings.WS_SLOW_CLIENT_TIMEOUT:
+                logger.warning(f"Disconnecting slow WebSocket client: {client.stats()}")
+                self.evicted += 1
+                self.disconnect(websocket)
+                asyncio.create_task(self._close(websocket))
+
+    async def _sender(self, client: ClientConnection):
+        try:
+            while True:
+                enqueued_at, message = await client.queue.get()
+                await client.websocket.send_text(message)
+                client.sent += 1
+                latency_ms = (time.monotonic() - enqueued_at) * 1000
+                client.latency_ms = 0.9 * client.latency_ms + 0.1 * latency_ms
+                if client.full_since is not None and not client.queue.full():
+                    client.full_since = None
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # This typically happens if a client closed their browser tab.
+            logger.warning(f"Failed to send message to a client (will disconnect): {e}")
+            self.disconnect(client.websocket)
+
+    @staticmethod
+    async def _close(websocket: WebSocket):
+        try:
+            await websocket.close(code=1008)
+        except Exception:
+            pass
+
+    def stats(self) -> dict:
+        return {
+            "clients": [client.stats() for client in self.clients.values()],
+            "evicted": self.evicted,
+        }
 
 
 # Create a single, global instance of the manager that will be imported
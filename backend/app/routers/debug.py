@@ -1,5 +1,9 @@
 from fastapi import APIRouter
 from app.services import network_scanner
+from app.state import app_state
+from app.routers.connection_manager import manager
+from app.services.query_cache import query_cache
+from app.services import query_filters, geoip
 
 router = APIRouter()
 
@@ -7,3 +11,35 @@ router = APIRouter()
 def scan_ports_manual():
     network_scanner.scan_network_ports()
     return {"status": "Scan triggered"}
+
+
+@router.get("/pipeline")
+def get_pipeline_stats():
+    """Reports the per-producer and per-sink counters of the packet ingest pipeline."""
+    pipeline = app_state.packet_pipeline
+    producers = app_state.packet_producer_stats
+    return {
+        "producers": producers.snapshot() if producers else {},
+        "sinks": pipeline.stats() if pipeline else {},
+    }
+
+
+@router.get("/websockets")
+def get_websocket_stats():
+    """Reports per-client queue, send and drop counters of the WebSocket broadcaster."""
+    return manager.stats()
+
+
+@router.get("/query-cache")
+def get_query_cache_stats():
+    """Reports hit/miss counters of the API result cache and of the compiled investigation filters."""
+    return {
+        "results": query_cache.stats(),
+        "compiled_filters": query_filters.cache_info(),
+    }
+
+
+@router.get("/geoip")
+def get_geoip_stats():
+    """Reports the GeoIP database in use and the hit/miss counters of its lookup cache."""
+    return geoip.cache_info()
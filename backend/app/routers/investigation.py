@@ -1,88 +1,241 @@
 # backend/app/routers/investigation.py
 
-from fastapi import APIRouter, Depends, HTTPException, Body
-from elasticsearch import Elasticsearch, ConnectionError as ESConnectionError, RequestError
+import base64
+import json
+
+from fastapi import APIRouter, Depends, HTTPException, Body, Response
+from fastapi.responses import StreamingResponse
+from elasticsearch import AsyncElasticsearch, ConnectionError as ESConnectionError, RequestError, NotFoundError
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+from datetime import datetime, timedelta, timezone
 
 from app.config import settings
+from app.services.es_indices import resolve_search_index
+from app.services.es_client import get_async_es
+from app.services.query_filters import QueryFilters, compile_filters
+from app.services.query_cache import query_cache, time_bucket
 
 router = APIRouter(
     prefix="/api/v1/investigation",
     tags=["Investigation Workbench"],
 )
 
-# Dependency to get an Elasticsearch client instance
-def get_es_client():
-    """Provides a managed Elasticsearch client."""
-    try:
-        client = Elasticsearch(
-            settings.ELASTICSEARCH_URI,
-            retry_on_timeout=True,
-            max_retries=3
-        )
-        yield client
-    except ESConnectionError as e:
-        raise HTTPException(status_code=503, detail=f"Could not connect to Elasticsearch: {e}")
-    finally:
-        if 'client' in locals():
-            client.close()
+# How long Elasticsearch keeps a point in time open between two pages.
+PIT_KEEP_ALIVE = "2m"
+# Page size used by the export stream.
+EXPORT_PAGE_SIZE = 1000
 
-class SearchQuery(BaseModel):
-    """Defines the structure for a search API request."""
-    query_string: str = Field(..., example="protocol:TCP AND destination_port:443", description="Query using Lucene syntax.")
+class BaseSearch(BaseModel):
+    """What to search: the fields shared by paged searches and exports."""
+    query_string: Optional[str] = Field(default=None, example="protocol:TCP AND destination_port:443", description="Query using Lucene syntax.")
+    filters: Optional[QueryFilters] = Field(default=None, description="Structured filters, combined with query_string if both are given.")
     time_range_hours: int = Field(default=24, ge=1, description="Time range in hours to search back from now.")
+    index: str = Field(default="netguard-packets", description="Elasticsearch index to search. 'netguard-packets' and 'netguard-flows' are narrowed to the daily indices in the time range.")
+
+class SearchQuery(BaseSearch):
+    """Defines the structure for a search API request."""
     size: int = Field(default=100, ge=1, le=1000, description="Number of results to return.")
-    index: str = Field(default="netguard-packets", description="Elasticsearch index to search.")
+    cursor: Optional[str] = Field(default=None, description="Value of the X-Next-Cursor header of the previous page, to fetch the next one.")
+
+class ExportQuery(BaseSearch):
+    """A search whose every match is streamed back as NDJSON."""
+    max_docs: Optional[int] = Field(default=None, ge=1, description="Stop after this many documents. Defaults to all matches.")
+
+
+def _encode_cursor(cursor: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(cursor, separators=(",", ":")).encode()).decode()
+
+
+def _decode_cursor(value: str) -> dict:
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(value.encode()))
+        if not {"pit", "search_after", "gte", "lte"} <= cursor.keys():
+            raise ValueError("missing keys")
+        return cursor
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+
+
+def _time_range(hours: int) -> tuple:
+    """
+    Absolute [gte, lte] for the last `hours` hours, fixed once so every page of a
+    cursor sees the same range. The end is the end of the current query cache
+    bucket, so the same search repeated within a bucket is the same request.
+    """
+    bucket_seconds = settings.QUERY_CACHE_BUCKET_SECONDS
+    end = datetime.fromtimestamp((time_bucket(bucket_seconds) + 1) * bucket_seconds, tz=timezone.utc)
+    start = (end - timedelta(hours=hours)).replace(minute=0, second=0, microsecond=0)
+    return start.isoformat(), end.isoformat()
+
+
+def _filter_clauses(query: BaseSearch) -> list:
+    try:
+        return compile_filters(query.filters, query.index)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _search_body(query: BaseSearch, gte: str, lte: str) -> dict:
+    # Everything runs in filter context: results are sorted by time, so scores would be thrown away,
+    # and unscored clauses can be served from Elasticsearch's filter cache on repeated queries.
+    filters = [{"range": {"@timestamp": {"gte": gte, "lte": lte}}}]
+    filters += _filter_clauses(query)
+    if query.query_string:
+        filters.append({
+            "query_string": {
+                "query": query.query_string,
+                "analyze_wildcard": True,
+                "time_zone": "UTC"
+            }
+        })
+    return {
+        "query": {
+            "bool": {
+                "filter": filters
+            }
+        },
+        # _shard_doc breaks ties between documents with the same timestamp, so search_after never skips any.
+        "sort": [
+            {"@timestamp": {"order": "desc", "unmapped_type": "boolean"}},
+            {"_shard_doc": "asc"}
+        ],
+        "track_total_hits": False
+    }
+
+
+async def _open_pit(es: AsyncElasticsearch, query: BaseSearch, gte: str) -> str:
+    index = resolve_search_index(query.index, datetime.fromisoformat(gte))
+    response = await es.open_point_in_time(index=index, keep_alive=PIT_KEEP_ALIVE, ignore_unavailable=True)
+    return response["id"]
+
+
+async def _search_page(es: AsyncElasticsearch, query: BaseSearch, cursor: dict, size: int) -> tuple:
+    """Fetches one page inside the cursor's point in time. Returns (hits, updated pit id)."""
+    body = _search_body(query, cursor["gte"], cursor["lte"])
+    body["pit"] = {"id": cursor["pit"], "keep_alive": PIT_KEEP_ALIVE}
+    if cursor["search_after"]:
+        body["search_after"] = cursor["search_after"]
+    response = await es.search(body=body, size=size)
+    return response["hits"]["hits"], response.get("pit_id", cursor["pit"])
+
+
+async def _close_pit(es: AsyncElasticsearch, pit_id: str):
+    try:
+        await es.close_point_in_time(body={"id": pit_id})
+    except Exception:
+        pass  # It expires on its own after PIT_KEEP_ALIVE anyway.
+
 
 @router.post("/query", response_model=List[Dict[str, Any]])
-def search_network_data(
+async def search_network_data(
+    response: Response,
     query: SearchQuery = Body(...), 
-    es: Elasticsearch = Depends(get_es_client)
+    es: AsyncElasticsearch = Depends(get_async_es)
 ):
     """
     Perform a flexible search query against stored network data in Elasticsearch.
     This is the primary endpoint for the 'Investigation' page.
+
+    Results are paged with a point in time and search_after: when more results
+    exist, the response carries an X-Next-Cursor header. Send the same query
+    again with that value in `cursor` to get the next page.
+
+    Pages are served from the query cache when the same search (same time
+    bucket) was run moments ago, and identical concurrent searches share one
+    Elasticsearch round trip. The point in time is closed once the last page
+    has been read.
     """
-    try:
-        # Construct the Elasticsearch query body
-        es_query = {
-            "query": {
-                "bool": {
-                    "must": {
-                        "query_string": {
-                            "query": query.query_string,
-                            "analyze_wildcard": True,
-                            "time_zone": "UTC"
-                        }
-                    },
-                    "filter": {
-                        "range": {
-                            "@timestamp": {
-                                "gte": f"now-{query.time_range_hours}h/h",
-                                "lte": "now/h"
-                            }
-                        }
-                    }
-                }
-            },
-            "sort": [
-                {"@timestamp": {"order": "desc", "unmapped_type": "boolean"}}
-            ]
-        }
-        
-        response = es.search(
-            index=query.index,
-            body=es_query,
-            size=query.size
-        )
+    _filter_clauses(query)
+    if query.cursor:
+        cursor = _decode_cursor(query.cursor)
+    else:
+        gte, lte = _time_range(query.time_range_hours)
+        cursor = {"pit": None, "search_after": None, "gte": gte, "lte": lte}
+
+    async def run_query() -> dict:
+        if cursor["pit"] is None:
+            cursor["pit"] = await _open_pit(es, query, cursor["gte"])
+        hits, cursor["pit"] = await _search_page(es, query, cursor, query.size)
+        next_cursor = None
+        if len(hits) == query.size:
+            cursor["search_after"] = hits[-1]["sort"]
+            next_cursor = _encode_cursor(cursor)
+        else:
+            # The last page carries no cursor, so nobody can use this point in time again.
+            await _close_pit(es, cursor["pit"])
         # Extract and return the source document for each hit
-        return [hit['_source'] for hit in response['hits']['hits']]
+        return {"documents": [hit['_source'] for hit in hits], "next_cursor": next_cursor}
+
+    key = query_cache.make_key("investigation.query", query.index, {**query.dict(), "range": [cursor["gte"], cursor["lte"]]})
+    try:
+        result = await query_cache.get_or_compute(key, run_query)
+        if result["next_cursor"]:
+            response.headers["X-Next-Cursor"] = result["next_cursor"]
+        return result["documents"]
 
+    except HTTPException:
+        raise
+    except NotFoundError:
+        raise HTTPException(status_code=410, detail="The cursor has expired. Run the query again without a cursor.")
     except RequestError as e:
         # This catches errors from Elasticsearch if the query_string is malformed
         raise HTTPException(status_code=400, detail=f"Invalid search query syntax: {e.info['error']['root_cause'][0]['reason']}")
     except ESConnectionError as e:
         raise HTTPException(status_code=503, detail=f"Elasticsearch connection error: {e}")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+
+
+@router.post("/export")
+async def export_network_data(
+    query: ExportQuery = Body(...),
+    es: AsyncElasticsearch = Depends(get_async_es)
+):
+    """
+    Streams every document matching the query as NDJSON, newest first.
+
+    Pages of EXPORT_PAGE_SIZE documents are read through a point in time and
+    written out as soon as they arrive, so memory use does not grow with the
+    size of the export.
+    """
+    _filter_clauses(query)
+    gte, lte = _time_range(query.time_range_hours)
+    cursor = {"pit": None, "search_after": None, "gte": gte, "lte": lte}
+    first_size = EXPORT_PAGE_SIZE if query.max_docs is None else min(EXPORT_PAGE_SIZE, query.max_docs)
+    # The first page is fetched before streaming starts, so a bad query or a down cluster is still a proper HTTP error.
+    streaming = False
+    try:
+        cursor["pit"] = await _open_pit(es, query, gte)
+        first_hits, cursor["pit"] = await _search_page(es, query, cursor, first_size)
+        streaming = True
+    except RequestError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid search query syntax: {e.info['error']['root_cause'][0]['reason']}")
+    except ESConnectionError as e:
+        raise HTTPException(status_code=503, detail=f"Elasticsearch connection error: {e}")
+    finally:
+        # From here on the stream owns the point in time and closes it when done.
+        if not streaming and cursor["pit"] is not None:
+            await _close_pit(es, cursor["pit"])
+
+    async def stream():
+        hits, size, remaining = first_hits, first_size, query.max_docs
+        try:
+            while hits:
+                yield "".join(json.dumps(hit["_source"], separators=(",", ":")) + "\n" for hit in hits)
+                if remaining is not None:
+                    remaining -= len(hits)
+                if len(hits) < size or remaining == 0:
+                    break
+                cursor["search_after"] = hits[-1]["sort"]
+                size = EXPORT_PAGE_SIZE if remaining is None else min(EXPORT_PAGE_SIZE, remaining)
+                hits, cursor["pit"] = await _search_page(es, query, cursor, size)
+        finally:
+            await _close_pit(es, cursor["pit"])
+
+    filename = f"netguard-export-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.ndjson"
+    return StreamingResponse(
+        stream(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -1,8 +1,9 @@
 # backend/app/routers/live_cockpit.py
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session, joinedload
 from typing import List
+from datetime import datetime, timedelta
 
 # Import your actual models and schemas
 from app import models
@@ -51,15 +52,18 @@ def get_discovered_hosts(db: Session = Depends(get_db)):
 
 
 @router.get("/alerts", response_model=List[schemas.SecurityAlertSchema])
-def get_recent_security_alerts(limit: int = 100, db: Session = Depends(get_db)):
+def get_recent_security_alerts(limit: int = 100, hours: int = Query(24, ge=1), db: Session = Depends(get_db)):
     """
-    Get the latest high-priority security alerts.
+    Get the latest high-priority security alerts of the last `hours` hours.
     
     The 'security_alerts' table should be populated by your security_monitor.py service.
+    It is partitioned by day, so the time bound limits the scan to the recent partitions.
     """
     try:
+        since = datetime.utcnow() - timedelta(hours=hours)
         alerts = (
             db.query(models.SecurityAlert)
+            .filter(models.SecurityAlert.timestamp >= since)
             .order_by(models.SecurityAlert.timestamp.desc())
             .limit(limit)
             .all()
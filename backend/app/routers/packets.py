@@ -1,48 +1,57 @@
 # backend/app/routers/packets.py
 
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List, Dict, Any
-from elasticsearch import Elasticsearch
+from fastapi import APIRouter, Depends, HTTPException, Query
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Any, Optional
+from elasticsearch import AsyncElasticsearch
 from .. import schemas
 from ..config import settings # Import your app settings
+from ..state import app_state
+from ..services.es_indices import PACKET_INDEX, indices_for_range
+from ..services.es_client import get_async_es
+from ..services.query_cache import query_cache, time_bucket
 
 router = APIRouter()
 
-# Dependency to get an Elasticsearch client
-def get_es_client():
-    try:
-        es_client = Elasticsearch(settings.ELASTICSEARCH_URI)
-        yield es_client
-    finally:
-        es_client.close()
-
 @router.get("", response_model=List[schemas.PacketSchema])
-def get_all_packets(es: Elasticsearch = Depends(get_es_client), limit: int = 100):
+async def get_all_packets(es: AsyncElasticsearch = Depends(get_async_es), limit: int = 100, hours: int = Query(24, ge=1)):
     """
-    Retrieves the most recent captured packets from Elasticsearch.
+    Retrieves the most recent captured packets from Elasticsearch, looking back
+    at most `hours` hours so that only the matching daily indices are searched.
+    Responses are cached per query cache time bucket.
     """
-    try:
+    async def fetch_packets() -> list:
         # Elasticsearch query to get the latest packets
         # The '@timestamp' field is automatically created by tshark -T ek
         search_body = {
             "size": limit,
+            # Lets the @timestamp-sorted indices stop after `limit` hits instead of counting every match.
+            "track_total_hits": False,
             "sort": [
                 { "@timestamp": { "order": "desc" }}
             ],
             "query": {
-                "match_all": {}
+                "range": { "@timestamp": { "gte": f"now-{hours}h" } }
             }
         }
         
-        response = es.search(index="netguard-packets", body=search_body)
+        start = datetime.now(timezone.utc) - timedelta(hours=hours)
+        response = await es.search(
+            index=indices_for_range(PACKET_INDEX, start),
+            body=search_body,
+            ignore_unavailable=True,
+        )
         
         # The actual documents are in the 'hits' field of the response
-        packets = [hit['_source'] for hit in response['hits']['hits']]
+        return [hit['_source'] for hit in response['hits']['hits']]
 
+    try:
         # The 'response_model' will validate that the data from Elasticsearch
         # matches your PacketSchema. Make sure your schema matches the data
         # being indexed in packet_capture.py.
-        return packets
+        bucket = time_bucket(settings.QUERY_CACHE_BUCKET_SECONDS)
+        key = query_cache.make_key("packets.latest", PACKET_INDEX, {"limit": limit, "hours": hours, "bucket": bucket})
+        return await query_cache.get_or_compute(key, fetch_packets)
 
     except Exception as e:
         # Log the actual error for debugging
@@ -53,34 +62,232 @@ def get_all_packets(es: Elasticsearch = Depends(get_es_client), limit: int = 100
         )
 
 
-# Note: The protocol-distribution endpoint below still queries PostgreSQL.
-# If you want that to work, you would also need a service that aggregates
-# and stores that data in PostgreSQL, or change it to use an Elasticsearch aggregation query.
-# For now, we are just fixing the main /api/packets endpoint.
+# --- Aggregations ---
+# Dashboards ask Elasticsearch for aggregates (size 0, no _source) instead of
+# pulling raw packets and aggregating them in the browser.
+
+# Fixed intervals the histogram may pick from, in seconds.
+HISTOGRAM_INTERVALS = {
+    "1s": 1, "5s": 5, "15s": 15, "30s": 30, "1m": 60, "5m": 300, "15m": 900,
+    "30m": 1800, "1h": 3600, "3h": 10800, "12h": 43200, "1d": 86400,
+}
+MAX_HISTOGRAM_BUCKETS = 240
+TERM_FIELDS = ("protocol", "source_ip", "destination_ip", "source_port", "destination_port")
+LENGTH_PERCENTS = (50, 90, 95, 99)
+
+
+async def _aggregate(es: AsyncElasticsearch, name: str, hours: int, aggs: dict, params: dict) -> dict:
+    """Runs a size-0 aggregation over the last `hours` of packets, cached per query cache time bucket."""
+    async def run() -> dict:
+        start = datetime.now(timezone.utc) - timedelta(hours=hours)
+        response = await es.search(
+            index=indices_for_range(PACKET_INDEX, start),
+            size=0,
+            source=False,
+            track_total_hits=False,
+            query={"range": {"@timestamp": {"gte": f"now-{hours}h"}}},
+            aggs=aggs,
+            ignore_unavailable=True,
+        )
+        return response.get("aggregations", {})
+
+    bucket = time_bucket(settings.QUERY_CACHE_BUCKET_SECONDS)
+    key = query_cache.make_key(f"packets.{name}", PACKET_INDEX, {**params, "hours": hours, "bucket": bucket})
+    try:
+        return await query_cache.get_or_compute(key, run)
+    except Exception as e:
+        print(f"An unexpected error occurred while aggregating packets in Elasticsearch: {e}")
+        raise HTTPException(status_code=500, detail=f"Elasticsearch aggregation failed: {str(e)}")
+
+
+@router.get("/histogram", response_model=List[schemas.HistogramBucket])
+async def get_packet_histogram(
+    hours: int = Query(1, ge=1),
+    interval: Optional[str] = Query(None, description=f"One of {list(HISTOGRAM_INTERVALS)}. Picked automatically by default."),
+    by: Optional[str] = Query(None, description="Also break bytes down by this field, e.g. 'protocol'."),
+    es: AsyncElasticsearch = Depends(get_async_es),
+):
+    """Bytes and packets over time, optionally broken down by protocol, port or IP."""
+    if interval is None:
+        interval = next(
+            (name for name, seconds in HISTOGRAM_INTERVALS.items() if hours * 3600 / seconds <= MAX_HISTOGRAM_BUCKETS),
+            "1d",
+        )
+    elif interval not in HISTOGRAM_INTERVALS:
+        raise HTTPException(status_code=400, detail=f"Unknown interval '{interval}'. Expected one of {list(HISTOGRAM_INTERVALS)}.")
+    if hours * 3600 / HISTOGRAM_INTERVALS[interval] > 10 * MAX_HISTOGRAM_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Interval '{interval}' is too fine for {hours} hours.")
+    if by is not None and by not in TERM_FIELDS:
+        raise HTTPException(status_code=400, detail=f"Cannot break down by '{by}'. Expected one of {list(TERM_FIELDS)}.")
+
+    histogram = {
+        "date_histogram": {"field": "@timestamp", "fixed_interval": interval, "min_doc_count": 0},
+        "aggs": {"bytes": {"sum": {"field": "length"}}},
+    }
+    if by:
+        histogram["aggs"]["by"] = {
+            "terms": {"field": by, "size": 10},
+            "aggs": {"bytes": {"sum": {"field": "length"}}},
+        }
+    aggregations = await _aggregate(es, "histogram", hours, {"over_time": histogram}, {"interval": interval, "by": by})
+
+    buckets = aggregations.get("over_time", {}).get("buckets", [])
+    result = []
+    for bucket in buckets:
+        item = {"time": bucket["key"], "bytes": int(bucket["bytes"]["value"]), "packets": bucket["doc_count"]}
+        if by:
+            item["breakdown"] = {str(term["key"]): int(term["bytes"]["value"]) for term in bucket["by"]["buckets"]}
+        result.append(item)
+    if by:
+        # Every bucket lists every value, so stacked charts line up.
+        keys = {key for item in result for key in item["breakdown"]}
+        for item in result:
+            item["breakdown"] = {key: item["breakdown"].get(key, 0) for key in sorted(keys)}
+    return result
+
+
+@router.get("/top/{field}", response_model=List[schemas.TermBucket])
+async def get_top_values(
+    field: str,
+    hours: int = Query(1, ge=1),
+    size: int = Query(10, ge=1, le=100),
+    order_by: str = Query("bytes", regex="^(bytes|packets)$"),
+    es: AsyncElasticsearch = Depends(get_async_es),
+):
+    """Top values of a protocol, port or IP field by bytes or packets."""
+    if field not in TERM_FIELDS:
+        raise HTTPException(status_code=404, detail=f"Unknown field '{field}'. Expected one of {list(TERM_FIELDS)}.")
+    terms = {
+        "terms": {"field": field, "size": size, "order": {"bytes" if order_by == "bytes" else "_count": "desc"}},
+        "aggs": {"bytes": {"sum": {"field": "length"}}},
+    }
+    aggregations = await _aggregate(es, "top", hours, {"top": terms}, {"field": field, "size": size, "order_by": order_by})
+    return [
+        {"key": str(bucket["key"]), "bytes": int(bucket["bytes"]["value"]), "packets": bucket["doc_count"]}
+        for bucket in aggregations.get("top", {}).get("buckets", [])
+    ]
+
+
+@router.get("/length-percentiles", response_model=schemas.LengthPercentiles)
+async def get_length_percentiles(hours: int = Query(1, ge=1), es: AsyncElasticsearch = Depends(get_async_es)):
+    """Distribution of packet lengths: min/max/avg and the 50th, 90th, 95th and 99th percentiles."""
+    aggs = {
+        "length_stats": {"stats": {"field": "length"}},
+        "length_percentiles": {"percentiles": {"field": "length", "percents": list(LENGTH_PERCENTS)}},
+    }
+    aggregations = await _aggregate(es, "length_percentiles", hours, aggs, {})
+    stats = aggregations.get("length_stats", {})
+    values = aggregations.get("length_percentiles", {}).get("values", {})
+    return {
+        "count": stats.get("count", 0),
+        "min": stats.get("min"),
+        "max": stats.get("max"),
+        "avg": stats.get("avg"),
+        "percentiles": {f"p{percent}": values.get(f"{float(percent)}") for percent in LENGTH_PERCENTS},
+    }
+
+
+def get_traffic_sketches():
+    sketches = app_state.traffic_sketches
+    if sketches is None:
+        raise HTTPException(status_code=503, detail="Packet capture is not running yet.")
+    return sketches
+
+
+@router.get("/top-talkers", response_model=List[schemas.TopTalker])
+def get_top_talkers(minutes: int = Query(5, ge=1), limit: int = Query(10, ge=1, le=100)):
+    """
+    Returns the source IPs that sent the most bytes over the last `minutes`,
+    answered from in-memory sketches of the live packet stream.
+    """
+    return get_traffic_sketches().top_talkers(minutes, limit)
+
+
+@router.get("/top-ports", response_model=List[schemas.TopPort])
+def get_top_ports(minutes: int = Query(5, ge=1), limit: int = Query(10, ge=1, le=100)):
+    """Returns the most used destination ports (by packet count) over the last `minutes`."""
+    return get_traffic_sketches().top_ports(minutes, limit)
+
+
+@router.get("/distinct-peers", response_model=List[schemas.DistinctPeers])
+def get_distinct_peers(minutes: int = Query(5, ge=1), host: Optional[str] = None, limit: int = Query(10, ge=1, le=100)):
+    """
+    Returns the approximate number of distinct peers of `host` over the last
+    `minutes`, or the hosts with the most distinct peers when no host is given.
+    """
+    return get_traffic_sketches().distinct_peers(minutes, host=host, limit=limit)
+
 
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from .. import dependencies, models
+from .. import dependencies
+from ..services.traffic_rollup import DIMENSIONS, stored_distribution
+
+
+def _as_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _distribution(db: Session, dimension: str, minutes: int, start: Optional[datetime], end: Optional[datetime]) -> dict:
+    """
+    Returns {value: (bytes, packets)} for the window, from the in-memory rollup
+    rings when they still cover it and from the traffic_rollups table otherwise.
+    """
+    # Work in naive UTC, which is how the rollup table stores buckets.
+    end = _as_naive_utc(end) or datetime.utcnow()
+    start = _as_naive_utc(start) or end - timedelta(minutes=minutes)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="'start' must be before 'end'.")
+
+    rollups = app_state.traffic_rollups
+    if rollups is not None:
+        start_s = start.replace(tzinfo=timezone.utc).timestamp()
+        end_s = end.replace(tzinfo=timezone.utc).timestamp()
+        totals = rollups.distribution(dimension, start_s, end_s)
+        if totals is not None:
+            return totals
+    return stored_distribution(db, dimension, start, end)
+
 
 @router.get("/protocol-distribution", response_model=List[schemas.ProtocolDistribution])
-def get_protocol_distribution(db: Session = Depends(dependencies.get_db)):
+def get_protocol_distribution(
+    minutes: int = Query(60, ge=1),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: Session = Depends(dependencies.get_db),
+):
     """
-    Calculates the distribution of network traffic volume (in bytes)
-    for each protocol (TCP, UDP, ICMP, etc.) from the PostgreSQL database.
-    WARNING: This will return empty results as packet data is not stored in PostgreSQL.
+    Returns traffic volume (bytes in `count`, plus packets) per protocol over the
+    last `minutes`, or between `start` and `end`, from the traffic rollups.
     """
     try:
-        protocol_bytes = (
-            db.query(
-                models.NetworkPacket.protocol,
-                func.sum(models.NetworkPacket.length).label("count")
-            )
-            .group_by(models.NetworkPacket.protocol)
-            .order_by(func.sum(models.NetworkPacket.length).desc())
-            .all()
-        )
-        return [{"protocol": protocol, "count": count} for protocol, count in protocol_bytes]
-
+        totals = _distribution(db, "protocol", minutes, start, end)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"An unexpected error occurred while fetching protocol distribution: {e}")
-        raise HTTPException(status_code=500, detail="An internal server error occurred.")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="An internal server error occurred.")
+    return [
+        {"protocol": protocol, "count": total_bytes, "packets": total_packets}
+        for protocol, (total_bytes, total_packets) in sorted(totals.items(), key=lambda item: item[1][0], reverse=True)
+        if total_packets
+    ]
+
+
+@router.get("/traffic-distribution/{dimension}", response_model=List[schemas.TrafficDistribution])
+def get_traffic_distribution(
+    dimension: str,
+    minutes: int = Query(60, ge=1),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: Session = Depends(dependencies.get_db),
+):
+    """Returns bytes and packets per value of `dimension` ('protocol', 'port_class' or 'direction')."""
+    if dimension not in DIMENSIONS:
+        raise HTTPException(status_code=404, detail=f"Unknown dimension '{dimension}'. Expected one of {list(DIMENSIONS)}.")
+    totals = _distribution(db, dimension, minutes, start, end)
+    return [
+        {"value": value, "bytes": total_bytes, "packets": total_packets}
+        for value, (total_bytes, total_packets) in sorted(totals.items(), key=lambda item: item[1][0], reverse=True)
+    ]
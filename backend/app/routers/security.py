@@ -1,7 +1,8 @@
 # backend/app/routers/security.py
-from fastapi import APIRouter, Depends, BackgroundTasks
+from fastapi import APIRouter, Depends, BackgroundTasks, Query
 from sqlalchemy.orm import Session
 from typing import List
+from datetime import datetime, timedelta
 from app.dependencies import get_db
 from app import models, schemas
 
@@ -12,9 +13,16 @@ from app.services import gvm_scanner
 router = APIRouter()
 
 @router.get("/alerts", response_model=List[schemas.SecurityAlertSchema])
-def get_all_security_alerts(db: Session = Depends(get_db)):
-    """Retrieve all security alert records from the database."""
-    alerts = db.query(models.SecurityAlert).order_by(models.SecurityAlert.timestamp.desc()).limit(100).all()
+def get_all_security_alerts(hours: int = Query(24 * 7, ge=1), db: Session = Depends(get_db)):
+    """Retrieve the latest 100 security alerts of the last `hours` hours (only those daily partitions are read)."""
+    since = datetime.utcnow() - timedelta(hours=hours)
+    alerts = (
+        db.query(models.SecurityAlert)
+        .filter(models.SecurityAlert.timestamp >= since)
+        .order_by(models.SecurityAlert.timestamp.desc())
+        .limit(100)
+        .all()
+    )
     return alerts
 
 @router.post("/scan/nuclei/{target}")
@@ -1,11 +1,11 @@
 # backend/app/routers/threat_intel.py
 # --- FINAL WORKING VERSION ---
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Query
 from typing import List, Dict, Any
-from sqlalchemy import func
-from app import models, schemas
-from app.dependencies import get_db
+import math
+from app.services import threat_intelligence, geoip
+from app.services.threat_counters import threat_counters
+from app.services.ioc_matcher import ioc_feeds
 from ..schemas import ThreatIntelSummarySchema
 
 
@@ -14,28 +14,66 @@ router = APIRouter()
 
 # The frontend calls GET /api/threat-intel/origins. This is the new, correct path.
 @router.get("/origins", response_model=List[Dict[str, Any]])
-def get_threat_origins(db: Session = Depends(get_db)):
+def get_threat_origins(hours: int = Query(24 * 7, ge=1), limit: int = Query(10, ge=1, le=250)):
     """
-    Counts the number of alerts per source country.
-    Note: This is a placeholder as you don't have country data in your models.
-    We will simulate it by counting alerts by source IP for now.
+    Counts the number of alerts per source country over the last `hours` hours,
+    in whole UTC days. Countries are stored on each alert at ingest and counted
+    by the in-memory threat counters, so this neither scans nor looks up anything.
     """
-    # This query counts alerts grouped by source IP address.
-    origin_counts = db.query(
-        models.SecurityAlert.source_ip, 
-        func.count(models.SecurityAlert.source_ip).label('count')
-    ).group_by(models.SecurityAlert.source_ip).order_by(func.count(models.SecurityAlert.source_ip).desc()).limit(10).all()
+    summary = threat_counters.summary(days=math.ceil(hours / 24), top=0)
+    return [{"country": country, "count": count} for country, count in summary["countries"][:limit]]
 
-    # Format the data for the chart on the frontend.
-    # In a real app, you would look up the country from the IP here.
-    results = [{"country": ip, "count": count} for ip, count in origin_counts]
-    return results
+
+@router.get("/top-sources", response_model=List[Dict[str, Any]])
+def get_top_sources(hours: int = Query(24 * 7, ge=1), limit: int = Query(10, ge=1, le=100)):
+    """The source IPs with the most alerts over the last `hours` hours (whole UTC days), with their country."""
+    top_sources = threat_counters.top_sources(days=math.ceil(hours / 24), limit=limit)
+    return [
+        {"source_ip": ip, "country": geoip.country_code(ip), "count": count, "error": error}
+        for ip, count, error in top_sources
+    ]
 
 
 @router.get("/summary", response_model=ThreatIntelSummarySchema)
-def get_threat_summary_endpoint(db: Session = Depends(get_db)):
+def get_threat_summary_endpoint(hours: int = Query(24 * 7, ge=1)):
     """
     Returns a full summary of threat intelligence data, including country lookups.
     """
-    summary = threat_intelligence.get_threat_intel_summary(db)
-    return summary
\ No newline at end of file
+    summary = threat_intelligence.get_threat_intel_summary(hours)
+    return summary
+
+
+@router.post("/rebuild")
+def rebuild_threat_counters():
+    """Recomputes the threat counters from the security_alerts table, e.g. after a bulk import."""
+    return threat_counters.rebuild()
+
+
+@router.get("/counters")
+def get_threat_counter_stats():
+    """How much history the threat counters hold and when they were last rebuilt."""
+    return threat_counters.stats()
+
+
+@router.get("/ioc/check")
+def check_indicator(value: str = Query(..., description="An IP address or a domain name.")):
+    """Checks one IP or domain against the loaded IOC feeds."""
+    matcher = ioc_feeds.matcher
+    hit = matcher.match_ip(value) or matcher.match_domain(value)
+    if hit is None:
+        return {"value": value, "match": False}
+    feed, indicator = hit
+    return {"value": value, "match": True, "feed": feed, "indicator": indicator}
+
+
+@router.post("/ioc/reload")
+def reload_indicators():
+    """Reloads the IOC feed files now instead of at the next periodic check."""
+    ioc_feeds.reload(force=True)
+    return ioc_feeds.stats()
+
+
+@router.get("/ioc")
+def get_indicator_stats():
+    """The loaded IOC feeds and how many ranges and domains they hold."""
+    return ioc_feeds.stats()
@@ -92,12 +92,61 @@ class SecurityAlertSchema(OrmConfig):
     dest_ip: str = Field(..., alias='destination_ip')
     protocol: str
 
+class CountryCount(BaseModel):
+    country: str
+    count: int
+
 class ThreatIntelSummarySchema(BaseModel):
-    source: str
+    total_alerts: int
+    high_severity_alerts: int
+    # Approximate (HyperLogLog) number of distinct alert sources.
+    unique_attackers: int
+    countries: List[CountryCount]
+
+class TopTalker(BaseModel):
+    ip: str
+    bytes: int
+    # Upper bound on how much `bytes` may be over-counted.
+    error: int
+
+class TopPort(BaseModel):
+    port: int
+    protocol: str
+    packets: int
+    error: int
+
+class DistinctPeers(BaseModel):
+    host: str
+    distinct_peers: int
+
+class HistogramBucket(BaseModel):
+    time: int  # Bucket start, epoch milliseconds
+    bytes: int
+    packets: int
+    # Bytes per value of the `by` field, when one was requested.
+    breakdown: Optional[Dict[str, int]] = None
+
+class TermBucket(BaseModel):
+    key: str
+    bytes: int
+    packets: int
+
+class LengthPercentiles(BaseModel):
     count: int
+    min: Optional[float] = None
+    max: Optional[float] = None
+    avg: Optional[float] = None
+    percentiles: Dict[str, Optional[float]]
+
+class TrafficDistribution(BaseModel):
+    value: str
+    bytes: int
+    packets: int
 
 class ProtocolDistribution(BaseModel):
     protocol: str
+    # Bytes, kept under this name for the dashboard chart.
     count: int
+    packets: int = 0
     class Config:
         orm_mode = True
\ No newline at end of file
@@ -0,0 +1,175 @@
+# backend/app/services/alert_partitions.py
+"""
+Daily partitions of the security_alerts table.
+
+security_alerts is range-partitioned on `timestamp`, one partition per UTC day
+named security_alerts_pYYYYMMDD. Partitions are created ALERT_PARTITIONS_AHEAD_DAYS
+days in advance by `run_maintenance`, which runs at startup and every hour from the
+security monitor; retention drops whole partitions instead of deleting rows.
+Rows outside every daily partition (clock skew, very old replays) land in
+security_alerts_default and are moved into their partition when it is created.
+
+Databases created before partitioning hold a plain security_alerts table; it is
+converted once at startup by `migrate_legacy_table`.
+"""
+import logging
+from datetime import date, datetime, time, timedelta, timezone
+
+from sqlalchemy import text
+
+from app import models
+from app.config import settings
+from app.database import engine
+
+logger = logging.getLogger(__name__)
+
+PARENT = models.SecurityAlert.__tablename__
+DEFAULT_PARTITION = f"{PARENT}_default"
+PARTITION_PREFIX = f"{PARENT}_p"
+
+
+def partition_name(day: date) -> str:
+    return f"{PARTITION_PREFIX}{day:%Y%m%d}"
+
+
+def _today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def _bounds(day: date) -> tuple:
+    start = datetime.combine(day, time.min)
+    return start, start + timedelta(days=1)
+
+
+def _relkind(conn, table: str):
+    return conn.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"), {"table": table}
+    ).scalar()
+
+
+def _partitions(conn) -> list:
+    return [name for name, in conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:parent)"
+    ), {"parent": PARENT})]
+
+
+def _create_partition(conn, day: date):
+    """Creates the partition for `day`, first moving any of its rows out of the default partition."""
+    name = partition_name(day)
+    start, end = _bounds(day)
+    params = {"start": start, "end": end}
+    stray = conn.execute(text(
+        f"SELECT count(*) FROM {DEFAULT_PARTITION} WHERE timestamp >= :start AND timestamp < :end"
+    ), params).scalar()
+    if stray:
+        conn.execute(text(
+            f"CREATE TEMP TABLE moved_alerts AS "
+            f"SELECT * FROM {DEFAULT_PARTITION} WHERE timestamp >= :start AND timestamp < :end"
+        ), params)
+        conn.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE timestamp >= :start AND timestamp < :end"), params)
+    # Bounds are literals in DDL, so they are formatted rather than bound.
+    conn.execute(text(
+        f"CREATE TABLE {name} PARTITION OF {PARENT} "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    ))
+    if stray:
+        conn.execute(text(f"INSERT INTO {PARENT} SELECT * FROM moved_alerts"))
+        conn.execute(text("DROP TABLE moved_alerts"))
+        logger.info(f"Moved {stray} alerts from {DEFAULT_PARTITION} into {name}.")
+
+
+def ensure_partitions(days_ahead: int = None) -> list:
+    """Creates the missing daily partitions from today to `days_ahead` days from now."""
+    today = _today()
+    days_ahead = settings.ALERT_PARTITIONS_AHEAD_DAYS if days_ahead is None else days_ahead
+    created = []
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT} DEFAULT"))
+        existing = set(_partitions(conn))
+        day = today
+        while day <= today + timedelta(days=days_ahead):
+            if partition_name(day) not in existing:
+                _create_partition(conn, day)
+                created.append(partition_name(day))
+            day += timedelta(days=1)
+    if created:
+        logger.info(f"Created alert partitions: {created}")
+    return created
+
+
+def drop_expired_partitions(retention_days: int = None) -> list:
+    """Drops the daily partitions entirely older than `retention_days` and purges old rows from the default one."""
+    retention_days = settings.ALERT_RETENTION_DAYS if retention_days is None else retention_days
+    cutoff_day = _today() - timedelta(days=retention_days)
+    dropped = []
+    with engine.begin() as conn:
+        for name in sorted(_partitions(conn)):
+            if not name.startswith(PARTITION_PREFIX):
+                continue
+            try:
+                day = datetime.strptime(name[len(PARTITION_PREFIX):], "%Y%m%d").date()
+            except ValueError:
+                continue
+            if day < cutoff_day:
+                conn.execute(text(f"DROP TABLE {name}"))
+                dropped.append(name)
+        if _relkind(conn, DEFAULT_PARTITION):
+            conn.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE timestamp < :cutoff"),
+                         {"cutoff": datetime.combine(cutoff_day, time.min)})
+    if dropped:
+        logger.info(f"Dropped expired alert partitions: {dropped}")
+    return dropped
+
+
+def migrate_legacy_table() -> bool:
+    """
+    Converts a plain (pre-partitioning) security_alerts table into the
+    partitioned one, keeping the alerts within the retention period. Returns
+    True if a migration took place.
+    """
+    with engine.begin() as conn:
+        if _relkind(conn, PARENT) != "r":
+            return False
+        legacy = f"{PARENT}_legacy"
+        logger.info(f"Converting {PARENT} into a partitioned table...")
+        conn.execute(text(f"ALTER TABLE {PARENT} RENAME TO {legacy}"))
+        # Free the index and sequence names for the new table.
+        for index, in conn.execute(text(
+            "SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = :table"
+        ), {"table": legacy}).all():
+            conn.execute(text(f'ALTER INDEX "{index}" RENAME TO "{index[:56]}_legacy"'))
+        sequence = conn.execute(text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": legacy}).scalar()
+        if sequence:
+            conn.execute(text(f"ALTER SEQUENCE {sequence} RENAME TO {legacy}_id_seq"))
+
+        models.SecurityAlert.__table__.create(conn)
+        conn.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {PARENT} DEFAULT"))
+
+        today = _today()
+        cutoff_day = today - timedelta(days=settings.ALERT_RETENTION_DAYS)
+        oldest = conn.execute(text(f"SELECT min(timestamp) FROM {legacy}")).scalar()
+        day = max(oldest.date(), cutoff_day) if oldest else today
+        while day <= today + timedelta(days=settings.ALERT_PARTITIONS_AHEAD_DAYS):
+            _create_partition(conn, day)
+            day += timedelta(days=1)
+
+        columns = ", ".join(column.name for column in models.SecurityAlert.__table__.columns)
+        copied = conn.execute(text(
+            f"INSERT INTO {PARENT} ({columns}) SELECT {columns} FROM {legacy} WHERE timestamp >= :cutoff"
+        ), {"cutoff": datetime.combine(cutoff_day, time.min)}).rowcount
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{PARENT}', 'id'), coalesce((SELECT max(id) FROM {legacy}), 0) + 1, false)"
+        ))
+        conn.execute(text(f"DROP TABLE {legacy}"))
+    logger.info(f"✅ {PARENT} is now partitioned by day; {copied} alerts migrated.")
+    return True
+
+
+def run_maintenance():
+    """Creates upcoming partitions and drops expired ones. Safe to run at any time."""
+    try:
+        ensure_partitions()
+        drop_expired_partitions()
+    except Exception as e:
+        logger.error(f"Alert partition maintenance failed: {e}", exc_info=True)
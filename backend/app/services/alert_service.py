@@ -1,42 +1,122 @@
 # backend/app/services/alert_service.py
-import os
 import json
-from elasticsearch import Elasticsearch
+import logging
+import threading
+import time
+from typing import List, Optional, Tuple
 
-# Read the ES_HOST from the environment variables in your docker-compose file
-es_host = os.getenv("ELASTICSEARCH_HOST", "http://localhost:9200")
-es_client = Elasticsearch(es_host)
+from app.services.es_client import get_es
 
-def get_latest_alerts(size=20):
+logger = logging.getLogger(__name__)
+
+ALERT_INDEX = "filebeat-*"
+
+# Filebeat sends Suricata's eve.json lines through this pipeline (see docker/filebeat.yml),
+# so the event arrives parsed under `suricata.eve` instead of as a JSON string in `message`.
+SURICATA_PIPELINE = "netguard-suricata-eve"
+SURICATA_PIPELINE_BODY = {
+    "description": "Parses Suricata eve.json lines shipped by Filebeat into suricata.eve.",
+    "processors": [
+        {"json": {"if": "ctx.message != null", "field": "message", "target_field": "suricata.eve"}},
+        {"remove": {"if": "ctx.suricata?.eve != null", "field": "message"}},
+    ],
+    # Keep documents that fail to parse; their raw message is returned as is.
+    "on_failure": [{"set": {"field": "error.message", "value": "{{ _ingest.on_failure_message }}"}}],
+}
+
+# Newest first, with the offset in the log file breaking ties between lines read in the same millisecond.
+SORT_DESC = [
+    {"@timestamp": {"order": "desc"}},
+    {"log.offset": {"order": "desc", "unmapped_type": "long"}},
+]
+SORT_ASC = [
+    {"@timestamp": {"order": "asc"}},
+    {"log.offset": {"order": "asc", "unmapped_type": "long"}},
+]
+
+
+def install_ingest_pipeline(es=None):
+    """Creates or updates the Suricata ingest pipeline. Called at startup."""
+    (es or get_es()).ingest.put_pipeline(id=SURICATA_PIPELINE, **SURICATA_PIPELINE_BODY)
+
+
+def install_ingest_pipeline_in_background(interval: float = 30):
+    """Retries install_ingest_pipeline in a daemon thread, every `interval` seconds, until it succeeds."""
+    def retry():
+        while True:
+            time.sleep(interval)
+            try:
+                install_ingest_pipeline()
+                logger.info(f"✅ Ingest pipeline '{SURICATA_PIPELINE}' installed.")
+                return
+            except Exception as e:
+                logger.warning(f"Ingest pipeline '{SURICATA_PIPELINE}' is still not installed, will retry: {e}")
+
+    threading.Thread(target=retry, daemon=True, name="IngestPipelineInstall").start()
+
+
+def encode_cursor(sort_values: list) -> str:
+    return ":".join(str(value) for value in sort_values)
+
+
+def decode_cursor(cursor: str) -> list:
+    """Raises ValueError for a malformed cursor."""
+    try:
+        values = [int(value) for value in cursor.split(":")]
+    except ValueError:
+        values = []
+    if len(values) != 2:
+        raise ValueError(f"'{cursor}' is not an alert cursor.")
+    return values
+
+
+def _alert_from_hit(hit: dict) -> Optional[dict]:
+    source = hit.get("_source", {})
+    eve = source.get("suricata", {}).get("eve")
+    if eve is not None:
+        return eve
+
+    # Documents indexed before the ingest pipeline existed still carry the raw JSON line.
+    message_str = source.get("message")
+    if not message_str:
+        return None
+    try:
+        return json.loads(message_str)
+    except json.JSONDecodeError:
+        # Handle cases where the message is not valid JSON
+        return {"raw_message": message_str}
+
+
+def get_latest_alerts(size=20, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
     """
-    Fetches the latest alerts from Elasticsearch and parses the nested JSON.
+    Fetches alerts from Elasticsearch, newest first, and returns them with a
+    cursor for the newest one. Without a cursor the latest `size` alerts are
+    returned; with one, only alerts after it (at most `size`, the oldest of
+    them first in time), so pollers fetch each alert once. The cursor is
+    returned unchanged when there is nothing new. Raises ValueError for a
+    malformed cursor.
     """
+    search_after = decode_cursor(cursor) if cursor else None
     try:
-        response = es_client.search(
-            index="filebeat-*",
-            body={
-              "size": size,
-              "sort": [{"@timestamp": {"order": "desc"}}]
-            }
+        response = get_es().search(
+            index=ALERT_INDEX,
+            size=size,
+            sort=SORT_ASC if search_after else SORT_DESC,
+            search_after=search_after,
+            track_total_hits=False,
+            source=["suricata.eve", "message"],
+            query={"bool": {
+                "should": [{"exists": {"field": "suricata.eve"}}, {"exists": {"field": "message"}}],
+                "minimum_should_match": 1,
+            }},
         )
-
-        clean_alerts = []
-        for hit in response["hits"]["hits"]:
-            # This is where we unlock the data
-            raw_source = hit.get("_source", {})
-            message_str = raw_source.get("message")
-            
-            if message_str:
-                try:
-                    # Parse the JSON string inside the "message" field
-                    alert_data = json.loads(message_str)
-                    clean_alerts.append(alert_data)
-                except json.JSONDecodeError:
-                    # Handle cases where the message is not valid JSON
-                    clean_alerts.append({"raw_message": message_str})
-
-        return clean_alerts
-        
     except Exception as e:
         print(f"Error connecting to or querying Elasticsearch: {e}")
-        return []
\ No newline at end of file
+        return [], cursor
+
+    hits = response["hits"]["hits"]
+    if search_after:
+        hits.reverse()
+    clean_alerts = [alert for alert in map(_alert_from_hit, hits) if alert is not None]
+    next_cursor = encode_cursor(hits[0]["sort"]) if hits else cursor
+    return clean_alerts, next_cursor
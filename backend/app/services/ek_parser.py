@@ -0,0 +1,140 @@
+# backend/app/services/ek_parser.py
+"""
+Parsers for the newline-delimited JSON produced by `tshark -T ek`.
+
+Both parsers take one raw line (bytes) and return a packet record laid out as
+packet_transport.PACKET_FIELDS, or None for index lines and non-IP packets.
+Timestamps stay as integer epoch milliseconds; they are only formatted when a
+record is turned into a document.
+
+- parse_ek_line_json: decodes the whole line with json.loads. Robust, but it
+  builds nested dicts for every layer and field tshark emits.
+- parse_ek_line_fast: locates only the fields we need with bytes.find and
+  never builds the document. Lines it cannot handle fall back to the JSON parser.
+"""
+import json
+
+
+def parse_ek_line_json(line: bytes):
+    """Parses an EK line by decoding the full JSON document."""
+    ek_doc = json.loads(line)
+    layers = ek_doc.get("layers")
+    if not layers:
+        return None
+
+    ip_layer = layers.get("ip", {})
+    source_ip = ip_layer.get("ip_ip_src")
+    destination_ip = ip_layer.get("ip_ip_dst")
+    if not source_ip or not destination_ip:
+        return None
+
+    protocol = "UNKNOWN"
+    source_port = destination_port = tcp_flags = None
+    if "tcp" in layers:
+        protocol = "TCP"
+        source_port = int(layers["tcp"].get("tcp_tcp_srcport", 0))
+        destination_port = int(layers["tcp"].get("tcp_tcp_dstport", 0))
+        tcp_flags = int(str(layers["tcp"].get("tcp_tcp_flags", "0")), 16)
+    elif "udp" in layers:
+        protocol = "UDP"
+        source_port = int(layers["udp"].get("udp_udp_srcport", 0))
+        destination_port = int(layers["udp"].get("udp_udp_dstport", 0))
+    elif "icmp" in layers:
+        protocol = "ICMP"
+
+    eth_layer = layers.get("eth", {})
+    return (
+        int(ek_doc.get("timestamp")),
+        source_ip,
+        destination_ip,
+        int(layers.get("frame", {}).get("frame_frame_len", 0)),
+        int(ip_layer.get("ip_ip_ttl", 0)),
+        protocol,
+        eth_layer.get("eth_eth_src"),
+        eth_layer.get("eth_eth_dst"),
+        source_port,
+        destination_port,
+        tcp_flags,
+    )
+
+
+# Value terminators for unquoted EK values (numbers, booleans).
+_VALUE_END = (b",", b"}", b"]")
+
+
+def _field(line: bytes, key: bytes):
+    """
+    Returns the raw value of the first occurrence of `key` (given with its
+    surrounding quotes and colon, e.g. b'"ip_ip_src":'), or None if absent.
+    Repeated fields are emitted by tshark as arrays; their first element is used,
+    which is also the outermost header.
+    """
+    start = line.find(key)
+    if start < 0:
+        return None
+    start += len(key)
+    first = line[start]
+    if first == 91:  # '['
+        start += 1
+        first = line[start]
+    if first == 34:  # '"'
+        start += 1
+        return line[start:line.index(b'"', start)]
+    end = min((i for i in (line.find(t, start) for t in _VALUE_END) if i >= 0), default=len(line))
+    return line[start:end]
+
+
+def parse_ek_line_fast(line: bytes):
+    """Parses an EK line by extracting only the indexed fields from the raw bytes."""
+    if line.startswith(b'{"index"') or b'"layers":' not in line:
+        return None
+
+    try:
+        source_ip = _field(line, b'"ip_ip_src":')
+        destination_ip = _field(line, b'"ip_ip_dst":')
+        if not source_ip or not destination_ip:
+            return None
+
+        protocol = "UNKNOWN"
+        source_port = destination_port = tcp_flags = None
+        if b'"tcp":' in line:
+            protocol = "TCP"
+            source_port = int(_field(line, b'"tcp_tcp_srcport":') or 0)
+            destination_port = int(_field(line, b'"tcp_tcp_dstport":') or 0)
+            tcp_flags = int(_field(line, b'"tcp_tcp_flags":') or b"0", 16)
+        elif b'"udp":' in line:
+            protocol = "UDP"
+            source_port = int(_field(line, b'"udp_udp_srcport":') or 0)
+            destination_port = int(_field(line, b'"udp_udp_dstport":') or 0)
+        elif b'"icmp":' in line:
+            protocol = "ICMP"
+
+        source_mac = _field(line, b'"eth_eth_src":')
+        destination_mac = _field(line, b'"eth_eth_dst":')
+        return (
+            int(_field(line, b'"timestamp":')),
+            source_ip.decode(),
+            destination_ip.decode(),
+            int(_field(line, b'"frame_frame_len":') or 0),
+            int(_field(line, b'"ip_ip_ttl":') or 0),
+            protocol,
+            source_mac.decode() if source_mac is not None else None,
+            destination_mac.decode() if destination_mac is not None else None,
+            source_port,
+            destination_port,
+            tcp_flags,
+        )
+    except (ValueError, TypeError, IndexError):
+        # Escaped strings, odd number formats, etc. Let the full parser decide.
+        return parse_ek_line_json(line)
+
+
+PARSERS = {
+    "fast": parse_ek_line_fast,
+    "json": parse_ek_line_json,
+}
+
+
+def get_parser(mode: str):
+    """Returns the parser for a PACKET_PARSER mode, defaulting to the fast one."""
+    return PARSERS.get(mode, parse_ek_line_fast)
@@ -0,0 +1,253 @@
+# backend/app/services/es_bulk_writer.py
+import logging
+import threading
+import time
+
+from elasticsearch import ApiError, TransportError, ConnectionError as ESConnectionError
+
+logger = logging.getLogger(__name__)
+
+# How often (in seconds) the writer logs its throughput figures.
+THROUGHPUT_LOG_INTERVAL = 60
+
+# Per-item bulk statuses worth retrying later; anything else (mapping errors, etc.) is dropped.
+RETRYABLE_STATUSES = {429, 502, 503, 504}
+
+
+class BulkWriter:
+    """
+    Buffers documents and sends them to Elasticsearch through the bulk API.
+
+    A batch is flushed as soon as it holds `max_docs` documents, or once
+    `max_interval` seconds have passed since its first document arrived,
+    whichever comes first. Items rejected by Elasticsearch are counted and
+    logged one by one; they never abort the rest of the batch.
+
+    With a `spool` (see es_spool.DiskSpool), batches that cannot be indexed
+    because Elasticsearch is unreachable, overloaded or slower than
+    `slow_flush_seconds` are written to disk instead of being dropped. While
+    the spool holds data, new batches are appended to it as well so that
+    ordering is kept, and a replay thread (start_replay) drains it into
+    Elasticsearch at whatever pace the cluster allows. Batches go straight to
+    Elasticsearch again only once the replay thread has emptied the spool with
+    bulk requests that were fast and fully accepted.
+    """
+
+    def __init__(self, es_client, index: str, max_docs: int = 500, max_interval: float = 2.0,
+                 spool=None, slow_flush_seconds: float = 5.0, prepare=None):
+        self.es_client = es_client
+        self.index = index
+        self.max_docs = max_docs
+        self.max_interval = max_interval
+        self.spool = spool
+        self.slow_flush_seconds = slow_flush_seconds
+        # Called once before the first successful request, e.g. to create index mappings.
+        self.prepare = prepare
+        self._prepared = prepare is None
+
+        self._actions = []
+        self._batch_started = None
+        self._divert_to_spool = False
+        self._stats_lock = threading.Lock()
+
+        self.indexed = 0
+        self.failed = 0
+        self.spooled = 0
+        self.batches = 0
+        self.last_flush_seconds = 0.0
+        self.docs_per_second = 0.0
+        self._window_started = time.monotonic()
+        self._window_indexed = 0
+
+    def add(self, document: dict, index: str = None):
+        """Queues a document for indexing, flushing if the batch is full."""
+        if not self._actions:
+            self._batch_started = time.monotonic()
+        self._actions.append({"_index": index or self.index, "_source": document})
+        if len(self._actions) >= self.max_docs:
+            self.flush()
+
+    def seconds_until_due(self) -> float:
+        """How long the caller may block before the pending batch must be flushed."""
+        if not self._actions:
+            return self.max_interval
+        elapsed = time.monotonic() - self._batch_started
+        return max(0.0, self.max_interval - elapsed)
+
+    def flush_if_due(self):
+        """Flushes the pending batch if its time limit has been reached."""
+        if self._actions and self.seconds_until_due() <= 0:
+            self.flush()
+
+    def flush(self):
+        """Sends every pending document to Elasticsearch in a single bulk request."""
+        if not self._actions:
+            return
+
+        actions, self._actions = self._actions, []
+        self._batch_started = None
+
+        if self.spool is not None:
+            if self._divert_to_spool or self.spool.pending_docs > 0:
+                self._spool(actions)
+                return
+
+        started = time.monotonic()
+        try:
+            retry = self._send(actions)
+        except (TransportError, ESConnectionError) as e:
+            if self.spool is None:
+                with self._stats_lock:
+                    self.failed += len(actions)
+                logger.error(f"Failed to send {len(actions)} documents to Elasticsearch: {e}")
+                return
+            logger.warning(f"Elasticsearch is unavailable ({e}). Spooling to disk until it recovers.")
+            self._divert_to_spool = True
+            self._spool(actions)
+            return
+
+        self.last_flush_seconds = time.monotonic() - started
+        if self.spool is not None:
+            if retry:
+                self._divert_to_spool = True
+                self._spool(retry)
+            elif self.last_flush_seconds > self.slow_flush_seconds:
+                logger.warning(
+                    f"Bulk request took {self.last_flush_seconds:.1f}s. "
+                    f"Spooling to disk until Elasticsearch catches up."
+                )
+                self._divert_to_spool = True
+        self._report_throughput()
+
+    def _spool(self, actions: list):
+        self.spool.append(actions)
+        with self._stats_lock:
+            self.spooled += len(actions)
+
+    def _send(self, actions: list) -> list:
+        """
+        Indexes `actions` in one bulk request. Returns the actions that failed
+        with a retryable status; connection errors are raised to the caller.
+        """
+        if not self._prepared:
+            try:
+                self.prepare()
+            except ApiError as e:
+                # Rejected (not unreachable): retrying every flush won't help, so index without it.
+                logger.error(f"Preparing '{self.index}' was rejected by Elasticsearch; indexing without it. Error: {e}")
+            self._prepared = True
+
+        operations = []
+        for action in actions:
+            operations.append({"index": {"_index": action["_index"]}})
+            operations.append(action["_source"])
+        try:
+            items = self.es_client.bulk(operations=operations)["items"]
+        except ApiError as e:
+            # The whole request was refused (e.g. 429 from the coordinating node).
+            if self.spool is not None and e.status_code in RETRYABLE_STATUSES:
+                return actions
+            with self._stats_lock:
+                self.batches += 1
+                self.failed += len(actions)
+            logger.error(f"Elasticsearch rejected a bulk request of {len(actions)} documents: {e}")
+            return []
+
+        # Bulk response items are in request order, one per action.
+        indexed = failed = 0
+        retry = []
+        for action, item in zip(actions, items):
+            result = item.get("index", item)
+            status = result.get("status", 500)
+            if status < 300:
+                indexed += 1
+                continue
+            if self.spool is not None and status in RETRYABLE_STATUSES:
+                retry.append(action)
+                continue
+            failed += 1
+            # Only the first few rejections of a batch are worth a log line each.
+            if failed <= 5:
+                logger.error(f"Elasticsearch rejected document for '{result.get('_index')}': {result.get('error')}")
+
+        if failed > 5:
+            logger.error(f"{failed} documents in total were rejected in the last bulk request.")
+
+        with self._stats_lock:
+            self.batches += 1
+            self.indexed += indexed
+            self.failed += failed
+            self._window_indexed += indexed
+        return retry
+
+    def start_replay(self, stop_event):
+        """Starts the background thread that drains the spool into Elasticsearch."""
+        if self.spool is None:
+            return
+        threading.Thread(target=self._replay_loop, args=(stop_event,), daemon=True, name="SpoolReplay").start()
+
+    def _replay_loop(self, stop_event):
+        backoff = 1
+        while not stop_event.is_set():
+            actions, position = self.spool.read(self.max_docs)
+            if not actions:
+                self.spool.commit(position)
+                stop_event.wait(1.0)
+                continue
+            started = time.monotonic()
+            try:
+                retry = self._send(actions)
+            except (TransportError, ESConnectionError) as e:
+                logger.debug(f"Spool replay is waiting for Elasticsearch: {e}")
+                stop_event.wait(backoff)
+                backoff = min(backoff * 2, 60)
+                continue
+            except Exception as e:
+                logger.error(f"Unexpected error while replaying the spool: {e}", exc_info=True)
+                stop_event.wait(backoff)
+                continue
+
+            self.spool.commit(position)
+            backoff = 1
+            if retry:
+                # Still overloaded. Requeue the rejected items at the end and give the cluster a moment.
+                self.spool.append(retry)
+                stop_event.wait(1.0)
+            elif time.monotonic() - started <= self.slow_flush_seconds and self.spool.pending_docs == 0:
+                # The spool is drained and the cluster keeps up again: stop diverting new batches.
+                self._divert_to_spool = False
+
+    def _report_throughput(self):
+        now = time.monotonic()
+        elapsed = now - self._window_started
+        if elapsed < THROUGHPUT_LOG_INTERVAL:
+            return
+        with self._stats_lock:
+            self.docs_per_second = self._window_indexed / elapsed
+            self._window_indexed = 0
+        self._window_started = now
+        logger.info(
+            f"Bulk writer throughput: {self.docs_per_second:.1f} docs/s to '{self.index}' "
+            f"(total indexed={self.indexed}, failed={self.failed}, spooled={self.spooled}, "
+            f"batches={self.batches}, last flush={self.last_flush_seconds * 1000:.0f} ms)"
+        )
+
+    def stats(self) -> dict:
+        """Returns a snapshot of the writer's counters."""
+        return {
+            "index": self.index,
+            "pending": len(self._actions),
+            "indexed": self.indexed,
+            "failed": self.failed,
+            "spooled": self.spooled,
+            "batches": self.batches,
+            "docs_per_second": round(self.docs_per_second, 1),
+            "last_flush_ms": round(self.last_flush_seconds * 1000, 1),
+            "spool": self.spool.stats() if self.spool is not None else None,
+        }
+
+    def close(self):
+        """Flushes whatever is still buffered."""
+        self.flush()
+        if self.spool is not None:
+            self.spool.close()
@@ -0,0 +1,72 @@
+# backend/app/services/es_client.py
+"""
+Application-wide Elasticsearch clients.
+
+One synchronous client (for threads, background services and sync routes) and
+one AsyncElasticsearch (for async routes) are created in the app's lifespan
+hook and shared by everything in the API process, so requests reuse pooled
+keep-alive connections instead of opening a new pool each time. Code running
+before startup or outside the lifespan (scripts, the scheduler) gets the same
+clients, created on first use.
+"""
+import logging
+import threading
+
+from elasticsearch import AsyncElasticsearch, Elasticsearch
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_client: Elasticsearch = None
+_async_client: AsyncElasticsearch = None
+
+
+def _client_options() -> dict:
+    return {
+        "connections_per_node": settings.ES_CONNECTIONS_PER_NODE,
+        "request_timeout": settings.ES_REQUEST_TIMEOUT,
+        "retry_on_timeout": True,
+        "max_retries": 3,
+    }
+
+
+def get_es() -> Elasticsearch:
+    """Returns the shared synchronous client. Thread-safe."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = Elasticsearch(settings.ELASTICSEARCH_URI, **_client_options())
+                logger.info(f"Created shared Elasticsearch client for {settings.ELASTICSEARCH_URI} "
+                            f"({settings.ES_CONNECTIONS_PER_NODE} connections per node).")
+    return _client
+
+
+def get_async_es() -> AsyncElasticsearch:
+    """Returns the shared async client. Must be used from the application's event loop."""
+    global _async_client
+    if _async_client is None:
+        with _lock:
+            if _async_client is None:
+                _async_client = AsyncElasticsearch(settings.ELASTICSEARCH_URI, **_client_options())
+    return _async_client
+
+
+def init_clients():
+    """Creates both clients. Called from the lifespan hook at startup."""
+    get_es()
+    get_async_es()
+
+
+async def close_clients():
+    """Closes both clients and their connection pools. Called from the lifespan hook at shutdown."""
+    global _client, _async_client
+    with _lock:
+        client, async_client = _client, _async_client
+        _client = _async_client = None
+    if async_client is not None:
+        await async_client.close()
+    if client is not None:
+        client.close()
@@ -0,0 +1,184 @@
+# backend/app/services/es_indices.py
+"""
+Layout of the time-partitioned packet and flow indices.
+
+Documents are written to one index per UTC day, named after the day of their
+own @timestamp (e.g. `netguard-packets-2024.05.01`), so late or replayed
+documents still land in the right partition. Mappings come from composable
+index templates installed at startup, retention deletes whole daily indices,
+and readers search only the days that overlap their time range.
+
+The templates are tuned for how the data is used: every index is sorted on
+@timestamp descending, so "latest N" queries stop after N documents per
+segment; stored fields use best_compression; and fields that are only ever
+displayed, sorted or aggregated (never filtered on) skip the inverted index
+and keep doc values only.
+"""
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+PACKET_INDEX = "netguard-packets"
+FLOW_INDEX = "netguard-flows"
+
+PACKET_INDEX_MAPPING = {
+    "properties": {
+        "@timestamp":       { "type": "date" },
+        "source_ip":        { "type": "ip" },
+        "destination_ip":   { "type": "ip" },
+        "length":           { "type": "long" },
+        "ttl":              { "type": "integer", "index": False },
+        "protocol":         { "type": "keyword" },
+        "source_mac":       { "type": "keyword" },
+        "destination_mac":  { "type": "keyword" },
+        "source_port":      { "type": "integer" },
+        "destination_port": { "type": "integer" },
+        "tcp_flags":        { "type": "integer", "index": False }
+    }
+}
+
+FLOW_INDEX_MAPPING = {
+    "properties": {
+        "@timestamp":       { "type": "date" },
+        "last_seen":        { "type": "date" },
+        "duration_ms":      { "type": "long", "index": False },
+        "source_ip":        { "type": "ip" },
+        "destination_ip":   { "type": "ip" },
+        "source_port":      { "type": "integer" },
+        "destination_port": { "type": "integer" },
+        "protocol":         { "type": "keyword" },
+        "packets":          { "type": "long" },
+        "bytes":            { "type": "long" },
+        "tcp_flags":        { "type": "integer", "index": False },
+        "end_reason":       { "type": "keyword" },
+        # ISO codes of public endpoints, added at ingest (services/geoip.py).
+        "source_country":      { "type": "keyword" },
+        "destination_country": { "type": "keyword" }
+    }
+}
+
+INDEX_SETTINGS = {
+    "index.sort.field": "@timestamp",
+    "index.sort.order": "desc",
+    "index.codec": "best_compression",
+    # Packets are looked at seconds after capture at the earliest; fewer refreshes mean fewer tiny segments.
+    "index.refresh_interval": "5s",
+    # One replica when a second node exists, none on the usual single-node install.
+    "index.auto_expand_replicas": "0-1",
+}
+
+# Index prefix -> mapping of its daily indices.
+INDEX_TEMPLATES = {
+    PACKET_INDEX: PACKET_INDEX_MAPPING,
+    FLOW_INDEX: FLOW_INDEX_MAPPING,
+}
+
+DAY_FORMAT = "%Y.%m.%d"
+DAY_MS = 24 * 60 * 60 * 1000
+# Beyond this many days a reader falls back to a wildcard instead of listing every index.
+MAX_LISTED_DAYS = 62
+
+_day_cache = {}
+
+
+def daily_index(prefix: str, timestamp) -> str:
+    """
+    Returns the daily index for a document timestamp, given either as epoch
+    milliseconds or as an ISO 8601 string ("2024-05-01T12:00:00.000Z").
+    """
+    if isinstance(timestamp, str):
+        return f"{prefix}-{timestamp[:10].replace('-', '.')}"
+    day = timestamp // DAY_MS
+    suffix = _day_cache.get(day)
+    if suffix is None:
+        suffix = datetime.fromtimestamp(day * DAY_MS / 1000, tz=timezone.utc).strftime(DAY_FORMAT)
+        if len(_day_cache) > 1000:
+            _day_cache.clear()
+        _day_cache[day] = suffix
+    return f"{prefix}-{suffix}"
+
+
+def indices_for_range(prefix: str, start: datetime, end: datetime = None) -> str:
+    """
+    Returns a comma-separated list of the daily indices overlapping [start, end],
+    plus the pre-partitioning `prefix` index so older data stays searchable.
+    Searches using it should pass ignore_unavailable=True, since some days may
+    have no index.
+    """
+    end = end or datetime.now(timezone.utc)
+    start_day, end_day = start.date(), end.date()
+    if (end_day - start_day).days > MAX_LISTED_DAYS:
+        return f"{prefix}-*,{prefix}"
+    names = []
+    day = start_day
+    while day <= end_day:
+        names.append(f"{prefix}-{day.strftime(DAY_FORMAT)}")
+        day += timedelta(days=1)
+    names.append(prefix)
+    return ",".join(names)
+
+
+def resolve_search_index(index: str, start: datetime, end: datetime = None) -> str:
+    """Expands one of our partitioned index names to the days in range; other names are left alone."""
+    if index in INDEX_TEMPLATES:
+        return indices_for_range(index, start, end)
+    return index
+
+
+def install_index_templates(es_client):
+    """Creates or updates the index templates that apply our mappings to every daily index."""
+    for prefix, mapping in INDEX_TEMPLATES.items():
+        es_client.indices.put_index_template(
+            name=prefix,
+            index_patterns=[f"{prefix}-*"],
+            priority=200,
+            template={"settings": INDEX_SETTINGS, "mappings": {"dynamic": False, **mapping}},
+        )
+        logger.info(f"Installed Elasticsearch index template '{prefix}' for '{prefix}-*'.")
+
+
+def apply_retention(es_client, prefix: str, days: int) -> list:
+    """Deletes the daily indices of `prefix` that are older than `days` days. Returns their names."""
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).date()
+    deleted = []
+    for row in es_client.cat.indices(index=f"{prefix}-*", h="index", format="json"):
+        name = row["index"]
+        try:
+            day = datetime.strptime(name[len(prefix) + 1:], DAY_FORMAT).date()
+        except ValueError:
+            continue
+        if day < cutoff:
+            es_client.indices.delete(index=name)
+            deleted.append(name)
+    if deleted:
+        logger.info(f"Retention ({days} days) deleted {len(deleted)} indices: {', '.join(sorted(deleted))}")
+    return deleted
+
+
+class IndexMaintenance:
+    """Background thread applying the retention policy of each index prefix every `interval` seconds."""
+
+    def __init__(self, es_client, retention_days: dict, interval: float = 3600):
+        self.es_client = es_client
+        self.retention_days = retention_days
+        self.interval = interval
+        self.deleted = 0
+        self.last_run = None
+
+    def start(self, stop_event):
+        threading.Thread(target=self._run, args=(stop_event,), daemon=True, name="IndexMaintenance").start()
+
+    def _run(self, stop_event):
+        while not stop_event.is_set():
+            for prefix, days in self.retention_days.items():
+                try:
+                    self.deleted += len(apply_retention(self.es_client, prefix, days))
+                except Exception as e:
+                    logger.warning(f"Index retention for '{prefix}' failed, will retry later: {e}")
+            self.last_run = datetime.now(timezone.utc).isoformat()
+            stop_event.wait(self.interval)
+
+    def stats(self) -> dict:
+        return {"retention_days": self.retention_days, "deleted_indices": self.deleted, "last_run": self.last_run}
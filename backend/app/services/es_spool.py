@@ -0,0 +1,222 @@
+# backend/app/services/es_spool.py
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = ".ndjson"
+OFFSET_FILE = "head.offset"
+
+
+class _Segment:
+    def __init__(self, sequence: int, path: str, size: int = 0, docs: int = 0, offset: int = 0):
+        self.sequence = sequence
+        self.path = path
+        self.size = size
+        self.docs = docs
+        self.offset = offset
+
+
+class DiskSpool:
+    """
+    Durable, append-only spool of bulk actions, used when Elasticsearch is down
+    or too slow to keep up.
+
+    Actions are written as NDJSON lines into numbered segment files of about
+    `segment_bytes` each. Readers consume the oldest segment first, so replay
+    happens in write order; the read position is persisted in a small offset
+    file so a restart doesn't replay what was already indexed. When the spool
+    grows beyond `max_bytes`, the oldest segments are deleted and their
+    documents counted as dropped.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024, max_bytes: int = 2 * 1024 * 1024 * 1024):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._segments = []
+        self._writer = None
+
+        self.appended = 0
+        self.replayed = 0
+        self.dropped = 0
+        self.replay_rate = 0.0
+        self._rate_started = time.monotonic()
+        self._rate_docs = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    # --- Startup ---
+
+    def _load(self):
+        names = sorted(n for n in os.listdir(self.directory) if n.endswith(SEGMENT_SUFFIX))
+        head_sequence, head_offset = self._read_offset_file()
+        for name in names:
+            path = os.path.join(self.directory, name)
+            sequence = int(name[:-len(SEGMENT_SUFFIX)])
+            size = self._truncate_torn_tail(path)
+            offset = min(head_offset, size) if sequence == head_sequence else 0
+            with open(path, "rb") as f:
+                f.seek(offset)
+                docs = sum(1 for _ in f)
+            self._segments.append(_Segment(sequence, path, size, docs, offset))
+        if self._segments:
+            logger.warning(f"Found {self.pending_docs} spooled documents in '{self.directory}'. They will be replayed.")
+
+    @staticmethod
+    def _truncate_torn_tail(path: str) -> int:
+        """Cuts a segment back to its last complete line (a crash can leave half a line). Returns its size."""
+        with open(path, "r+b") as f:
+            data = f.read()
+            size = data.rfind(b"\n") + 1
+            if size < len(data):
+                f.truncate(size)
+                logger.warning(f"Discarded an incomplete last line ({len(data) - size} bytes) in spool segment '{path}'.")
+        return size
+
+    def _read_offset_file(self):
+        try:
+            with open(os.path.join(self.directory, OFFSET_FILE)) as f:
+                sequence, offset = f.read().split()
+                return int(sequence), int(offset)
+        except (FileNotFoundError, ValueError):
+            return None, 0
+
+    def _write_offset_file(self, segment: _Segment):
+        path = os.path.join(self.directory, OFFSET_FILE)
+        with open(path + ".tmp", "w") as f:
+            f.write(f"{segment.sequence} {segment.offset}")
+        os.replace(path + ".tmp", path)
+
+    # --- Writing ---
+
+    def append(self, actions: list):
+        """Appends bulk actions to the newest segment."""
+        if not actions:
+            return
+        data = "".join(json.dumps(action, separators=(",", ":"), default=str) + "\n" for action in actions).encode()
+        with self._lock:
+            if not self._segments or self._writer is None or self._segments[-1].size >= self.segment_bytes:
+                self._roll()
+            tail = self._segments[-1]
+            self._writer.write(data)
+            self._writer.flush()
+            tail.size += len(data)
+            tail.docs += len(actions)
+            self.appended += len(actions)
+            self._enforce_cap()
+
+    def _roll(self):
+        if self._writer is not None:
+            os.fsync(self._writer.fileno())
+            self._writer.close()
+        sequence = self._segments[-1].sequence + 1 if self._segments else int(time.time() * 1000)
+        path = os.path.join(self.directory, f"{sequence:016d}{SEGMENT_SUFFIX}")
+        self._writer = open(path, "ab")
+        self._segments.append(_Segment(sequence, path))
+
+    def _enforce_cap(self):
+        while self.total_bytes > self.max_bytes and len(self._segments) > 1:
+            oldest = self._segments.pop(0)
+            self.dropped += oldest.docs
+            os.remove(oldest.path)
+            logger.error(f"Spool is over its {self.max_bytes} byte cap. Dropped {oldest.docs} documents from the oldest segment.")
+
+    # --- Replaying ---
+
+    def read(self, max_docs: int):
+        """
+        Returns up to `max_docs` of the oldest unconsumed actions and a position
+        to pass to commit() once they have been handled.
+        """
+        with self._lock:
+            if not self._segments:
+                return [], None
+            head = self._segments[0]
+            sequence, path, offset, limit = head.sequence, head.path, head.offset, head.size
+            being_written = len(self._segments) == 1 and self._writer is not None
+
+        actions = []
+        with open(path, "rb") as f:
+            f.seek(offset)
+            while len(actions) < max_docs and offset < limit:
+                line = f.readline(limit - offset)
+                if not line.endswith(b"\n"):
+                    if being_written:
+                        break
+                    # Nothing will ever complete this line; skip it so the segment can be drained.
+                    logger.error(f"Skipping an incomplete line at the end of spool segment '{path}'.")
+                    offset = limit
+                    break
+                offset += len(line)
+                try:
+                    actions.append(json.loads(line))
+                except ValueError:
+                    logger.error(f"Skipping a corrupt line in spool segment '{path}'.")
+        return actions, (sequence, offset, len(actions))
+
+    def commit(self, position):
+        """Marks the actions returned by read() as handled."""
+        if position is None:
+            return
+        sequence, offset, count = position
+        with self._lock:
+            # The head may have been dropped by the size cap in the meantime.
+            if not self._segments or self._segments[0].sequence != sequence:
+                return
+            head = self._segments[0]
+            head.offset = offset
+            head.docs -= count
+            self.replayed += count
+            self._rate_docs += count
+
+            if head.offset >= head.size:
+                if len(self._segments) == 1 and self._writer is not None:
+                    self._writer.close()
+                    self._writer = None
+                self._segments.pop(0)
+                os.remove(head.path)
+            else:
+                self._write_offset_file(head)
+
+            elapsed = time.monotonic() - self._rate_started
+            if elapsed >= 5:
+                self.replay_rate = self._rate_docs / elapsed
+                self._rate_started = time.monotonic()
+                self._rate_docs = 0
+
+    # --- Introspection ---
+
+    @property
+    def pending_docs(self) -> int:
+        return sum(segment.docs for segment in self._segments)
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(segment.size - segment.offset for segment in self._segments)
+
+    def stats(self) -> dict:
+        with self._lock:
+            if not self._segments:
+                self.replay_rate = 0.0
+            return {
+                "segments": len(self._segments),
+                "pending_docs": self.pending_docs,
+                "bytes": self.total_bytes,
+                "appended": self.appended,
+                "replayed": self.replayed,
+                "dropped": self.dropped,
+                "replay_docs_per_second": round(self.replay_rate, 1),
+            }
+
+    def close(self):
+        with self._lock:
+            if self._writer is not None:
+                os.fsync(self._writer.fileno())
+                self._writer.close()
+                self._writer = None
@@ -0,0 +1,122 @@
+# backend/app/services/flow_table.py
+"""
+In-memory 5-tuple flow aggregation for the packet pipeline.
+
+Packets are folded into unidirectional flows keyed on
+(source_ip, destination_ip, source_port, destination_port, protocol).
+A flow is exported as one `netguard-flows-*` document when it ends: after
+`idle_timeout` seconds without packets, after `active_timeout` seconds of
+continuous activity (long flows are reported in slices), or when a TCP FIN
+or RST is seen.
+"""
+import time
+from collections import OrderedDict
+
+from app.services.packet_transport import (
+    F_TIMESTAMP, F_SOURCE_IP, F_DESTINATION_IP, F_LENGTH, F_PROTOCOL,
+    F_SOURCE_PORT, F_DESTINATION_PORT, F_TCP_FLAGS, format_timestamp,
+)
+
+TCP_FIN = 0x01
+TCP_RST = 0x04
+
+# Indexes into the per-flow state list.
+_FIRST_SEEN, _LAST_SEEN, _PACKETS, _BYTES, _FLAGS = range(5)
+
+
+class FlowTable:
+    """
+    Flow state lives in an OrderedDict kept in last-activity order, so idle
+    flows are always at the front and expiring them never scans active ones.
+    """
+
+    def __init__(self, idle_timeout: float = 30, active_timeout: float = 300, max_flows: int = 200000):
+        self.idle_timeout_ms = int(idle_timeout * 1000)
+        self.active_timeout_ms = int(active_timeout * 1000)
+        self.max_flows = max_flows
+        self._flows = OrderedDict()
+
+        self.packets_seen = 0
+        self.flows_exported = 0
+        self.flows_evicted = 0
+
+    def update(self, record: tuple) -> list:
+        """Folds one packet record into its flow. Returns any flows that ended as a result."""
+        self.packets_seen += 1
+        key = (
+            record[F_SOURCE_IP], record[F_DESTINATION_IP],
+            record[F_SOURCE_PORT], record[F_DESTINATION_PORT], record[F_PROTOCOL],
+        )
+        timestamp = record[F_TIMESTAMP]
+        flags = record[F_TCP_FLAGS] or 0
+        finished = []
+
+        flow = self._flows.get(key)
+        if flow is not None and timestamp - flow[_FIRST_SEEN] >= self.active_timeout_ms:
+            finished.append(self._export(key, self._flows.pop(key), "active"))
+            flow = None
+
+        if flow is None:
+            if len(self._flows) >= self.max_flows:
+                # Table is full: report the least recently active flow early.
+                old_key, old_flow = self._flows.popitem(last=False)
+                finished.append(self._export(old_key, old_flow, "evicted"))
+                self.flows_evicted += 1
+            self._flows[key] = [timestamp, timestamp, 1, record[F_LENGTH], flags]
+        else:
+            if timestamp > flow[_LAST_SEEN]:
+                flow[_LAST_SEEN] = timestamp
+            flow[_PACKETS] += 1
+            flow[_BYTES] += record[F_LENGTH]
+            flow[_FLAGS] |= flags
+            self._flows.move_to_end(key)
+
+        if flags & (TCP_FIN | TCP_RST):
+            reason = "rst" if flags & TCP_RST else "fin"
+            finished.append(self._export(key, self._flows.pop(key), reason))
+
+        return finished
+
+    def expire(self, now_ms: int = None) -> list:
+        """Exports every flow that has been idle for longer than the idle timeout."""
+        now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+        finished = []
+        while self._flows:
+            key, flow = next(iter(self._flows.items()))
+            if now_ms - flow[_LAST_SEEN] < self.idle_timeout_ms:
+                break
+            del self._flows[key]
+            finished.append(self._export(key, flow, "idle"))
+        return finished
+
+    def flush(self) -> list:
+        """Exports every flow still in the table, e.g. on shutdown."""
+        finished = [self._export(key, flow, "shutdown") for key, flow in self._flows.items()]
+        self._flows.clear()
+        return finished
+
+    def _export(self, key: tuple, flow: list, reason: str) -> dict:
+        self.flows_exported += 1
+        source_ip, destination_ip, source_port, destination_port, protocol = key
+        return {
+            "@timestamp": format_timestamp(flow[_FIRST_SEEN]),
+            "last_seen": format_timestamp(flow[_LAST_SEEN]),
+            "duration_ms": flow[_LAST_SEEN] - flow[_FIRST_SEEN],
+            "source_ip": source_ip,
+            "destination_ip": destination_ip,
+            "source_port": source_port,
+            "destination_port": destination_port,
+            "protocol": protocol,
+            "packets": flow[_PACKETS],
+            "bytes": flow[_BYTES],
+            "tcp_flags": flow[_FLAGS] if protocol == "TCP" else None,
+            "end_reason": reason,
+        }
+
+    def stats(self) -> dict:
+        return {
+            "active_flows": len(self._flows),
+            "packets_seen": self.packets_seen,
+            "flows_exported": self.flows_exported,
+            "flows_evicted": self.flows_evicted,
+        }
@@ -0,0 +1,94 @@
+# backend/app/services/geoip.py
+"""
+GeoIP lookups for ingest-time enrichment.
+
+Alerts, flows and hosts are enriched once, when they are stored, so that
+queries group by a stored country column instead of resolving IPs per request.
+Private, loopback, link-local and other non-routable addresses never reach the
+database reader, and results are kept in a bounded LRU cache: traffic comes
+from a small working set of addresses, so almost every lookup is a cache hit.
+
+The reader is optional: without a GeoLite2 database every lookup returns None.
+A City database also provides coordinates; a Country database does not.
+"""
+import ipaddress
+import logging
+from collections import namedtuple
+from functools import lru_cache
+from typing import Iterable, Optional
+
+from geoip2.database import Reader
+from geoip2.errors import AddressNotFoundError
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+GeoInfo = namedtuple("GeoInfo", ["country_code", "country_name", "latitude", "longitude"])
+
+# Stored as the country of addresses that are not on the public internet.
+LOCAL = "Local"
+
+try:
+    _reader = Reader(settings.GEOIP_DB_PATH)
+    _is_city = "City" in _reader.metadata().database_type
+    logger.info(f"GeoIP database loaded from {settings.GEOIP_DB_PATH} ({_reader.metadata().database_type}).")
+except Exception as e:
+    _reader = None
+    _is_city = False
+    logger.warning(f"No GeoIP database at {settings.GEOIP_DB_PATH}; country enrichment is disabled. ({e})")
+
+
+def is_local(ip: str) -> bool:
+    """True for addresses that cannot be located: private, loopback, link-local, multicast, reserved or invalid."""
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return True
+    return not address.is_global
+
+
+@lru_cache(maxsize=settings.GEOIP_CACHE_SIZE)
+def _lookup(ip: str) -> Optional[GeoInfo]:
+    try:
+        if _is_city:
+            response = _reader.city(ip)
+            return GeoInfo(response.country.iso_code, response.country.name,
+                           response.location.latitude, response.location.longitude)
+        response = _reader.country(ip)
+        return GeoInfo(response.country.iso_code, response.country.name, None, None)
+    except AddressNotFoundError:
+        return None
+    except Exception as e:
+        logger.debug(f"GeoIP lookup failed for {ip}: {e}")
+        return None
+
+
+def lookup(ip: Optional[str]) -> Optional[GeoInfo]:
+    """Location of a public IP, or None for local addresses, unknown ones, or without a database."""
+    if not ip or _reader is None or is_local(ip):
+        return None
+    return _lookup(ip)
+
+
+def country_code(ip: Optional[str]) -> Optional[str]:
+    """ISO country code of `ip`, LOCAL for non-public addresses, None when it cannot be located."""
+    if not ip:
+        return None
+    if is_local(ip):
+        return LOCAL
+    info = lookup(ip)
+    return info.country_code if info else None
+
+
+def country_codes(ips: Iterable[str]) -> dict:
+    """country_code() of each distinct IP of a batch."""
+    return {ip: country_code(ip) for ip in set(ips)}
+
+
+def cache_info() -> dict:
+    info = _lookup.cache_info()
+    return {
+        "database": settings.GEOIP_DB_PATH if _reader is not None else None,
+        "hits": info.hits, "misses": info.misses, "size": info.currsize, "max_size": info.maxsize,
+    }
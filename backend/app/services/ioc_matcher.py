@@ -0,0 +1,367 @@
+# backend/app/services/ioc_matcher.py
+"""
+Indicator-of-compromise matching against local threat-intel feeds.
+
+Feeds are plain files in IOC_FEED_DIR, one indicator per line (IPv4/IPv6
+addresses, CIDR ranges or domain names; '#' starts a comment, and for CSV
+files only the first column is read). The file name without extension is the
+feed name reported on matches.
+
+Indicators are compiled into an immutable `IocMatcher`:
+
+- IPv4 ranges are flattened into sorted, disjoint segments, each labelled
+  with the most specific indicator covering it, and stored in four typed
+  arrays (start, end, feed, prefix length), 11 bytes per segment, matched
+  with a binary search. A match therefore reports the feed and the exact
+  indicator (address or CIDR range) it came from;
+- IPv6 ranges the same, in sorted lists of 128-bit integers;
+- domains go into a hash map, and a name matches when it or any parent
+  domain is listed.
+
+`IocFeeds` rebuilds the matcher in a background thread whenever a feed file
+changes and swaps the new one in with a single reference assignment, so
+readers never wait for a reload. `IocMatchStage` is the packet pipeline stage
+that matches both endpoints of every packet and saves hits as SecurityAlert
+rows, at most one per (source, destination, indicator) per IOC_ALERT_DEDUP_SECONDS.
+"""
+import bisect
+import ipaddress
+import json
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from array import array
+from datetime import datetime, timezone
+from typing import Optional
+
+from app.config import settings
+from app.services.packet_transport import (
+    F_TIMESTAMP, F_SOURCE_IP, F_DESTINATION_IP, F_PROTOCOL, F_SOURCE_PORT, F_DESTINATION_PORT,
+)
+
+logger = logging.getLogger(__name__)
+
+FEED_EXTENSIONS = (".txt", ".csv", ".list")
+_DOMAIN_RE = re.compile(r"^(?=.{1,253}$)([a-z0-9_](?:[a-z0-9_-]{0,61}[a-z0-9])?\.)+[a-z][a-z0-9-]{0,62}$")
+
+
+def _segments(intervals: list) -> list:
+    """
+    Flattens (start, end, feed, prefix) CIDR intervals into sorted, disjoint
+    [start, end, feed, prefix] segments, each labelled with the most specific
+    interval covering it. CIDR ranges are either nested or disjoint, so a stack
+    of the enclosing ranges is enough. A range listed by several feeds keeps the
+    first feed.
+    """
+    # Outer ranges sort before the ranges they contain.
+    intervals.sort(key=lambda interval: (interval[0], -interval[1], interval[2]))
+    segments = []
+    stack = []
+    cursor = 0
+
+    def emit(end, interval):
+        if cursor <= end:
+            segments.append([cursor, end, interval[2], interval[3]])
+
+    for interval in intervals:
+        start, end = interval[0], interval[1]
+        while stack and stack[-1][1] < start:
+            top = stack.pop()
+            emit(top[1], top)
+            cursor = top[1] + 1
+        if stack and stack[-1][0] == start and stack[-1][1] == end:
+            continue
+        if stack:
+            emit(start - 1, stack[-1])
+        stack.append(interval)
+        cursor = start
+    while stack:
+        top = stack.pop()
+        emit(top[1], top)
+        cursor = top[1] + 1
+    return segments
+
+
+def _describe(start: int, prefix: int, version: int) -> str:
+    """The indicator text of a segment: its covering address or CIDR range."""
+    network_type = ipaddress.IPv4Network if version == 4 else ipaddress.IPv6Network
+    network = network_type((start, prefix), strict=False)
+    return str(network.network_address) if network.num_addresses == 1 else str(network)
+
+
+class IocMatcher:
+    """An immutable, compiled set of indicators. Safe to share between threads."""
+
+    def __init__(self, feeds: list, v4: list, v6: list, domains: dict, skipped: int = 0):
+        self.feeds = feeds
+        self.v4_starts = array("I", (start for start, _, _, _ in v4))
+        self.v4_ends = array("I", (end for _, end, _, _ in v4))
+        self.v4_feeds = array("H", (feed for _, _, feed, _ in v4))
+        self.v4_prefixes = array("B", (prefix for _, _, _, prefix in v4))
+        self.v6_starts = [start for start, _, _, _ in v6]
+        self.v6_ends = [end for _, end, _, _ in v6]
+        self.v6_feeds = array("H", (feed for _, _, feed, _ in v6))
+        self.v6_prefixes = array("B", (prefix for _, _, _, prefix in v6))
+        self.domains = domains
+        self.skipped = skipped
+        self.loaded_at = datetime.now(timezone.utc).isoformat()
+
+    @classmethod
+    def empty(cls) -> "IocMatcher":
+        return cls([], [], [], {})
+
+    @classmethod
+    def from_indicators(cls, feeds: dict) -> "IocMatcher":
+        """Compiles {feed name: iterable of indicator strings}."""
+        names, v4, v6, domains, skipped = [], [], [], {}, 0
+        for name, indicators in feeds.items():
+            feed = len(names)
+            names.append(name)
+            for indicator in indicators:
+                value = indicator.strip().lower()
+                if not value:
+                    continue
+                try:
+                    network = ipaddress.ip_network(value, strict=False)
+                except ValueError:
+                    domain = value.lstrip("*.").rstrip(".")
+                    if _DOMAIN_RE.match(domain):
+                        domains.setdefault(domain, feed)
+                    else:
+                        skipped += 1
+                    continue
+                interval = (int(network.network_address), int(network.broadcast_address), feed, network.prefixlen)
+                (v4 if network.version == 4 else v6).append(interval)
+        return cls(names, _segments(v4), _segments(v6), domains, skipped)
+
+    @classmethod
+    def from_directory(cls, path: str) -> "IocMatcher":
+        feeds = {}
+        for file_name in sorted(os.listdir(path)):
+            if not file_name.endswith(FEED_EXTENSIONS):
+                continue
+            with open(os.path.join(path, file_name), encoding="utf-8", errors="replace") as f:
+                feeds[os.path.splitext(file_name)[0]] = [
+                    line.split("#", 1)[0].split(",", 1)[0] for line in f
+                ]
+        return cls.from_indicators(feeds)
+
+    def match_ipv4_int(self, address: int) -> Optional[int]:
+        """Index of the matching IPv4 segment, or None."""
+        i = bisect.bisect_right(self.v4_starts, address) - 1
+        if i >= 0 and address <= self.v4_ends[i]:
+            return i
+        return None
+
+    def match_ip(self, ip: str) -> Optional[tuple]:
+        """(feed, indicator) of the most specific indicator containing `ip`, or None."""
+        try:
+            # inet_pton, unlike inet_aton, only accepts dotted quads ("10.1" is not 10.0.0.1).
+            address = int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big") if ":" not in ip else None
+        except OSError:
+            return None
+        if address is not None:
+            i = self.match_ipv4_int(address)
+            if i is None:
+                return None
+            return self.feeds[self.v4_feeds[i]], _describe(self.v4_starts[i], self.v4_prefixes[i], 4)
+        try:
+            address = int(ipaddress.IPv6Address(ip))
+        except ValueError:
+            return None
+        i = bisect.bisect_right(self.v6_starts, address) - 1
+        if i >= 0 and address <= self.v6_ends[i]:
+            return self.feeds[self.v6_feeds[i]], _describe(self.v6_starts[i], self.v6_prefixes[i], 6)
+        return None
+
+    def match_domain(self, name: str) -> Optional[tuple]:
+        """(feed, indicator) if `name` or one of its parent domains is listed, or None."""
+        labels = name.lower().rstrip(".").split(".")
+        domains = self.domains
+        for i in range(len(labels) - 1):
+            domain = ".".join(labels[i:])
+            feed = domains.get(domain)
+            if feed is not None:
+                return self.feeds[feed], domain
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "feeds": self.feeds,
+            "ipv4_segments": len(self.v4_starts),
+            "ipv6_segments": len(self.v6_starts),
+            "domains": len(self.domains),
+            "skipped_lines": self.skipped,
+            "loaded_at": self.loaded_at,
+        }
+
+
+class IocFeeds:
+    """Holds the current matcher and rebuilds it when the feed directory changes."""
+
+    def __init__(self, path: str, reload_interval: float = 60):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.matcher = IocMatcher.empty()
+        self._signature = None
+        self._reload_lock = threading.Lock()
+        self._thread = None
+
+        self.reloads = 0
+        self.reload_errors = 0
+        self.last_reload_seconds = None
+
+    def _feed_signature(self) -> tuple:
+        try:
+            entries = sorted(os.scandir(self.path), key=lambda entry: entry.name)
+        except FileNotFoundError:
+            return ()
+        return tuple(
+            (entry.name, entry.stat().st_mtime_ns, entry.stat().st_size)
+            for entry in entries if entry.name.endswith(FEED_EXTENSIONS)
+        )
+
+    def reload(self, force: bool = False) -> bool:
+        """Rebuilds the matcher if a feed file changed (or always, with `force`). Returns True if it did."""
+        with self._reload_lock:
+            signature = self._feed_signature()
+            if signature == self._signature and not force:
+                return False
+            started = time.monotonic()
+            try:
+                matcher = IocMatcher.from_directory(self.path) if signature else IocMatcher.empty()
+            except Exception as e:
+                self.reload_errors += 1
+                logger.error(f"Failed to load IOC feeds from {self.path}; keeping the previous ones. Error: {e}", exc_info=True)
+                return False
+            # Readers pick up the new matcher on their next batch; nothing waits for the build.
+            self.matcher = matcher
+            self._signature = signature
+            self.reloads += 1
+            self.last_reload_seconds = round(time.monotonic() - started, 3)
+            logger.info(f"Loaded IOC feeds in {self.last_reload_seconds}s: {matcher.stats()}")
+            return True
+
+    def start(self, stop_event):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, args=(stop_event,), daemon=True, name="IocFeeds")
+        self._thread.start()
+
+    def _run(self, stop_event):
+        while not stop_event.is_set():
+            self.reload()
+            stop_event.wait(self.reload_interval)
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+            "last_reload_seconds": self.last_reload_seconds,
+            **self.matcher.stats(),
+        }
+
+
+class IocMatchStage:
+    """
+    Pipeline stage matching the source and destination of every packet against
+    the IOC feeds. Results are memoized per address for the lifetime of a
+    matcher, so repeated addresses cost a dictionary lookup. Hits are saved as
+    SecurityAlert rows on tick, deduplicated per (source, destination, indicator).
+    """
+
+    def __init__(self, feeds: IocFeeds, dedup_seconds: float = 300, severity: int = 2, max_memo: int = 200000):
+        self.feeds = feeds
+        self.dedup_seconds = dedup_seconds
+        self.severity = severity
+        self.max_memo = max_memo
+        self._matcher = None
+        self._memo = {}
+        self._last_alerted = {}
+        self._pending = []
+
+        self.packets = 0
+        self.hits = 0
+        self.alerts = 0
+
+    def _lookup(self, ip):
+        if ip is None:
+            return None
+        try:
+            return self._memo[ip]
+        except KeyError:
+            pass
+        if len(self._memo) >= self.max_memo:
+            self._memo.clear()
+        result = self._memo[ip] = self._matcher.match_ip(ip)
+        return result
+
+    def handle(self, records: list):
+        matcher = self.feeds.matcher
+        if matcher is not self._matcher:
+            self._matcher = matcher
+            self._memo.clear()
+        if not matcher.feeds:
+            return
+        lookup = self._lookup
+        now = time.monotonic()
+        for record in records:
+            for ip_field in (F_SOURCE_IP, F_DESTINATION_IP):
+                hit = lookup(record[ip_field])
+                if hit is None:
+                    continue
+                self.hits += 1
+                key = (record[F_SOURCE_IP], record[F_DESTINATION_IP], hit)
+                if now - self._last_alerted.get(key, -self.dedup_seconds) < self.dedup_seconds:
+                    continue
+                self._last_alerted[key] = now
+                self._pending.append(self._alert_row(record, record[ip_field], hit))
+        self.packets += len(records)
+
+    def _alert_row(self, record: tuple, ip: str, hit: tuple) -> dict:
+        feed, indicator = hit
+        return {
+            "timestamp": datetime.fromtimestamp(record[F_TIMESTAMP] / 1000, tz=timezone.utc),
+            "source_ip": record[F_SOURCE_IP],
+            "source_port": record[F_SOURCE_PORT],
+            "destination_ip": record[F_DESTINATION_IP],
+            "destination_port": record[F_DESTINATION_PORT],
+            "protocol": record[F_PROTOCOL],
+            "severity": self.severity,
+            "signature": f"IOC match: {indicator} ({feed})"[:255],
+            "event_type": "ioc_match",
+            "raw_log": json.dumps({"feed": feed, "indicator": indicator, "matched_ip": ip}),
+        }
+
+    def tick(self):
+        if self._pending:
+            # Imported here: log_parser pulls in the database and WebSocket layers.
+            from app.services.log_parser import save_alert_batch
+            rows, self._pending = self._pending, []
+            save_alert_batch(rows)
+            self.alerts += len(rows)
+        now = time.monotonic()
+        if len(self._last_alerted) > 10000:
+            self._last_alerted = {
+                key: last for key, last in self._last_alerted.items() if now - last < self.dedup_seconds
+            }
+
+    def close(self):
+        self.tick()
+
+    def stats(self) -> dict:
+        return {
+            "packets": self.packets,
+            "hits": self.hits,
+            "alerts": self.alerts,
+            "memoized_addresses": len(self._memo),
+            "feeds": self.feeds.stats(),
+        }
+
+
+# The application-wide feeds, reloaded in the background by the packet pipeline.
+ioc_feeds = IocFeeds(settings.IOC_FEED_DIR, reload_interval=settings.IOC_RELOAD_SECONDS)
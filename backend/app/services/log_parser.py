@@ -8,10 +8,16 @@ import psutil  # Used to get the server's own IP addresses
 import socket  # Used for the address family constant
 
 from datetime import datetime
-from sqlalchemy.orm import Session
+from typing import List, Optional
+from sqlalchemy import insert
+from sqlalchemy.exc import DataError, IntegrityError
+from app.config import settings
 from app.database import SessionLocal
 from app import models
 from app.routers.connection_manager import manager
+from app.state import app_state
+from app.services.threat_counters import threat_counters
+from app.services import geoip
 
 logger = logging.getLogger(__name__)
 SURICATA_LOG_FILE = "/var/log/suricata/eve.json"
@@ -44,14 +50,14 @@ SERVER_IPS = get_server_ips()
 # --------------------------------------------------------------------------------
 
 
-def process_log_entry(line: str):
-    """Parse a single JSON log line and save it to the DB, ignoring self-generated alerts."""
+def parse_log_entry(line: str) -> Optional[dict]:
+    """Parse a single JSON log line into a security_alerts row, or None if it is not an alert."""
     try:
         log = json.loads(line)
 
         # We are only interested in 'alert' events.
         if log.get('event_type') != 'alert':
-            return
+            return None
 
         # --- NEW: FILTERING LOGIC ---
         # Get the source IP from the alert
@@ -62,49 +68,96 @@ def process_log_entry(line: str):
             # We use a DEBUG log level here so we can see what's being ignored if we need to,
             # without cluttering the main log.
             #logger.debug(f"Ignoring self-generated alert from {source_ip}: {log.get('alert', {}).get('signature')}")
-            #return # Exit the function immediately
+            #return None # Exit the function immediately
         # --- END OF FILTERING LOGIC ---
 
 
         alert_data = log.get('alert', {})
         timestamp_obj = datetime.fromisoformat(log.get('timestamp').replace("Z", "+00:00"))
 
-        new_alert = models.SecurityAlert(
-            timestamp=timestamp_obj,
-            source_ip=source_ip, # We already have it from above
-            source_port=log.get('src_port'),
-            destination_ip=log.get('dest_ip'),
-            destination_port=log.get('dest_port'),
-            protocol=log.get('proto'),
-            severity=alert_data.get('severity', 3),
-            signature=alert_data.get('signature'),
-            event_type=log.get('event_type'),
-            raw_log=line
-        )
+        return {
+            "timestamp": timestamp_obj,
+            "source_ip": source_ip, # We already have it from above
+            "source_port": log.get('src_port'),
+            "destination_ip": log.get('dest_ip'),
+            "destination_port": log.get('dest_port'),
+            "protocol": log.get('proto'),
+            "severity": alert_data.get('severity', 3),
+            "signature": alert_data.get('signature'),
+            "event_type": log.get('event_type'),
+            "raw_log": line,
+        }
+    except Exception as e:
+        logger.error(f"Failed to parse alert: '{line[:100]}...'. Error: {e}")
+        return None
 
-        with SessionLocal() as db:
-            db.add(new_alert)
-            db.commit()
-            logger.info(f"✅ Real-Time Alert: '{new_alert.signature}' saved to database.")
-
-            alert_payload = {
-                "type": "new_alert",
-                "data": {
-                    "timestamp": new_alert.timestamp.isoformat(),
-                    "signature": new_alert.signature,
-                    "severity": new_alert.severity,
-                    "source_ip": new_alert.source_ip,
-                    "destination_ip": new_alert.destination_ip,
-                    "destination_port": new_alert.destination_port
-                }
-            }
-            # This broadcast now only happens for external alerts
-            asyncio.run(manager.broadcast(json.dumps(alert_payload)))
 
-    except Exception as e:
-        logger.error(f"Failed to process/save alert: '{line[:100]}...'. Error: {e}", exc_info=True)
-        if 'db' in locals() and db.in_transaction():
+def _commit_alerts(db, rows: List[dict]):
+    db.execute(insert(models.SecurityAlert), rows)
+    # Committed and counted together, so a concurrent counter rebuild sees each batch exactly once.
+    with threat_counters.commit_lock:
+        db.commit()
+        threat_counters.record(rows)
+
+
+def _save_one_by_one(db, rows: List[dict]) -> List[dict]:
+    """Saves `rows` one at a time, skipping the ones the database rejects. Returns the saved rows."""
+    saved = []
+    for row in rows:
+        try:
+            _commit_alerts(db, [row])
+            saved.append(row)
+        except (IntegrityError, DataError) as e:
             db.rollback()
+            logger.error(f"Skipping an alert the database rejected ('{str(row.get('signature'))[:100]}'): {e.orig}")
+    return saved
+
+
+def save_alert_batch(rows: List[dict]):
+    """
+    Saves a batch of parsed alerts with one multi-row INSERT and one commit, then
+    pushes them to the UI as a single "alert_batch" frame on the main event loop.
+    If the database rejects the batch, its rows are saved one by one so that
+    only the offending ones are lost.
+    """
+    if not rows:
+        return
+    countries = geoip.country_codes(row["source_ip"] for row in rows)
+    for row in rows:
+        row["source_country"] = countries[row["source_ip"]]
+    try:
+        with SessionLocal() as db:
+            try:
+                _commit_alerts(db, rows)
+            except (IntegrityError, DataError) as e:
+                db.rollback()
+                logger.warning(f"A batch of {len(rows)} alerts was rejected ({e.orig}). Saving them one by one.")
+                rows = _save_one_by_one(db, rows)
+    except Exception as e:
+        logger.error(f"Failed to save a batch of {len(rows)} alerts: {e}", exc_info=True)
+        return
+    if not rows:
+        return
+    logger.info(f"✅ Real-Time Alerts: {len(rows)} saved to database (latest: '{rows[-1]['signature']}').")
+
+    main_loop = app_state.main_event_loop
+    if main_loop is None or not main_loop.is_running() or not manager.active_connections:
+        return
+    frame = json.dumps({
+        "type": "alert_batch",
+        "data": [
+            {
+                "timestamp": row["timestamp"].isoformat(),
+                "signature": row["signature"],
+                "severity": row["severity"],
+                "source_ip": row["source_ip"],
+                "destination_ip": row["destination_ip"],
+                "destination_port": row["destination_port"],
+            }
+            for row in rows
+        ],
+    })
+    asyncio.run_coroutine_threadsafe(manager.broadcast(frame), main_loop)
 
 
 def start_log_monitoring():
@@ -132,10 +185,20 @@ def start_log_monitoring():
                     last_pos = 0 # Log file was rotated or truncated
                 
                 f.seek(last_pos)
-                for line in f:
-                    if line.strip():
-                        process_log_entry(line.strip())
-                last_pos = f.tell()
+                batch = []
+                while True:
+                    line = f.readline()
+                    # Stop at a line Suricata is still writing; it is read whole next time.
+                    if not line.endswith("\n"):
+                        break
+                    last_pos = f.tell()
+                    row = parse_log_entry(line.strip()) if line.strip() else None
+                    if row is not None:
+                        batch.append(row)
+                    if len(batch) >= settings.ALERT_BATCH_SIZE:
+                        save_alert_batch(batch)
+                        batch = []
+                save_alert_batch(batch)
         except FileNotFoundError:
             last_pos = 0
             time.sleep(2)
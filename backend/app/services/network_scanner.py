@@ -6,6 +6,8 @@ import threading
 import nmap
 import os
 from datetime import datetime, timezone
+from sqlalchemy import func, literal_column, or_
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 from ..database import SessionLocal
 from app.state import app_state
@@ -15,6 +17,7 @@ from app.state import app_state
 from . import vulnerability_scanner
 from .nuclei_scanner import NucleiScanner
 # ### --- END OF FIX --- ###
+from . import geoip
 
 logger = logging.getLogger(__name__)
 
@@ -22,9 +25,83 @@ def check_admin():
     try: return os.geteuid() == 0
     except AttributeError: return False
 
-def scan_and_update_hosts(db: Session):
+# Rows per INSERT statement, keeping the bind parameters well under the driver's limit.
+UPSERT_CHUNK_ROWS = 1000
+# Host columns that count as a change; last_seen is refreshed on every scan regardless.
+HOST_FIELDS = ("mac_address", "hostname", "vendor", "os_name", "status")
+# Location columns, kept as they are when a scan could not locate the host (e.g. no GeoIP database).
+HOST_GEO_FIELDS = ("country_code", "country_name", "latitude", "longitude")
+
+
+def _chunks(rows: list):
+    for i in range(0, len(rows), UPSERT_CHUNK_ROWS):
+        yield rows[i:i + UPSERT_CHUNK_ROWS]
+
+
+def upsert_scan_results(db: Session, host_rows: list, port_rows: list) -> dict:
+    """
+    Writes one scan's hosts and open ports with set-based INSERT ... ON CONFLICT
+    statements, in the caller's transaction (the caller commits). Hosts are keyed
+    on ip_address and ports on (host_ip, port_number, protocol). Rows whose
+    fields did not change are not rewritten; unchanged hosts only get last_seen.
+    Returns the number of inserted, updated and unchanged hosts and ports.
+    """
     from app.models import Host, NetworkPort
 
+    hosts = Host.__table__
+    host_ids = {}
+    host_counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+    for chunk in _chunks(host_rows):
+        statement = insert(hosts).values(chunk)
+        new_values = {field: statement.excluded[field] for field in HOST_FIELDS}
+        new_values.update({
+            field: func.coalesce(statement.excluded[field], hosts.c[field]) for field in HOST_GEO_FIELDS
+        })
+        statement = statement.on_conflict_do_update(
+            index_elements=[hosts.c.ip_address],
+            set_={**new_values, "last_seen": statement.excluded.last_seen},
+            where=or_(*(hosts.c[field].is_distinct_from(value) for field, value in new_values.items())),
+        ).returning(hosts.c.id, hosts.c.ip_address, literal_column("xmax = 0").label("inserted"))
+        for host_id, ip_address, inserted in db.execute(statement):
+            host_ids[ip_address] = host_id
+            host_counts["inserted" if inserted else "updated"] += 1
+
+        unchanged = [row["ip_address"] for row in chunk if row["ip_address"] not in host_ids]
+        if unchanged:
+            refreshed = db.execute(
+                hosts.update()
+                .where(hosts.c.ip_address.in_(unchanged))
+                .values(last_seen=chunk[0]["last_seen"])
+                .returning(hosts.c.id, hosts.c.ip_address)
+            )
+            for host_id, ip_address in refreshed:
+                host_ids[ip_address] = host_id
+                host_counts["unchanged"] += 1
+
+    ports = NetworkPort.__table__
+    port_counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+    for chunk in _chunks(port_rows):
+        chunk = [{**row, "host_id": host_ids.get(row["host_ip"])} for row in chunk]
+        statement = insert(ports).values(chunk)
+        # The first-seen timestamp is kept; a changed service name or host link is updated.
+        statement = statement.on_conflict_do_update(
+            constraint="uq_network_ports_host_port",
+            set_={"service_name": statement.excluded.service_name, "host_id": statement.excluded.host_id},
+            where=or_(
+                ports.c.service_name.is_distinct_from(statement.excluded.service_name),
+                ports.c.host_id.is_distinct_from(statement.excluded.host_id),
+            ),
+        ).returning(literal_column("xmax = 0").label("inserted"))
+        written = 0
+        for inserted, in db.execute(statement):
+            port_counts["inserted" if inserted else "updated"] += 1
+            written += 1
+        port_counts["unchanged"] += len(chunk) - written
+
+    return {"hosts": host_counts, "ports": port_counts}
+
+
+def scan_and_update_hosts(db: Session):
     if not check_admin():
         logger.warning("Host scan requires root/admin privileges. Skipping.")
         return
@@ -45,6 +122,48 @@ def scan_and_update_hosts(db: Session):
     online_hosts = nm.all_hosts()
     logger.info(f"Found {len(online_hosts)} online hosts. Beginning modern scan funnel...")
 
+    # --- Collect the whole scan result, then write it in one transaction ---
+    now = datetime.now(timezone.utc)
+    host_rows, port_rows, hosts_with_open_ports = [], [], set()
+    for host_ip in online_hosts:
+        os_name = "Unknown"
+        if 'osmatch' in nm[host_ip] and nm[host_ip]['osmatch']:
+            os_name = nm[host_ip]['osmatch'][0]['name']
+        location = geoip.lookup(host_ip)
+        host_rows.append({
+            "ip_address": host_ip,
+            "mac_address": nm[host_ip]['addresses'].get('mac'),
+            "hostname": nm[host_ip].hostname() or 'N/A',
+            "vendor": next(iter(nm[host_ip].get('vendor', {}).values()), None),
+            "os_name": os_name,
+            "status": 'up',
+            "last_seen": now,
+            "country_code": location.country_code if location else None,
+            "country_name": location.country_name if location else None,
+            "latitude": location.latitude if location else None,
+            "longitude": location.longitude if location else None,
+        })
+
+        open_ports = [
+            {"host_ip": host_ip, "port_number": port, "protocol": 'tcp',
+             "service_name": port_info.get('name', 'unknown'), "timestamp": now}
+            for port, port_info in nm[host_ip].get('tcp', {}).items()
+            if port_info['state'] == 'open'
+        ]
+        port_rows.extend(open_ports)
+        if open_ports:
+            hosts_with_open_ports.add(host_ip)
+
+    started = time.monotonic()
+    try:
+        counts = upsert_scan_results(db, host_rows, port_rows)
+        db.commit()
+    except Exception as e:
+        logger.error(f"Failed to save the scan results of {len(host_rows)} hosts. Error: {e}", exc_info=True)
+        db.rollback()
+        return
+    logger.info(f"💾 Saved scan results in {time.monotonic() - started:.2f}s: hosts {counts['hosts']}, ports {counts['ports']}")
+
     # ### --- THIS IS PART OF THE FIX --- ###
     # Instantiate the Nuclei scanner once per run, as it manages its own DB connections.
     nuclei_scanner_instance = NucleiScanner(db=db)
@@ -52,42 +171,9 @@ def scan_and_update_hosts(db: Session):
 
     for host_ip in online_hosts:
         try:
-            # (Host processing and port updating logic remains the same)
-            db_host = db.query(Host).filter(Host.ip_address == host_ip).first()
-            hostname = nm[host_ip].hostname() or 'N/A'
-            mac_address = nm[host_ip]['addresses'].get('mac')
-            vendor = next(iter(nm[host_ip].get('vendor', {}).values()), None)
-            os_name = "Unknown"
-            if 'osmatch' in nm[host_ip] and nm[host_ip]['osmatch']:
-                os_name = nm[host_ip]['osmatch'][0]['name']
-
-            if not db_host:
-                db_host = Host(ip_address=host_ip)
-                db.add(db_host)
-
-            db_host.mac_address = mac_address
-            db_host.hostname = hostname
-            db_host.vendor = vendor
-            db_host.os_name = os_name
-            db_host.status = 'up'
-            db_host.last_seen = datetime.now(timezone.utc)
-            db.commit()
-
-            has_open_ports = False
-            if 'tcp' in nm[host_ip]:
-                for port, port_info in nm[host_ip]['tcp'].items():
-                    if port_info['state'] == 'open':
-                        has_open_ports = True
-                        existing_port = db.query(NetworkPort).filter_by(host_ip=host_ip, port_number=port, protocol='tcp').first()
-                        if not existing_port:
-                            new_port = NetworkPort(port_number=port, protocol='tcp', service_name=port_info.get('name', 'unknown'), timestamp=datetime.now(timezone.utc), host_ip=host_ip, host=db_host)
-                            db.add(new_port)
-            db.commit()
-
-
             # ### --- THIS IS THE NEW SCAN FUNNEL LOGIC --- ###
 
-            if not has_open_ports:
+            if host_ip not in hosts_with_open_ports:
                 logger.info(f"Host {host_ip} has no open ports. Skipping vulnerability scans.")
                 continue
 
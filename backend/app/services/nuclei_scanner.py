@@ -3,20 +3,33 @@ import subprocess
 import json
 import os
 import tempfile
+import threading
 from sqlalchemy.orm import Session
 from sqlalchemy.dialects.mysql import insert
-from elasticsearch import Elasticsearch, helpers
+from elasticsearch import helpers
 from .. import models
+from .es_client import get_es
 
-ELASTICSEARCH_URI = os.environ.get("ELASTICSEARCH_URI", "http://127.0.0.1:9200")
 ES_INDEX = "nuclei_findings"
 
+# The findings index only needs to be checked for once per process, not per scanner.
+_index_ready = False
+_index_lock = threading.Lock()
+
 class NucleiScanner:
     def __init__(self, db: Session):
         self.db = db
-        self.es = Elasticsearch([ELASTICSEARCH_URI])
-        if not self.es.indices.exists(index=ES_INDEX):
-            self.es.indices.create(index=ES_INDEX)
+        self.es = get_es()
+
+    def _ensure_index(self):
+        global _index_ready
+        if _index_ready:
+            return
+        with _index_lock:
+            if not _index_ready:
+                if not self.es.indices.exists(index=ES_INDEX):
+                    self.es.indices.create(index=ES_INDEX)
+                _index_ready = True
 
     def _parse_and_prepare(self, output_file: str):
         findings = []
@@ -53,6 +66,7 @@ class NucleiScanner:
     def _save_to_elasticsearch(self, findings: list):
         if not findings:
             return
+        self._ensure_index()
 
         actions = [
             {
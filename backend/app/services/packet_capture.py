@@ -5,9 +5,10 @@ import queue
 import json
 import asyncio
 import os
+import select
 import time
-from datetime import datetime, timezone
-from elasticsearch import Elasticsearch, ConnectionError as ESConnectionError
+from collections import deque
+from elasticsearch import ApiError, TransportError, ConnectionError as ESConnectionError
 
 from scapy.all import sniff, Scapy_Exception, Packet as ScapyPacket, Ether
 from scapy.layers.inet import IP, TCP, UDP, ICMP
@@ -15,65 +16,85 @@ from scapy.layers.inet import IP, TCP, UDP, ICMP
 from app.routers.connection_manager import manager
 from app.state import app_state
 from app.config import settings
+from app.services.es_bulk_writer import BulkWriter
+from app.services.es_client import get_es
+from app.services.es_spool import DiskSpool
+from app.services.packet_pipeline import PacketPipeline, Sink
+from app.services.packet_transport import BatchSender, ProducerStats, ReorderBuffer, record_to_dict, F_TIMESTAMP
+from app.services.ek_parser import get_parser
+from app.services.flow_table import FlowTable
+from app.services import geoip
+from app.services.es_indices import PACKET_INDEX, FLOW_INDEX, IndexMaintenance, daily_index, install_index_templates
+from app.services.sketches import TrafficSketches
+from app.services.traffic_rollup import TrafficRollups
+from app.services.ioc_matcher import IocMatchStage, ioc_feeds
 
 logger = logging.getLogger(__name__)
 
+def read_pipe_lines(fd: int, idle_timeout: float, chunk_size: int = 65536):
+    """
+    Yields complete lines (as bytes) read from a pipe file descriptor. Yields
+    None whenever no data arrived for `idle_timeout` seconds, so the caller can
+    flush partial work. Returns when the writer side closes the pipe.
+    """
+    pending = b""
+    while True:
+        ready, _, _ = select.select([fd], [], [], idle_timeout)
+        if not ready:
+            yield None
+            continue
+        chunk = os.read(fd, chunk_size)
+        if not chunk:
+            return
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        yield from lines
+
+
 def json_sniffer_process(packet_queue: multiprocessing.Queue, pipe_path: str, stop_event: multiprocessing.Event):
     """
     This function runs in a separate process. It reads newline-delimited JSON objects
-    from a named pipe (produced by tshark -T ek) and puts them into a queue.
+    from a named pipe (produced by tshark -T ek) and puts packet records on the
+    queue in batches (see packet_transport).
     """
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - [json_sniffer_process] - %(levelname)s - %(message)s')
     proc_logger = logging.getLogger(__name__)
     proc_logger.info(f"JSON sniffer process started. Monitoring pipe: '{pipe_path}'.")
+    parse_ek_line = get_parser(settings.PACKET_PARSER)
+    sender = BatchSender(
+        packet_queue,
+        max_records=settings.PACKET_BATCH_SIZE,
+        max_delay=settings.PACKET_BATCH_MAX_DELAY,
+    )
+    reported_drops = 0
 
     while not stop_event.is_set():
         try:
             proc_logger.info(f"Opening pipe '{pipe_path}'. Waiting for data stream...")
-            with open(pipe_path, 'r') as f:
-                for line in f:
+            fd = os.open(pipe_path, os.O_RDONLY)
+            try:
+                for line in read_pipe_lines(fd, settings.PACKET_BATCH_MAX_DELAY):
                     if stop_event.is_set():
                         break
+                    if line is None:
+                        sender.flush()
+                        continue
 
                     try:
-                        ek_doc = json.loads(line)
-                        layers = ek_doc.get("layers")
-                        if not layers:
-                            continue
+                        record = parse_ek_line(line)
+                    except (ValueError, KeyError, AttributeError, TypeError):
+                        continue
+                    if record:
+                        sender.add(record)
+                    sender.flush_if_due()
 
-                        # Extract the timestamp directly from the tshark -T ek output
-                        timestamp_str = ek_doc.get("timestamp")
-                        
-                        packet_data = {
-                            # Convert tshark timestamp (string with ms) to ISO 8601 format without ms for consistency
-                            "@timestamp": datetime.fromtimestamp(float(timestamp_str)/1000, tz=timezone.utc).isoformat(),
-                            "source_ip": layers.get("ip", {}).get("ip_ip_src"),
-                            "destination_ip": layers.get("ip", {}).get("ip_ip_dst"),
-                            "length": int(layers.get("frame", {}).get("frame_frame_len", 0)),
-                            "ttl": int(layers.get("ip", {}).get("ip_ip_ttl", 0)),
-                            "protocol": "UNKNOWN",
-                            "source_mac": layers.get("eth", {}).get("eth_eth_src"),
-                            "destination_mac": layers.get("eth", {}).get("eth_eth_dst"),
-                            "source_port": None, "destination_port": None,
-                            "flags": None, "info": ""
-                        }
-
-                        if "tcp" in layers:
-                            packet_data["protocol"] = "TCP"
-                            packet_data["source_port"] = int(layers["tcp"].get("tcp_tcp_srcport", 0))
-                            packet_data["destination_port"] = int(layers["tcp"].get("tcp_tcp_dstport", 0))
-                        elif "udp" in layers:
-                            packet_data["protocol"] = "UDP"
-                            packet_data["source_port"] = int(layers["udp"].get("udp_udp_srcport", 0))
-                            packet_data["destination_port"] = int(layers["udp"].get("udp_udp_dstport", 0))
-                        elif "icmp" in layers:
-                             packet_data["protocol"] = "ICMP"
-
-                        if packet_data["source_ip"] and packet_data["destination_ip"]:
-                            packet_queue.put(packet_data)
-
-                    except (json.JSONDecodeError, KeyError, AttributeError):
-                        continue 
+                    if sender.dropped - reported_drops >= 10000:
+                        # The handler is behind; batches are dropped rather than queued without bound.
+                        proc_logger.warning(f"Packet queue is full. {sender.dropped} packets dropped so far.")
+                        reported_drops = sender.dropped
+            finally:
+                sender.flush()
+                os.close(fd)
 
             proc_logger.warning("Stream ended. Will attempt to reopen in 2 seconds.")
             time.sleep(2) 
@@ -86,75 +107,352 @@ def json_sniffer_process(packet_queue: multiprocessing.Queue, pipe_path: str, st
     proc_logger.info("Sniffer process received stop signal and is shutting down.")
 
 
-def data_handler_thread(packet_queue: multiprocessing.Queue, stop_event: multiprocessing.Event):
+def pipe_splitter_process(chunk_queue: multiprocessing.Queue, pipe_path: str, stop_event: multiprocessing.Event):
     """
-    Handles data from the sniffer.
-    - Path 1: Feeds data into Elasticsearch for deep analysis.
-    - Path 2: Broadcasts data to the live UI via WebSockets.
+    Runs in a separate process. Reads the named pipe in large binary chunks, cuts
+    them on the last newline and hands each chunk to the parser worker pool, so
+    EK parsing can use more than one core.
     """
-    logger.info("Elasticsearch Writer & Broadcaster thread started.")
-
-    es_client = None
-    try:
-        es_client = Elasticsearch(settings.ELASTICSEARCH_URI, retry_on_timeout=True, max_retries=10)
-        logger.info(f"Elasticsearch client connected to {settings.ELASTICSEARCH_URI}")
-        
-        # --- THIS IS THE FIX ---
-        # Define the correct mapping for our index and create it if it doesn't exist.
-        index_name = "netguard-packets"
-        index_mapping = {
-            "mappings": {
-                "properties": {
-                    "@timestamp":       { "type": "date" },
-                    "source_ip":        { "type": "ip" },
-                    "destination_ip":   { "type": "ip" },
-                    "length":           { "type": "long" },
-                    "ttl":              { "type": "integer" },
-                    "protocol":         { "type": "keyword" },
-                    "source_mac":       { "type": "keyword" },
-                    "destination_mac":  { "type": "keyword" },
-                    "source_port":      { "type": "integer" },
-                    "destination_port": { "type": "integer" }
-                }
-            }
-        }
-        
-        if not es_client.indices.exists(index=index_name):
-            try:
-                es_client.indices.create(index=index_name, body=index_mapping)
-                logger.info(f"Successfully created Elasticsearch index '{index_name}' with custom mapping.")
-            except Exception as e_map:
-                logger.error(f"Failed to create Elasticsearch index mapping: {e_map}")
-        # --- END OF FIX ---
-                
-    except ESConnectionError as e:
-        logger.critical(f"FATAL: Could not connect to Elasticsearch on startup. Scapy data will not be saved. Error: {e}")
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - [pipe_splitter_process] - %(levelname)s - %(message)s')
+    proc_logger = logging.getLogger(__name__)
+    proc_logger.info(f"Pipe splitter process started. Monitoring pipe: '{pipe_path}'.")
+    chunk_bytes = settings.PACKET_SPLIT_CHUNK_BYTES
+    stalls = 0
 
     while not stop_event.is_set():
         try:
-            packet_data = packet_queue.get(timeout=1.0)
-
-            # Broadcast to frontend
-            broadcast_message = {"type": "packet_data", "data": packet_data}
-            json_string_message = json.dumps(broadcast_message, default=str)
-            main_loop = app_state.main_event_loop
-            if main_loop and main_loop.is_running():
-                asyncio.run_coroutine_threadsafe(manager.broadcast(json_string_message), main_loop)
-
-            # Send to Elasticsearch
-            if es_client:
-                es_doc = packet_data.copy()
-                del es_doc['info']
-                try:
-                    es_client.index(index="netguard-packets", document=es_doc)
-                except ESConnectionError as e:
-                    logger.error(f"Failed to send packet to Elasticsearch: {e}")
+            proc_logger.info(f"Opening pipe '{pipe_path}'. Waiting for data stream...")
+            fd = os.open(pipe_path, os.O_RDONLY)
+            try:
+                buffer = b""
+                while not stop_event.is_set():
+                    ready, _, _ = select.select([fd], [], [], settings.PACKET_BATCH_MAX_DELAY)
+                    end_of_stream = False
+                    if ready:
+                        data = os.read(fd, chunk_bytes)
+                        end_of_stream = not data
+                        buffer += data
+                        # Keep reading while the pipe has more, up to one full chunk.
+                        if data and len(buffer) < chunk_bytes and select.select([fd], [], [], 0)[0]:
+                            continue
+
+                    cut = buffer.rfind(b"\n")
+                    if cut < 0:
+                        if end_of_stream:
+                            break
+                        continue
+                    chunk, buffer = buffer[:cut], buffer[cut + 1:]
+                    # Block while the workers are busy: the pipe then backs up to tshark,
+                    # instead of chunks (hundreds of packets each) being thrown away here.
+                    while not stop_event.is_set():
+                        try:
+                            chunk_queue.put(chunk, timeout=1.0)
+                            break
+                        except queue.Full:
+                            stalls += 1
+                            if stalls % 10 == 1:
+                                proc_logger.warning("Parser workers are behind; the splitter is waiting for a free slot.")
+                    if end_of_stream:
+                        break
+            finally:
+                os.close(fd)
+
+            proc_logger.warning("Stream ended. Will attempt to reopen in 2 seconds.")
+            time.sleep(2)
+
+        except Exception as e:
+            proc_logger.error(f"An unexpected error occurred in the pipe splitter loop: {e}", exc_info=True)
+            proc_logger.info("Restarting splitter loop after a 5 second delay...")
+            time.sleep(5)
+
+    proc_logger.info("Splitter process received stop signal and is shutting down.")
+
+
+def ek_parser_worker(worker_id: int, chunk_queue: multiprocessing.Queue, packet_queue: multiprocessing.Queue, stop_event: multiprocessing.Event):
+    """
+    Runs in a separate process, one per worker. Parses the chunks cut by
+    pipe_splitter_process and sends the resulting records to the handler
+    thread in batches tagged with this worker's id.
+    """
+    logging.basicConfig(level=logging.INFO, format=f'%(asctime)s - [ek_parser_worker-{worker_id}] - %(levelname)s - %(message)s')
+    proc_logger = logging.getLogger(__name__)
+    parse_ek_line = get_parser(settings.PACKET_PARSER)
+    sender = BatchSender(
+        packet_queue,
+        producer_id=worker_id,
+        max_records=settings.PACKET_BATCH_SIZE,
+        max_delay=settings.PACKET_BATCH_MAX_DELAY,
+    )
+    reported_drops = 0
+    proc_logger.info("EK parser worker started.")
 
+    while not stop_event.is_set():
+        try:
+            chunk = chunk_queue.get(timeout=settings.PACKET_BATCH_MAX_DELAY)
         except queue.Empty:
+            sender.flush()
             continue
+
+        for line in chunk.split(b"\n"):
+            try:
+                record = parse_ek_line(line)
+            except (ValueError, KeyError, AttributeError, TypeError):
+                continue
+            if record:
+                sender.add(record)
+        sender.flush_if_due()
+
+        if sender.dropped - reported_drops >= 10000:
+            proc_logger.warning(f"Packet queue is full. {sender.dropped} packets dropped so far.")
+            reported_drops = sender.dropped
+
+    sender.flush()
+    proc_logger.info("EK parser worker received stop signal and is shutting down.")
+
+
+class ElasticsearchStage:
+    """
+    Pipeline stage that persists traffic to Elasticsearch: folds packets into the
+    flow table and feeds finished flows, plus all or a sample of the raw packets
+    (PACKET_INDEX_MODE), to the bulk writer. Documents go to daily indices (see
+    es_indices) and old days are dropped by the index maintenance thread.
+    """
+
+    def __init__(self, stop_event: multiprocessing.Event):
+        # The shared client, with more patience for retries than the request path.
+        self.es_client = get_es().options(retry_on_timeout=True, max_retries=10)
+
+        indices_ready = False
+        try:
+            self._prepare_indices()
+            indices_ready = True
+            logger.info(f"Elasticsearch client connected to {settings.ELASTICSEARCH_URI}")
+        except ESConnectionError as e:
+            logger.error(f"Could not reach Elasticsearch on startup; indices will be prepared once it is up. Error: {e}")
+        except (ApiError, TransportError) as e:
+            # A rejected template must not take the other pipeline sinks down with it.
+            logger.error(f"Could not install the Elasticsearch index templates on startup; will retry before the first bulk request. Error: {e}")
+
+        spool = None
+        if settings.PACKET_SPOOL_DIR:
+            try:
+                spool = DiskSpool(
+                    settings.PACKET_SPOOL_DIR,
+                    segment_bytes=settings.PACKET_SPOOL_SEGMENT_MB * 1024 * 1024,
+                    max_bytes=settings.PACKET_SPOOL_MAX_MB * 1024 * 1024,
+                )
+            except OSError as e:
+                logger.error(f"Could not open the spool directory '{settings.PACKET_SPOOL_DIR}'; documents will be dropped while Elasticsearch is down. Error: {e}")
+
+        writer_client = self.es_client
+        if spool is not None:
+            # With a spool, a hung cluster must fail fast: the batch goes to disk and the
+            # replay thread's backoff does the retrying, instead of blocking the sink thread.
+            writer_client = get_es().options(
+                request_timeout=settings.PACKET_SPOOL_SLOW_FLUSH_SECONDS, max_retries=0, retry_on_timeout=False,
+            )
+        self.writer = BulkWriter(
+            writer_client,
+            PACKET_INDEX,
+            max_docs=settings.PACKET_BULK_SIZE,
+            max_interval=settings.PACKET_BULK_FLUSH_SECONDS,
+            spool=spool,
+            slow_flush_seconds=settings.PACKET_SPOOL_SLOW_FLUSH_SECONDS,
+            prepare=None if indices_ready else self._prepare_indices,
+        )
+        self.writer.start_replay(stop_event)
+
+        self.maintenance = IndexMaintenance(
+            self.es_client,
+            {PACKET_INDEX: settings.PACKET_RETENTION_DAYS, FLOW_INDEX: settings.FLOW_RETENTION_DAYS},
+            interval=settings.INDEX_MAINTENANCE_INTERVAL,
+        )
+        self.maintenance.start(stop_event)
+
+        self.flow_table = None
+        if settings.FLOW_TABLE_ENABLED:
+            self.flow_table = FlowTable(
+                idle_timeout=settings.FLOW_IDLE_TIMEOUT,
+                active_timeout=settings.FLOW_ACTIVE_TIMEOUT,
+                max_flows=settings.FLOW_TABLE_MAX_FLOWS,
+            )
+        self._last_expiry = time.monotonic()
+
+        # Raw packets go to Elasticsearch always, 1 in PACKET_SAMPLE_EVERY, or never.
+        index_mode = settings.PACKET_INDEX_MODE
+        self.sample_every = max(1, settings.PACKET_SAMPLE_EVERY) if index_mode == "sampled" else 1
+        self.index_packets = index_mode != "none"
+        self._sample_counter = 0
+
+    def _prepare_indices(self):
+        install_index_templates(self.es_client)
+
+    def _add_flow(self, flow_doc: dict):
+        # Flows are far fewer than packets, and the lookups are cached, so they carry the countries.
+        for side in ("source", "destination"):
+            info = geoip.lookup(flow_doc[f"{side}_ip"])
+            if info is not None:
+                flow_doc[f"{side}_country"] = info.country_code
+        self.writer.add(flow_doc, index=daily_index(FLOW_INDEX, flow_doc["@timestamp"]))
+
+    def handle(self, records: list):
+        writer = self.writer
+        for record in records:
+            if self.flow_table:
+                for flow_doc in self.flow_table.update(record):
+                    self._add_flow(flow_doc)
+
+            if self.index_packets:
+                self._sample_counter += 1
+                if self._sample_counter >= self.sample_every:
+                    self._sample_counter = 0
+                    writer.add(record_to_dict(record), index=daily_index(PACKET_INDEX, record[F_TIMESTAMP]))
+
+    def tick(self):
+        if self.flow_table and time.monotonic() - self._last_expiry >= 1.0:
+            self._last_expiry = time.monotonic()
+            for flow_doc in self.flow_table.expire():
+                self._add_flow(flow_doc)
+        self.writer.flush_if_due()
+
+    def close(self):
+        if self.flow_table:
+            for flow_doc in self.flow_table.flush():
+                self._add_flow(flow_doc)
+        self.writer.close()
+
+    def stats(self) -> dict:
+        return {
+            "bulk_writer": self.writer.stats(),
+            "flow_table": self.flow_table.stats() if self.flow_table else None,
+            "index_maintenance": self.maintenance.stats(),
+        }
+
+
+class LiveBroadcastStage:
+    """
+    Pipeline stage that pushes packets to the live UI over WebSockets.
+
+    Packets are coalesced into one "packet_batch" frame per tick. A frame holds
+    at most `max_packets` of the newest packets and reports how many were left
+    out, and it is serialized once and shared by every connected client.
+    """
+
+    def __init__(self, max_packets: int = 50):
+        self.max_packets = max_packets
+        self._pending = deque(maxlen=max_packets)
+        self._pending_total = 0
+
+        self.frames_sent = 0
+        self.packets_sent = 0
+        self.packets_dropped = 0
+
+    def handle(self, records: list):
+        self._pending.extend(records)
+        self._pending_total += len(records)
+
+    def tick(self):
+        if not self._pending_total:
+            return
+        records, total = list(self._pending), self._pending_total
+        self._pending.clear()
+        self._pending_total = 0
+        dropped = total - len(records)
+
+        main_loop = app_state.main_event_loop
+        if main_loop is None or not main_loop.is_running() or not manager.active_connections:
+            self.packets_dropped += total
+            return
+
+        frame = json.dumps({
+            "type": "packet_batch",
+            "data": [record_to_dict(record) for record in records],
+            "dropped": dropped,
+        }, default=str)
+        asyncio.run_coroutine_threadsafe(manager.broadcast(frame), main_loop)
+        self.frames_sent += 1
+        self.packets_sent += len(records)
+        self.packets_dropped += dropped
+
+    def stats(self) -> dict:
+        return {
+            "frames_sent": self.frames_sent,
+            "packets_sent": self.packets_sent,
+            "packets_dropped": self.packets_dropped,
+        }
+
+
+def data_handler_thread(packet_queue: multiprocessing.Queue, stop_event: multiprocessing.Event):
+    """
+    Handles data from the sniffer. Each batch of packet records is dispatched to
+    independent sinks, each with its own bounded queue, worker and drop policy:
+    - "elasticsearch": flow aggregation and bulk indexing (see ElasticsearchStage).
+    - "live": coalesced, rate-limited frames to the live UI via WebSockets.
+    - "sketches": in-memory top-k and distinct-count sketches (see sketches.TrafficSketches).
+    - "rollups": per-protocol/port-class/direction volume rollups (see traffic_rollup.TrafficRollups).
+    - "ioc": matching against threat-intel feeds, raising alerts (see ioc_matcher.IocMatchStage).
+    """
+    logger.info("Packet handler thread started.")
+
+    pipeline = PacketPipeline()
+    pipeline.add_sink(Sink(
+        "elasticsearch", ElasticsearchStage(stop_event),
+        maxsize=settings.PIPELINE_SINK_QUEUE_BATCHES, drop_policy=settings.PIPELINE_ES_DROP_POLICY,
+    ))
+    pipeline.add_sink(Sink(
+        "live", LiveBroadcastStage(max_packets=settings.LIVE_FRAME_MAX_PACKETS),
+        maxsize=settings.PIPELINE_SINK_QUEUE_BATCHES, drop_policy="drop_oldest",
+        tick_interval=settings.LIVE_FRAME_INTERVAL_MS / 1000,
+    ))
+    sketches = TrafficSketches(
+        window_minutes=settings.SKETCH_WINDOW_MINUTES,
+        top_k_capacity=settings.SKETCH_TOP_K_CAPACITY,
+        max_hosts=settings.SKETCH_MAX_HOSTS,
+        hll_precision=settings.SKETCH_HLL_PRECISION,
+    )
+    pipeline.add_sink(Sink(
+        "sketches", sketches,
+        maxsize=settings.PIPELINE_SINK_QUEUE_BATCHES, drop_policy="drop_newest",
+    ))
+    app_state.traffic_sketches = sketches
+    rollups = TrafficRollups(
+        flush_interval=settings.ROLLUP_FLUSH_SECONDS,
+        minute_retention_days=settings.ROLLUP_MINUTE_RETENTION_DAYS,
+        hour_retention_days=settings.ROLLUP_HOUR_RETENTION_DAYS,
+    )
+    pipeline.add_sink(Sink(
+        "rollups", rollups,
+        maxsize=settings.PIPELINE_SINK_QUEUE_BATCHES, drop_policy="drop_newest", tick_interval=1.0,
+    ))
+    app_state.traffic_rollups = rollups
+    ioc_feeds.start(stop_event)
+    pipeline.add_sink(Sink(
+        "ioc", IocMatchStage(ioc_feeds, dedup_seconds=settings.IOC_ALERT_DEDUP_SECONDS, severity=settings.IOC_ALERT_SEVERITY),
+        maxsize=settings.PIPELINE_SINK_QUEUE_BATCHES, drop_policy="drop_newest", tick_interval=1.0,
+    ))
+    app_state.packet_pipeline = pipeline
+    pipeline.start(stop_event)
+
+    # With several parser workers, batches interleave; restore timestamp order within a small window.
+    reorder = ReorderBuffer(settings.PACKET_REORDER_WINDOW_MS) if settings.PACKET_PARSER_WORKERS > 1 else None
+    producer_stats = ProducerStats()
+    app_state.packet_producer_stats = producer_stats
+
+    while not stop_event.is_set():
+        records = []
+        try:
+            producer_id, sent_at, records = packet_queue.get(timeout=0.25)
+            producer_stats.observe(producer_id, sent_at, records)
+        except queue.Empty:
+            pass
         except Exception as e:
-            logger.error(f"Error in Elasticsearch data handler thread: {e}", exc_info=True)
+            logger.error(f"Error in packet handler thread: {e}", exc_info=True)
+
+        if reorder:
+            reorder.push(records)
+            records = reorder.pop_ready()
+
+        pipeline.dispatch(records)
 
-    if es_client:
-        es_client.close()
-    logger.info("Elasticsearch data handler thread shutting down.")
\ No newline at end of file
+    pipeline.join(timeout=30)
+    logger.info("Packet handler thread shutting down.")
@@ -0,0 +1,159 @@
+# backend/app/services/packet_pipeline.py
+"""
+Fan-out stage of the packet pipeline.
+
+The handler thread hands every batch of packet records to a PacketPipeline,
+which offers it to each registered Sink. A sink owns a bounded queue and a
+worker thread, so a slow consumer (a stalled Elasticsearch, a slow browser)
+only ever fills its own queue. What happens when that queue is full is the
+sink's drop policy:
+
+- "drop_oldest": discard the oldest queued batch (live views want fresh data)
+- "drop_newest": discard the incoming batch (keeps what is already queued)
+- "block": wait for room, throttling the dispatcher and so every other sink
+"""
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DROP_POLICIES = ("drop_oldest", "drop_newest", "block")
+
+
+class Sink:
+    """
+    Runs a stage in its own thread behind a bounded queue of record batches.
+
+    The stage is any object with a `handle(records)` method. It may also define
+    `tick()`, called at least every `tick_interval` seconds for time-based work
+    (flushing, expiry), and `close()`, called once when the pipeline stops.
+    """
+
+    def __init__(self, name: str, stage, maxsize: int = 256, drop_policy: str = "drop_newest", tick_interval: float = 0.25):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy '{drop_policy}'. Expected one of {DROP_POLICIES}.")
+        self.name = name
+        self.stage = stage
+        self.drop_policy = drop_policy
+        self.tick_interval = tick_interval
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = None
+
+        self.offered = 0
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.handle_ms = 0.0
+
+    def offer(self, records: list):
+        """Queues a batch for this sink without ever blocking, unless the policy is 'block'."""
+        self.offered += len(records)
+        if self.drop_policy == "block":
+            self._queue.put(records)
+            return
+        try:
+            self._queue.put_nowait(records)
+            return
+        except queue.Full:
+            pass
+        if self.drop_policy == "drop_oldest":
+            try:
+                self.dropped += len(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(records)
+                return
+            except queue.Full:
+                pass
+        self.dropped += len(records)
+
+    def start(self, stop_event):
+        self._thread = threading.Thread(target=self._run, args=(stop_event,), daemon=True, name=f"Sink-{self.name}")
+        self._thread.start()
+
+    def join(self, timeout: float = None):
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self, stop_event):
+        tick = getattr(self.stage, "tick", None)
+        last_tick = time.monotonic()
+        while not stop_event.is_set():
+            try:
+                records = self._queue.get(timeout=self.tick_interval)
+            except queue.Empty:
+                records = None
+
+            if records:
+                started = time.monotonic()
+                try:
+                    self.stage.handle(records)
+                    self.processed += len(records)
+                except Exception as e:
+                    self.errors += 1
+                    logger.error(f"Sink '{self.name}' failed to handle a batch: {e}", exc_info=True)
+                # Exponentially weighted average, so the figure tracks recent behaviour.
+                self.handle_ms = 0.9 * self.handle_ms + 0.1 * (time.monotonic() - started) * 1000
+
+            if tick and time.monotonic() - last_tick >= self.tick_interval:
+                last_tick = time.monotonic()
+                try:
+                    tick()
+                except Exception as e:
+                    self.errors += 1
+                    logger.error(f"Sink '{self.name}' failed during its periodic tick: {e}", exc_info=True)
+
+        close = getattr(self.stage, "close", None)
+        if close:
+            try:
+                close()
+            except Exception as e:
+                logger.error(f"Sink '{self.name}' failed to close cleanly: {e}", exc_info=True)
+        logger.info(f"Sink '{self.name}' stopped.")
+
+    def stats(self) -> dict:
+        stats = {
+            "drop_policy": self.drop_policy,
+            "queued_batches": self._queue.qsize(),
+            "capacity": self._queue.maxsize,
+            "offered": self.offered,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "avg_handle_ms": round(self.handle_ms, 2),
+        }
+        stage_stats = getattr(self.stage, "stats", None)
+        if stage_stats:
+            stats["stage"] = stage_stats()
+        return stats
+
+
+class PacketPipeline:
+    """Dispatches each batch of records to every registered sink."""
+
+    def __init__(self):
+        self.sinks = {}
+
+    def add_sink(self, sink: Sink):
+        self.sinks[sink.name] = sink
+
+    def start(self, stop_event):
+        for sink in self.sinks.values():
+            sink.start(stop_event)
+            logger.info(f"Packet pipeline sink '{sink.name}' started (policy: {sink.drop_policy}).")
+
+    def dispatch(self, records: list):
+        if not records:
+            return
+        for sink in self.sinks.values():
+            sink.offer(records)
+
+    def join(self, timeout: float = None):
+        for sink in self.sinks.values():
+            sink.join(timeout)
+
+    def stats(self) -> dict:
+        return {name: sink.stats() for name, sink in self.sinks.items()}
@@ -0,0 +1,182 @@
+# backend/app/services/packet_transport.py
+"""
+Batched transport between the sniffer process and the packet handler thread.
+
+Packets travel as plain tuples laid out according to PACKET_FIELDS, grouped
+into batches. A batch is a single `(producer_id, sent_at, records)` message,
+so the pickling, pipe write and queue locking of multiprocessing.Queue are
+paid once per batch instead of once per packet.
+"""
+import heapq
+import queue
+import time
+
+# Fixed layout of a packet record. Consumers index into the tuple with the
+# constants below and only build a dict when a stage actually needs one.
+# The timestamp is kept as integer epoch milliseconds until serialization.
+PACKET_FIELDS = (
+    "@timestamp",
+    "source_ip",
+    "destination_ip",
+    "length",
+    "ttl",
+    "protocol",
+    "source_mac",
+    "destination_mac",
+    "source_port",
+    "destination_port",
+    "tcp_flags",
+)
+
+F_TIMESTAMP = 0
+F_SOURCE_IP = 1
+F_DESTINATION_IP = 2
+F_LENGTH = 3
+F_TTL = 4
+F_PROTOCOL = 5
+F_SOURCE_MAC = 6
+F_DESTINATION_MAC = 7
+F_SOURCE_PORT = 8
+F_DESTINATION_PORT = 9
+F_TCP_FLAGS = 10
+
+
+def format_timestamp(epoch_ms: int) -> str:
+    """Formats epoch milliseconds as an ISO 8601 UTC string, e.g. 2024-01-31T12:00:00.123Z."""
+    seconds, millis = divmod(epoch_ms, 1000)
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(seconds)) + f".{millis:03d}Z"
+
+
+def record_to_dict(record: tuple) -> dict:
+    """Expands a packet record into the document shape used by Elasticsearch and the UI."""
+    document = dict(zip(PACKET_FIELDS, record))
+    document["@timestamp"] = format_timestamp(record[F_TIMESTAMP])
+    return document
+
+
+class BatchSender:
+    """
+    Accumulates records on the producer side and puts them on the queue in
+    batches of up to `max_records`, or after `max_delay` seconds, whichever
+    comes first. When the queue is full the batch is dropped and counted,
+    so a stalled consumer can never make the producer's memory grow.
+    """
+
+    def __init__(self, out_queue, producer_id: int = 0, max_records: int = 256, max_delay: float = 0.05):
+        self.out_queue = out_queue
+        self.producer_id = producer_id
+        self.max_records = max_records
+        self.max_delay = max_delay
+
+        self._records = []
+        self._batch_started = 0.0
+        self.sent = 0
+        self.dropped = 0
+
+    def add(self, record: tuple):
+        if not self._records:
+            self._batch_started = time.monotonic()
+        self._records.append(record)
+        if len(self._records) >= self.max_records:
+            self.flush()
+
+    def flush_if_due(self):
+        if self._records and time.monotonic() - self._batch_started >= self.max_delay:
+            self.flush()
+
+    def flush(self):
+        if not self._records:
+            return
+        records, self._records = self._records, []
+        try:
+            self.out_queue.put_nowait((self.producer_id, time.time(), records))
+            self.sent += len(records)
+        except queue.Full:
+            self.dropped += len(records)
+
+
+
+class ReorderBuffer:
+    """
+    Restores timestamp order across batches coming from several parser workers.
+
+    Records are held until they are `window_ms` older than the newest record
+    seen, then released in timestamp order. If nothing new arrives for a whole
+    window, or more than `max_records` are held, the oldest are released anyway.
+    """
+
+    def __init__(self, window_ms: int = 200, max_records: int = 50000):
+        self.window_ms = window_ms
+        self.max_records = max_records
+        self._heap = []
+        self._sequence = 0
+        self._newest = 0
+        self._last_push = 0.0
+
+    def push(self, records: list):
+        if not records:
+            return
+        for record in records:
+            timestamp = record[F_TIMESTAMP]
+            if timestamp > self._newest:
+                self._newest = timestamp
+            # The sequence number keeps the heap from ever comparing two records.
+            heapq.heappush(self._heap, (timestamp, self._sequence, record))
+            self._sequence += 1
+        self._last_push = time.monotonic()
+
+    def pop_ready(self) -> list:
+        if not self._heap:
+            return []
+        if time.monotonic() - self._last_push >= self.window_ms / 1000:
+            threshold = self._newest
+        else:
+            threshold = self._newest - self.window_ms
+        ready = []
+        while self._heap and (self._heap[0][0] <= threshold or len(self._heap) > self.max_records):
+            ready.append(heapq.heappop(self._heap)[2])
+        return ready
+
+    def __len__(self):
+        return len(self._heap)
+
+
+class ProducerStats:
+    """
+    Per-producer ingest statistics, observed on the consumer side: packet rate,
+    queue lag (batch sent -> batch received) and capture lag (newest packet
+    timestamp -> batch received).
+    """
+
+    RATE_WINDOW = 5.0
+
+    def __init__(self):
+        self._producers = {}
+
+    def observe(self, producer_id: int, sent_at: float, records: list):
+        now = time.time()
+        stats = self._producers.get(producer_id)
+        if stats is None:
+            stats = self._producers[producer_id] = {
+                "packets": 0, "batches": 0, "packets_per_second": 0.0,
+                "queue_lag_ms": 0.0, "capture_lag_ms": 0.0,
+                "_window_started": now, "_window_packets": 0,
+            }
+        stats["packets"] += len(records)
+        stats["batches"] += 1
+        stats["_window_packets"] += len(records)
+        stats["queue_lag_ms"] = round((now - sent_at) * 1000, 1)
+        if records:
+            stats["capture_lag_ms"] = round(now * 1000 - records[-1][F_TIMESTAMP], 1)
+
+        elapsed = now - stats["_window_started"]
+        if elapsed >= self.RATE_WINDOW:
+            stats["packets_per_second"] = round(stats["_window_packets"] / elapsed, 1)
+            stats["_window_started"] = now
+            stats["_window_packets"] = 0
+
+    def snapshot(self) -> dict:
+        return {
+            producer_id: {k: v for k, v in stats.items() if not k.startswith("_")}
+            for producer_id, stats in self._producers.items()
+        }
@@ -0,0 +1,133 @@
+# backend/app/services/query_cache.py
+"""
+In-process cache for Elasticsearch-backed API responses.
+
+Entries are keyed on a namespace (the endpoint), the index and the normalized
+request, and callers put the current time bucket into the request so that a
+key naturally stops being asked for when the bucket rolls over. On top of
+that, entries expire after `ttl` seconds and the least recently used ones are
+evicted once the cache holds more than `max_bytes` of (estimated) results.
+
+Concurrent requests for the same key are merged: the first one runs the
+query, the others wait for its result (single-flight), so a dashboard
+refreshed by many analysts at once costs one Elasticsearch call.
+
+The cache is meant to be used from the application's event loop only.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+
+from app.config import settings
+
+
+def time_bucket(seconds: float) -> int:
+    """Index of the current `seconds`-long time bucket."""
+    return int(time.time() // seconds)
+
+
+class QueryCache:
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: float = 60):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._inflight = {}
+        self.bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.merged = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(namespace: str, index: str, request: dict) -> str:
+        normalized = json.dumps(request, sort_keys=True, separators=(",", ":"), default=str)
+        return f"{namespace}:{index}:{hashlib.sha256(normalized.encode()).hexdigest()}"
+
+    def _get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self.bytes -= size
+
+    def _put(self, key: str, value):
+        size = len(json.dumps(value, separators=(",", ":"), default=str))
+        if size > self.max_bytes // 4:
+            return  # Too big to be worth displacing everything else.
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl, size, value)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    async def get_or_compute(self, key: str, compute):
+        """
+        Returns the cached value for `key`, or awaits `compute()` to produce it.
+        Exceptions are passed to every waiting caller and never cached.
+
+        compute() runs in its own task, which every caller awaits through a
+        shield: a caller that is cancelled (e.g. its client disconnected) stops
+        waiting without cancelling the query the other callers are waiting on.
+        """
+        entry = self._get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry[2]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.merged += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(compute())
+            self._inflight[key] = task
+            # Added before any waiter's callback, so the value is cached by the time they resume.
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if task.cancelled():
+            return
+        # Retrieving the exception also keeps a failure nobody waited for from being logged as unhandled.
+        if task.exception() is None:
+            self._put(key, task.result())
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.merged
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "merged": self.merged,
+            "evictions": self.evictions,
+            "hit_ratio": round((self.hits + self.merged) / lookups, 3) if lookups else None,
+            "in_flight": len(self._inflight),
+        }
+
+
+# The application-wide cache used by the packet and investigation routers.
+query_cache = QueryCache(
+    max_bytes=settings.QUERY_CACHE_MAX_MB * 1024 * 1024,
+    ttl=settings.QUERY_CACHE_TTL_SECONDS,
+)
@@ -0,0 +1,113 @@
+# backend/app/services/query_filters.py
+"""
+Structured filters for investigation searches.
+
+Filters are compiled to term/terms/range clauses for `bool.filter`, which
+Elasticsearch neither scores nor recomputes: filter clauses are cached per
+segment and reused by every query that repeats them, as dashboards do. The
+compiled clauses are memoized here too, keyed on a canonical form of the
+filters, so a repeated query costs a dictionary lookup to build.
+"""
+import ipaddress
+import json
+from functools import lru_cache
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+from app.services.es_indices import FLOW_INDEX
+
+# Field holding the byte count of a document, per index. Packets use `length`.
+BYTES_FIELDS = {FLOW_INDEX: "bytes"}
+DEFAULT_BYTES_FIELD = "length"
+
+
+class QueryFilters(BaseModel):
+    """Structured search filters. Every given filter must match; values within a list are alternatives."""
+    source_ips: Optional[List[str]] = Field(default=None, example=["10.0.0.5", "192.168.1.0/24"], description="Source IPs or CIDR ranges.")
+    destination_ips: Optional[List[str]] = Field(default=None, description="Destination IPs or CIDR ranges.")
+    hosts: Optional[List[str]] = Field(default=None, description="IPs or CIDR ranges matched on either side of the traffic.")
+    source_ports: Optional[List[str]] = Field(default=None, example=["53", "1024-65535"], description="Ports or inclusive 'low-high' ranges.")
+    destination_ports: Optional[List[str]] = Field(default=None, example=["80", "443", "8000-8100"], description="Ports or inclusive 'low-high' ranges.")
+    protocols: Optional[List[str]] = Field(default=None, example=["TCP", "UDP"])
+    min_bytes: Optional[int] = Field(default=None, ge=0, description="Packet length (or flow bytes) at least this.")
+    max_bytes: Optional[int] = Field(default=None, ge=0, description="Packet length (or flow bytes) at most this.")
+
+
+def _normalize_networks(values: List[str]) -> List[str]:
+    networks = []
+    for value in values:
+        try:
+            network = ipaddress.ip_network(value.strip(), strict=False)
+        except ValueError:
+            raise ValueError(f"'{value}' is not an IP address or CIDR range.")
+        # Single addresses are sent as plain IPs, ranges in CIDR notation; both work in term queries on `ip` fields.
+        networks.append(str(network.network_address) if network.num_addresses == 1 else str(network))
+    return sorted(set(networks))
+
+
+def _port_clauses(field: str, values: List[str]) -> list:
+    ports, clauses = set(), []
+    for value in values:
+        low, _, high = value.strip().partition("-")
+        try:
+            low, high = int(low), int(high) if high else None
+        except ValueError:
+            raise ValueError(f"'{value}' is not a port or a 'low-high' port range.")
+        if high is None:
+            ports.add(low)
+        else:
+            clauses.append({"range": {field: {"gte": min(low, high), "lte": max(low, high)}}})
+    if ports:
+        clauses.insert(0, {"terms": {field: sorted(ports)}})
+    return clauses
+
+
+def _any_of(clauses: list) -> dict:
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"bool": {"should": clauses, "minimum_should_match": 1}}
+
+
+@lru_cache(maxsize=1024)
+def _compile(canonical: str, bytes_field: str) -> tuple:
+    filters = json.loads(canonical)
+    clauses = []
+    if filters.get("source_ips"):
+        clauses.append({"terms": {"source_ip": _normalize_networks(filters["source_ips"])}})
+    if filters.get("destination_ips"):
+        clauses.append({"terms": {"destination_ip": _normalize_networks(filters["destination_ips"])}})
+    if filters.get("hosts"):
+        hosts = _normalize_networks(filters["hosts"])
+        clauses.append(_any_of([{"terms": {"source_ip": hosts}}, {"terms": {"destination_ip": hosts}}]))
+    if filters.get("source_ports"):
+        clauses.append(_any_of(_port_clauses("source_port", filters["source_ports"])))
+    if filters.get("destination_ports"):
+        clauses.append(_any_of(_port_clauses("destination_port", filters["destination_ports"])))
+    if filters.get("protocols"):
+        clauses.append({"terms": {"protocol": sorted({p.strip().upper() for p in filters["protocols"]})}})
+    byte_range = {}
+    if filters.get("min_bytes") is not None:
+        byte_range["gte"] = filters["min_bytes"]
+    if filters.get("max_bytes") is not None:
+        byte_range["lte"] = filters["max_bytes"]
+    if byte_range:
+        clauses.append({"range": {bytes_field: byte_range}})
+    return tuple(clauses)
+
+
+def compile_filters(filters: Optional[QueryFilters], index: str) -> list:
+    """
+    Returns the `bool.filter` clauses for `filters` on `index`. Raises
+    ValueError for malformed IPs or ports. The clauses are shared with the
+    cache, so callers must not modify them.
+    """
+    if filters is None:
+        return []
+    canonical = json.dumps(filters.dict(exclude_none=True), sort_keys=True)
+    return list(_compile(canonical, BYTES_FIELDS.get(index, DEFAULT_BYTES_FIELD)))
+
+
+def cache_info() -> dict:
+    info = _compile.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "max_size": info.maxsize}
@@ -4,7 +4,7 @@ import time
 import schedule
 from app.database import SessionLocal
 from app.models import Host
-from . import gvm_scanner
+from . import gvm_scanner, alert_partitions
 
 logger = logging.getLogger(__name__)
 
@@ -39,8 +39,10 @@ def start_security_monitor():
     schedule.every(15).minutes.do(schedule_gvm_report_check)
     # Run a full audit of all hosts every night at 2:00 AM.
     schedule.every().day.at("02:00").do(schedule_nightly_gvm_audit)
+    # Keep the security_alerts partitions ahead of time and drop expired ones.
+    schedule.every().hour.do(alert_partitions.run_maintenance)
     
-    logger.info("🗓️  Schedule configured. Nightly GVM audit at 02:00. Report checks every 15 mins.")
+    logger.info("🗓️  Schedule configured. Nightly GVM audit at 02:00. Report checks every 15 mins. Alert partition upkeep hourly.")
 
     # --- Run the scheduler loop ---
     # The first report check will be after an initial delay
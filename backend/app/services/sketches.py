@@ -0,0 +1,360 @@
+# backend/app/services/sketches.py
+"""
+Small streaming sketches for answering "top-k" and "how many distinct" over
+the live packet stream from memory.
+
+- SpaceSaving: top-k heavy hitters with a bounded number of counters. Every
+  reported count is an over-estimate by at most its `error`.
+- HyperLogLog: distinct counts in 2**p one-byte registers, with a relative
+  standard error of about 1.04 / sqrt(2**p).
+- PeerSketch: one small HyperLogLog of distinct peers per host.
+- SlidingWindow: a ring of per-slot sketches so questions can be asked about
+  the last N slots; closed slots are merged once and cached, and queries read
+  that cached part together with the open slot without copying either.
+"""
+import heapq
+import math
+import threading
+import time
+
+from app.services.packet_transport import (
+    F_TIMESTAMP, F_SOURCE_IP, F_DESTINATION_IP, F_LENGTH, F_PROTOCOL, F_DESTINATION_PORT,
+)
+
+SLOT_MS = 60 * 1000
+
+# 2**-rank for every possible HyperLogLog register value.
+_INVERSE_POWERS = [2.0 ** -rank for rank in range(65)]
+
+
+class SpaceSaving:
+    """Space-Saving top-k counter (Metwally et al.), supporting weighted updates."""
+
+    def __init__(self, capacity: int = 1000):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        # Min-heap of (count, item) with lazy deletion: stale entries are skipped on pop.
+        self._heap = []
+
+    def update(self, item, weight: int = 1):
+        counts = self.counts
+        if item in counts:
+            counts[item] += weight
+            heapq.heappush(self._heap, (counts[item], item))
+        elif len(counts) < self.capacity:
+            counts[item] = weight
+            self.errors[item] = 0
+            heapq.heappush(self._heap, (weight, item))
+        else:
+            # Replace the smallest counter; the new item inherits its count as error.
+            while True:
+                count, victim = heapq.heappop(self._heap)
+                if counts.get(victim) == count:
+                    break
+            del counts[victim]
+            del self.errors[victim]
+            counts[item] = count + weight
+            self.errors[item] = count
+            heapq.heappush(self._heap, (count + weight, item))
+
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(count, item) for item, count in counts.items()]
+            heapq.heapify(self._heap)
+
+    def merge(self, other: "SpaceSaving"):
+        """Adds another summary into this one, keeping the `capacity` largest counters."""
+        for item, count in other.counts.items():
+            self.counts[item] = self.counts.get(item, 0) + count
+            self.errors[item] = self.errors.get(item, 0) + other.errors[item]
+        if len(self.counts) > self.capacity:
+            keep = heapq.nlargest(self.capacity, self.counts.items(), key=lambda kv: kv[1])
+            self.counts = dict(keep)
+            self.errors = {item: self.errors[item] for item in self.counts}
+        self._heap = [(count, item) for item, count in self.counts.items()]
+        heapq.heapify(self._heap)
+
+    def top(self, k: int) -> list:
+        """Returns up to k (item, count, error) tuples, largest count first."""
+        return [
+            (item, count, self.errors[item])
+            for item, count in heapq.nlargest(k, self.counts.items(), key=lambda kv: kv[1])
+        ]
+
+    def copy(self) -> "SpaceSaving":
+        clone = SpaceSaving(self.capacity)
+        clone.merge(self)
+        return clone
+
+    @staticmethod
+    def top_of_sum(first: "SpaceSaving", second: "SpaceSaving", k: int) -> list:
+        """top(k) of the sum of two summaries, read in place instead of merged into a new one."""
+        if second is None or not second.counts:
+            return first.top(k)
+        a, b = first.counts, second.counts
+        items = heapq.nlargest(k, a.keys() | b.keys(), key=lambda item: a.get(item, 0) + b.get(item, 0))
+        return [
+            (item, a.get(item, 0) + b.get(item, 0), first.errors.get(item, 0) + second.errors.get(item, 0))
+            for item in items
+        ]
+
+
+class HyperLogLog:
+    """HyperLogLog distinct counter. Items are hashed with Python's 64-bit hash()."""
+
+    def __init__(self, p: int = 12):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+        self._rank_bits = 64 - p
+        if self.m >= 128:
+            self._alpha = 0.7213 / (1 + 1.079 / self.m)
+        else:
+            self._alpha = {16: 0.673, 32: 0.697, 64: 0.709}[self.m]
+
+    def add(self, item):
+        x = hash(item) & 0xFFFFFFFFFFFFFFFF
+        index = x >> self._rank_bits
+        rest = x & ((1 << self._rank_bits) - 1)
+        rank = self._rank_bits - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        return self._estimate(self.registers)
+
+    def union_count(self, other: "HyperLogLog") -> int:
+        """count() of the union with `other`, leaving both sketches untouched."""
+        return self._estimate(bytes(map(max, self.registers, other.registers)))
+
+    def _estimate(self, registers) -> int:
+        estimate = self._alpha * self.m * self.m / sum(map(_INVERSE_POWERS.__getitem__, registers))
+        if estimate <= 2.5 * self.m:
+            zeros = registers.count(0)
+            if zeros:
+                # Small-range correction: linear counting.
+                estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+    def copy(self) -> "HyperLogLog":
+        clone = HyperLogLog(self.p)
+        clone.registers = bytearray(self.registers)
+        return clone
+
+
+class PeerSketch:
+    """Distinct peers per host: a HyperLogLog per host, for at most `max_hosts` hosts."""
+
+    def __init__(self, p: int = 8, max_hosts: int = 2000):
+        self.p = p
+        self.max_hosts = max_hosts
+        self.hosts = {}
+        self.untracked = 0
+        # Hosts added to since a reader last cleared this, so it only recounts those.
+        self.changed = set()
+
+    def add(self, host, peer):
+        sketch = self.hosts.get(host)
+        if sketch is None:
+            if len(self.hosts) >= self.max_hosts:
+                self.untracked += 1
+                return
+            sketch = self.hosts[host] = HyperLogLog(self.p)
+        sketch.add(peer)
+        self.changed.add(host)
+
+    def merge(self, other: "PeerSketch"):
+        for host, sketch in other.hosts.items():
+            mine = self.hosts.get(host)
+            if mine is None:
+                self.hosts[host] = sketch.copy()
+            else:
+                mine.merge(sketch)
+        self.untracked += other.untracked
+
+
+class SlidingWindow:
+    """
+    Ring of `slots` sketches, each covering `slot_ms` milliseconds of event time.
+
+    `factory()` creates an empty sketch and `merge(into, other)` folds one
+    sketch into another. merged() combines the last N slots; the closed part
+    of that window only changes when time moves to a new slot or a late record
+    lands in a closed slot, so it is cached until either happens.
+    """
+
+    def __init__(self, slot_ms: int, slots: int, factory, merge):
+        self.slot_ms = slot_ms
+        self.slots = slots
+        self.factory = factory
+        self.merge_into = merge
+        self._ring = [(None, None)] * slots
+        self._closed_cache = {}
+        self._cached_current_id = None  # slots before this one are in the cache
+
+    def sketch_for(self, timestamp_ms: int):
+        """Returns the sketch for the slot containing `timestamp_ms`, recycling stale slots."""
+        slot_id = timestamp_ms // self.slot_ms
+        position = slot_id % self.slots
+        current_id, sketch = self._ring[position]
+        if current_id != slot_id:
+            if current_id is not None and current_id > slot_id:
+                return None  # Older than the whole window.
+            sketch = self.factory()
+            self._ring[position] = (slot_id, sketch)
+            self._closed_cache.clear()
+        elif self._closed_cache and slot_id < self._cached_current_id:
+            # A late record is about to change a slot folded into the cached closed part.
+            self._closed_cache.clear()
+        return sketch
+
+    def window(self, now_ms: int, window_slots: int) -> list:
+        """Returns the sketches of the last `window_slots` slots up to `now_ms`, in ring order."""
+        window_slots = max(1, min(window_slots, self.slots))
+        current_id = now_ms // self.slot_ms
+        oldest_id = current_id - window_slots + 1
+        return [
+            sketch for slot_id, sketch in self._ring
+            if slot_id is not None and oldest_id <= slot_id <= current_id
+        ]
+
+    def parts(self, now_ms: int, window_slots: int) -> tuple:
+        """
+        The last `window_slots` slots up to `now_ms` as (closed, current): the
+        merged closed slots, cached, and the open slot's sketch (or None).
+        Both are live objects, to be read and not modified.
+        """
+        window_slots = max(1, min(window_slots, self.slots))
+        current_id = now_ms // self.slot_ms
+
+        key = (current_id, window_slots)
+        closed = self._closed_cache.get(key)
+        if closed is None:
+            closed = self.factory()
+            for sketch in self.window(now_ms - self.slot_ms, window_slots - 1) if window_slots > 1 else []:
+                self.merge_into(closed, sketch)
+            self._closed_cache = {key: closed}
+            self._cached_current_id = current_id
+
+        slot_id, sketch = self._ring[current_id % self.slots]
+        return closed, sketch if slot_id == current_id else None
+
+
+def _merge(into, other):
+    into.merge(other)
+
+
+class TrafficSketches:
+    """
+    Pipeline stage keeping per-minute sketches of the live packet stream:
+    top talkers by bytes sent, top destination ports by packets, and distinct
+    peers per host. Queries cover the last N minutes and never touch Elasticsearch.
+    """
+
+    def __init__(self, window_minutes: int = 60, top_k_capacity: int = 1000, max_hosts: int = 2000, hll_precision: int = 8):
+        self.window_minutes = window_minutes
+        self.hll_precision = hll_precision
+        self._lock = threading.Lock()
+        self._talkers = SlidingWindow(SLOT_MS, window_minutes, lambda: SpaceSaving(top_k_capacity), _merge)
+        self._ports = SlidingWindow(SLOT_MS, window_minutes, lambda: SpaceSaving(top_k_capacity), _merge)
+        self._peers = SlidingWindow(SLOT_MS, window_minutes, lambda: PeerSketch(hll_precision, max_hosts), _merge)
+        self._closed_peer_counts = (None, [])  # (closed PeerSketch, [(host, distinct peers)], largest first)
+        self._current_peer_counts = (None, None, {})  # (closed, open PeerSketch, {host: distinct peers})
+        self.packets = 0
+        self.late_packets = 0
+
+    def handle(self, records: list):
+        with self._lock:
+            slot_id = None
+            for record in records:
+                timestamp = record[F_TIMESTAMP]
+                if timestamp // SLOT_MS != slot_id:
+                    slot_id = timestamp // SLOT_MS
+                    talkers = self._talkers.sketch_for(timestamp)
+                    ports = self._ports.sketch_for(timestamp)
+                    peers = self._peers.sketch_for(timestamp)
+                if talkers is None:
+                    self.late_packets += 1
+                    continue
+
+                source, destination = record[F_SOURCE_IP], record[F_DESTINATION_IP]
+                talkers.update(source, record[F_LENGTH] or 0)
+                port = record[F_DESTINATION_PORT]
+                if port is not None:
+                    ports.update((port, record[F_PROTOCOL] or ""))
+                peers.add(source, destination)
+                peers.add(destination, source)
+            self.packets += len(records)
+
+    def _window_slots(self, minutes: int) -> int:
+        return max(1, min(minutes, self.window_minutes))
+
+    def top_talkers(self, minutes: int, limit: int) -> list:
+        with self._lock:
+            closed, current = self._talkers.parts(int(time.time() * 1000), self._window_slots(minutes))
+            top = SpaceSaving.top_of_sum(closed, current, limit)
+        return [{"ip": ip, "bytes": count, "error": error} for ip, count, error in top]
+
+    def top_ports(self, minutes: int, limit: int) -> list:
+        with self._lock:
+            closed, current = self._ports.parts(int(time.time() * 1000), self._window_slots(minutes))
+            top = SpaceSaving.top_of_sum(closed, current, limit)
+        return [
+            {"port": port, "protocol": protocol, "packets": count, "error": error}
+            for (port, protocol), count, error in top
+        ]
+
+    def distinct_peers(self, minutes: int, host: str = None, limit: int = 10) -> list:
+        """Distinct peers of `host`, or of the `limit` hosts with the most peers when no host is given."""
+        now_ms = int(time.time() * 1000)
+        with self._lock:
+            if host is not None:
+                merged = HyperLogLog(self.hll_precision)
+                for sketch in self._peers.window(now_ms, self._window_slots(minutes)):
+                    if host in sketch.hosts:
+                        merged.merge(sketch.hosts[host])
+                return [{"host": host, "distinct_peers": merged.count()}]
+            closed, current = self._peers.parts(now_ms, self._window_slots(minutes))
+            # Counts of the closed part are computed once per cached merge. Hosts seen in the
+            # open slot are counted as the union of both sketches, and recounted only once
+            # new peers were added for them.
+            cached_closed, closed_ranked = self._closed_peer_counts
+            if cached_closed is not closed:
+                closed_ranked = sorted(
+                    ((host, sketch.count()) for host, sketch in closed.hosts.items()), key=lambda item: -item[1]
+                )
+                self._closed_peer_counts = (closed, closed_ranked)
+            current_counts = {}
+            if current is not None:
+                counted_closed, counted_current, current_counts = self._current_peer_counts
+                if counted_closed is closed and counted_current is current:
+                    hosts = current.changed
+                else:
+                    hosts, current_counts = current.hosts, {}
+                for host in hosts:
+                    mine, sketch = closed.hosts.get(host), current.hosts[host]
+                    current_counts[host] = mine.union_count(sketch) if mine is not None else sketch.count()
+                current.changed = set()
+                self._current_peer_counts = (closed, current, current_counts)
+            # A host of the open slot has at least its closed count, so the best `limit` closed-only
+            # hosts are the first ones of the ranked list that are not in the open slot.
+            counts = list(current_counts.items())
+            for host, count in closed_ranked:
+                if len(counts) >= len(current_counts) + limit:
+                    break
+                if host not in current_counts:
+                    counts.append((host, count))
+        return [
+            {"host": host, "distinct_peers": count}
+            for host, count in heapq.nlargest(limit, counts, key=lambda item: item[1])
+        ]
+
+    def stats(self) -> dict:
+        return {
+            "packets": self.packets,
+            "late_packets": self.late_packets,
+            "window_minutes": self.window_minutes,
+        }
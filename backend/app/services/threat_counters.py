@@ -0,0 +1,224 @@
+# backend/app/services/threat_counters.py
+"""
+Incrementally maintained threat-intel counters.
+
+Instead of aggregating security_alerts on every request, alerts are counted as
+they are ingested into one small summary per UTC day:
+
+- the total number of alerts,
+- the number of alerts per severity,
+- the top sources by alert count (a SpaceSaving summary),
+- the number of alerts per source country (as stored on the alert),
+- the distinct sources, overall and per source country (HyperLogLog sketches).
+
+Questions about the last N days merge at most N of these summaries, so they
+cost the same whatever the size of the table. The counters live in memory;
+they are rebuilt from security_alerts at startup and on demand. Writers commit
+and record a batch under `commit_lock`, which lets a rebuild pin its database
+snapshot between two batches: batches committed after that point are kept in a
+delta and added to the rebuilt counters, so none is lost or counted twice.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import cast, func, select, text, Date
+
+from app import models
+from app.config import settings
+from app.database import SessionLocal
+from app.services.sketches import HyperLogLog, SpaceSaving
+
+logger = logging.getLogger(__name__)
+
+# Precision of the per-country distinct-source sketches: 256 bytes each, about 6.5% error.
+COUNTRY_HLL_PRECISION = 8
+
+
+class DayCounters:
+    def __init__(self, top_k_capacity: int, hll_precision: int):
+        self.total = 0
+        self.severities = Counter()
+        self.countries = Counter()
+        self.sources = SpaceSaving(top_k_capacity)
+        self.distinct_sources = HyperLogLog(hll_precision)
+        self.country_sources = {}  # country -> HyperLogLog of its distinct sources
+
+    def add(self, severity, source_ip, country, count: int = 1):
+        country = country or "Unknown"
+        self.total += count
+        self.severities[str(severity)] += count
+        self.countries[country] += count
+        if source_ip:
+            self.sources.update(source_ip, count)
+            self.distinct_sources.add(source_ip)
+            sketch = self.country_sources.get(country)
+            if sketch is None:
+                sketch = self.country_sources[country] = HyperLogLog(COUNTRY_HLL_PRECISION)
+            sketch.add(source_ip)
+
+
+class ThreatCounters:
+    def __init__(self, retention_days: int = 30, top_k_capacity: int = 1000, hll_precision: int = 12):
+        self.retention_days = retention_days
+        self.top_k_capacity = top_k_capacity
+        self.hll_precision = hll_precision
+        self._lock = threading.Lock()
+        self._days = {}  # date -> DayCounters
+        self._rebuild_lock = threading.Lock()
+        # Held by writers around committing a batch and recording it; see the module docstring.
+        self.commit_lock = threading.Lock()
+        self._delta = None  # batches recorded while a rebuild runs
+
+        self.alerts_recorded = 0
+        self.rebuilds = 0
+        self.last_rebuild = None
+
+    def _new_day(self) -> DayCounters:
+        return DayCounters(self.top_k_capacity, self.hll_precision)
+
+    def _expire(self, days: dict, today: date):
+        cutoff = today - timedelta(days=self.retention_days)
+        for day in [day for day in days if day < cutoff]:
+            del days[day]
+
+    def _add_rows(self, days: dict, rows: list):
+        for row in rows:
+            get = row.get if isinstance(row, dict) else lambda name: getattr(row, name)
+            timestamp = get("timestamp")
+            if timestamp.tzinfo is not None:
+                timestamp = timestamp.astimezone(timezone.utc)
+            day = timestamp.date()
+            counters = days.get(day)
+            if counters is None:
+                counters = days[day] = self._new_day()
+            counters.add(get("severity"), get("source_ip"), get("source_country"))
+
+    def record(self, rows: list):
+        """
+        Counts newly ingested alerts: dicts (or objects) with timestamp, severity,
+        source_ip and source_country. Call it under `commit_lock`, right after
+        committing them.
+        """
+        with self._lock:
+            self._add_rows(self._days, rows)
+            if self._delta is not None:
+                self._delta.append(rows)
+            self.alerts_recorded += len(rows)
+            self._expire(self._days, datetime.now(timezone.utc).date())
+
+    def rebuild(self) -> dict:
+        """
+        Recomputes every day within the retention period from security_alerts,
+        adds the batches recorded since the query's snapshot, then swaps the
+        result in.
+        """
+        with self._rebuild_lock:
+            started = time.monotonic()
+            today = datetime.now(timezone.utc).date()
+            since = datetime.combine(today - timedelta(days=self.retention_days), datetime.min.time())
+            alert = models.SecurityAlert
+            day = cast(alert.timestamp, Date)
+            statement = (
+                select(day, alert.severity, alert.source_ip, alert.source_country, func.count())
+                .where(alert.timestamp >= since)
+                .group_by(day, alert.severity, alert.source_ip, alert.source_country)
+            )
+            days = {}
+            try:
+                with SessionLocal() as db:
+                    # One snapshot for the whole transaction, taken by its first statement while no
+                    # batch is between its commit and record(); later batches go to the delta.
+                    db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+                    with self.commit_lock:
+                        db.execute(text("SELECT 1"))
+                        with self._lock:
+                            self._delta = []
+                    for alert_day, severity, source_ip, country, count in db.execute(statement):
+                        counters = days.get(alert_day)
+                        if counters is None:
+                            counters = days[alert_day] = self._new_day()
+                        counters.add(severity, source_ip, country, count)
+            except Exception:
+                with self._lock:
+                    self._delta = None
+                raise
+            with self._lock:
+                for rows in self._delta:
+                    self._add_rows(days, rows)
+                self._delta = None
+                self._expire(days, today)
+                self._days = days
+            self.rebuilds += 1
+            self.last_rebuild = datetime.now(timezone.utc).isoformat()
+            elapsed = time.monotonic() - started
+            total = sum(counters.total for counters in days.values())
+            logger.info(f"Rebuilt threat counters from {total} alerts over {len(days)} days in {elapsed:.2f}s.")
+            return {"alerts": total, "days": len(days), "seconds": round(elapsed, 3)}
+
+    def _window(self, days: int) -> list:
+        first = datetime.now(timezone.utc).date() - timedelta(days=max(1, days) - 1)
+        return [counters for day, counters in self._days.items() if day >= first]
+
+    def summary(self, days: int, top: int = 100) -> dict:
+        """
+        Totals, severities, distinct sources and the `top` sources of the last
+        `days` UTC days (today included), with per country both the number of
+        alerts (`countries`) and of distinct sources (`country_sources`).
+        """
+        severities = Counter()
+        countries = Counter()
+        country_sources = {}
+        sources = SpaceSaving(self.top_k_capacity)
+        distinct = HyperLogLog(self.hll_precision)
+        total = 0
+        with self._lock:
+            for counters in self._window(days):
+                total += counters.total
+                severities.update(counters.severities)
+                countries.update(counters.countries)
+                if top:
+                    sources.merge(counters.sources)
+                distinct.merge(counters.distinct_sources)
+                for country, sketch in counters.country_sources.items():
+                    merged = country_sources.get(country)
+                    if merged is None:
+                        country_sources[country] = sketch.copy()
+                    else:
+                        merged.merge(sketch)
+        country_counts = Counter({country: sketch.count() for country, sketch in country_sources.items()})
+        return {
+            "total_alerts": total,
+            "severities": dict(severities),
+            "countries": countries.most_common(),
+            "country_sources": country_counts.most_common(),
+            "unique_sources": distinct.count() if total else 0,
+            "top_sources": sources.top(top),
+        }
+
+    def top_sources(self, days: int, limit: int) -> list:
+        """(source_ip, count, error) of the `limit` sources with the most alerts in the last `days` days."""
+        return self.summary(days, top=limit)["top_sources"]
+
+    def stats(self) -> dict:
+        with self._lock:
+            days = sorted(self._days)
+            total = sum(counters.total for counters in self._days.values())
+        return {
+            "days": len(days),
+            "first_day": days[0].isoformat() if days else None,
+            "alerts": total,
+            "alerts_recorded": self.alerts_recorded,
+            "rebuilds": self.rebuilds,
+            "last_rebuild": self.last_rebuild,
+        }
+
+
+# The application-wide counters, fed by the alert ingestion paths.
+threat_counters = ThreatCounters(
+    retention_days=settings.THREAT_COUNTER_DAYS,
+    top_k_capacity=settings.THREAT_TOP_SOURCES_CAPACITY,
+    hll_precision=settings.THREAT_HLL_PRECISION,
+)
@@ -1,53 +1,31 @@
 # backend/app/services/threat_intelligence.py
 
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from app import models, schemas
-from geoip2.database import Reader
-from geoip2.errors import AddressNotFoundError
-import os
+from app import schemas
+from app.services import geoip
+from app.services.threat_counters import threat_counters
+import math
 
-# Assume you will place the GeoLite2 database in your project's database folder
-GEOIP_DB_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'database', 'GeoLite2-Country.mmdb')
-
-# It's efficient to load the reader once at startup.
-try:
-    geoip_reader = Reader(GEOIP_DB_PATH)
-except FileNotFoundError:
-    geoip_reader = None
 
 def get_country_from_ip(ip: str):
-    if not geoip_reader or not ip or ip == '127.0.0.1': # Avoid looking up localhost
-        return "Unknown"
-    try:
-        response = geoip_reader.country(ip)
-        return response.country.iso_code
-    except AddressNotFoundError:
-        return "Local" # IPs like 192.168.x.x won't be found, so we label them 'Local'
-    except Exception:
-        return "Unknown"
+    """Country of `ip` (cached, see services/geoip.py): an ISO code, "Local" for private addresses, else "Unknown"."""
+    return geoip.country_code(ip) or "Unknown"
 
-def get_threat_intel_summary(db: Session):
-    """Calculates and returns a summary of threat intelligence data."""
+def get_threat_intel_summary(hours: int = 24 * 7):
+    """
+    Returns a summary of the threat intelligence data of the last `hours` hours,
+    counted in whole UTC days, from the in-memory threat counters. Countries are
+    the ones stored on the alerts at ingest, so nothing is looked up here.
+    """
     try:
-        total_alerts = db.query(func.count(models.SecurityAlert.id)).scalar()
-        high_severity_alerts = db.query(func.count(models.SecurityAlert.id)).filter(models.SecurityAlert.severity == 1).scalar()
-        unique_attackers = db.query(func.count(func.distinct(models.SecurityAlert.source_ip))).scalar()
-
-        attacker_ips = db.query(models.SecurityAlert.source_ip).distinct().limit(100).all()
-        country_counts = {}
-        for ip, in attacker_ips:
-            country = get_country_from_ip(ip)
-            country_counts[country] = country_counts.get(country, 0) + 1
-            
-        countries = [{"country": name, "count": count} for name, count in country_counts.items()]
-        countries = sorted(countries, key=lambda x: x['count'], reverse=True)
+        summary = threat_counters.summary(days=math.ceil(hours / 24), top=0)
+        # Per country, the number of distinct attacking IPs (not of alerts).
+        countries = [{"country": name, "count": count} for name, count in summary["country_sources"]]
 
         # Correctly populate the schema with the queried data
         return schemas.ThreatIntelSummarySchema(
-            total_alerts=total_alerts or 0,
-            high_severity_alerts=high_severity_alerts or 0,
-            unique_attackers=unique_attackers or 0,
+            total_alerts=summary["total_alerts"],
+            high_severity_alerts=summary["severities"].get("1", 0),
+            unique_attackers=summary["unique_sources"],
             countries=countries
         )
     except Exception as e:
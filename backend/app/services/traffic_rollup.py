@@ -0,0 +1,310 @@
+# backend/app/services/traffic_rollup.py
+"""
+Time-bucketed traffic rollups fed by the packet pipeline.
+
+Bytes and packets are counted per protocol, per port class and per direction
+in fixed-size ring arrays at three resolutions (1 s, 1 min, 1 h). Each ring is
+a pair of flat array('Q') buffers of `slots x keys` counters, so memory use is
+fixed no matter how much traffic flows through. Closed 1 min and 1 h buckets
+are periodically upserted into the `traffic_rollups` table, which answers
+windows that are older than what the rings still hold.
+"""
+import ipaddress
+import logging
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+
+from app import models
+from app.database import SessionLocal
+from app.services.packet_transport import (
+    F_TIMESTAMP, F_SOURCE_IP, F_DESTINATION_IP, F_LENGTH, F_PROTOCOL, F_SOURCE_PORT, F_DESTINATION_PORT,
+)
+
+logger = logging.getLogger(__name__)
+
+DIMENSIONS = {
+    "protocol": ("TCP", "UDP", "ICMP", "UNKNOWN"),
+    # Classified by the lower of the two ports, which is usually the service side.
+    "port_class": ("well_known", "registered", "ephemeral", "none"),
+    # Relative to private (RFC 1918 / ULA / link-local) address space.
+    "direction": ("inbound", "outbound", "internal", "external"),
+}
+
+# Flat key layout shared by every ring: (dimension, value) -> column.
+KEYS = [(dimension, value) for dimension, values in DIMENSIONS.items() for value in values]
+KEY_INDEX = {key: i for i, key in enumerate(KEYS)}
+NUM_KEYS = len(KEYS)
+
+_PROTOCOL_KEYS = {value: KEY_INDEX[("protocol", value)] for value in DIMENSIONS["protocol"]}
+_PORT_CLASS_KEYS = [KEY_INDEX[("port_class", value)] for value in DIMENSIONS["port_class"]]
+_DIRECTION_KEYS = [KEY_INDEX[("direction", value)] for value in DIMENSIONS["direction"]]
+
+# (resolution in seconds, number of slots): 1 hour of seconds, 1 day of minutes, 30 days of hours.
+RESOLUTIONS = ((1, 3600), (60, 1440), (3600, 720))
+# Resolutions written to PostgreSQL. Per-second buckets only live in memory.
+PERSISTED_RESOLUTIONS = (60, 3600)
+# A bucket is flushed once it has been closed for this many seconds, leaving room for late packets.
+FLUSH_GRACE_SECONDS = 5
+# Queries never sum more buckets than this; a coarser ring is used instead.
+MAX_BUCKETS_PER_QUERY = 720
+
+
+class RollupRing:
+    """`slots` buckets of `resolution` seconds, each holding a bytes and a packets counter per key."""
+
+    def __init__(self, resolution: int, slots: int):
+        self.resolution = resolution
+        self.slots = slots
+        self.bytes = array("Q", bytes(8 * slots * NUM_KEYS))
+        self.packets = array("Q", bytes(8 * slots * NUM_KEYS))
+        # Which bucket (epoch seconds // resolution) each row currently holds, -1 when empty.
+        self.bucket_ids = array("q", [-1]) * slots
+        self.oldest_bucket = None
+        # Every bucket up to and including this one has been written to the rollup store.
+        self.flushed_through = None
+
+    def row_for(self, bucket_id: int) -> int:
+        """Returns the row offset for `bucket_id`, clearing the row if it held an older bucket."""
+        row = bucket_id % self.slots
+        current = self.bucket_ids[row]
+        if current != bucket_id:
+            if current > bucket_id:
+                return -1  # Older than anything the ring still covers.
+            offset = row * NUM_KEYS
+            for i in range(offset, offset + NUM_KEYS):
+                self.bytes[i] = 0
+                self.packets[i] = 0
+            self.bucket_ids[row] = bucket_id
+            if self.oldest_bucket is None:
+                self.oldest_bucket = bucket_id
+            self.oldest_bucket = max(self.oldest_bucket, bucket_id - self.slots + 1)
+        return row * NUM_KEYS
+
+    def covers(self, start_s: float) -> bool:
+        return self.oldest_bucket is not None and start_s // self.resolution >= self.oldest_bucket
+
+    def totals(self, start_s: float, end_s: float) -> tuple:
+        """Sums every key over the buckets overlapping [start_s, end_s)."""
+        first, last = int(start_s // self.resolution), int((end_s - 1) // self.resolution)
+        byte_totals = [0] * NUM_KEYS
+        packet_totals = [0] * NUM_KEYS
+        for bucket_id in range(max(first, last - self.slots + 1), last + 1):
+            row = bucket_id % self.slots
+            if self.bucket_ids[row] != bucket_id:
+                continue
+            offset = row * NUM_KEYS
+            for key in range(NUM_KEYS):
+                byte_totals[key] += self.bytes[offset + key]
+                packet_totals[key] += self.packets[offset + key]
+        return byte_totals, packet_totals
+
+    def closed_buckets(self, now_s: float) -> list:
+        """Returns (bucket_id, row offset) of buckets that are closed and not yet flushed, oldest first."""
+        newest_closed = int((now_s - FLUSH_GRACE_SECONDS) // self.resolution) - 1
+        pending = []
+        for row, bucket_id in enumerate(self.bucket_ids):
+            if bucket_id < 0 or bucket_id > newest_closed:
+                continue
+            if self.flushed_through is not None and bucket_id <= self.flushed_through:
+                continue
+            pending.append((bucket_id, row * NUM_KEYS))
+        pending.sort()
+        return pending
+
+
+class TrafficRollups:
+    """
+    Pipeline stage maintaining the rollup rings and flushing closed buckets to
+    PostgreSQL every `flush_interval` seconds.
+    """
+
+    def __init__(self, flush_interval: float = 60, minute_retention_days: int = 7, hour_retention_days: int = 365):
+        self.rings = {resolution: RollupRing(resolution, slots) for resolution, slots in RESOLUTIONS}
+        self.flush_interval = flush_interval
+        self.retention_days = {60: minute_retention_days, 3600: hour_retention_days}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._private_cache = {}
+
+        self.packets = 0
+        self.late_packets = 0
+        self.rows_flushed = 0
+        self.flush_errors = 0
+
+    # --- Ingest ---
+
+    def _is_private(self, ip: str) -> bool:
+        cached = self._private_cache.get(ip)
+        if cached is None:
+            try:
+                address = ipaddress.ip_address(ip)
+                cached = address.is_private or address.is_link_local or address.is_multicast
+            except ValueError:
+                cached = False
+            if len(self._private_cache) >= 65536:
+                self._private_cache.clear()
+            self._private_cache[ip] = cached
+        return cached
+
+    def _keys_for(self, record) -> tuple:
+        protocol = _PROTOCOL_KEYS.get(record[F_PROTOCOL], _PROTOCOL_KEYS["UNKNOWN"])
+
+        ports = [port for port in (record[F_SOURCE_PORT], record[F_DESTINATION_PORT]) if port is not None]
+        if not ports:
+            port_class = _PORT_CLASS_KEYS[3]
+        else:
+            port = min(ports)
+            port_class = _PORT_CLASS_KEYS[0 if port < 1024 else 1 if port < 49152 else 2]
+
+        source_private = self._is_private(record[F_SOURCE_IP])
+        destination_private = self._is_private(record[F_DESTINATION_IP])
+        if source_private and destination_private:
+            direction = _DIRECTION_KEYS[2]
+        elif source_private:
+            direction = _DIRECTION_KEYS[1]
+        elif destination_private:
+            direction = _DIRECTION_KEYS[0]
+        else:
+            direction = _DIRECTION_KEYS[3]
+        return protocol, port_class, direction
+
+    def handle(self, records: list):
+        with self._lock:
+            for record in records:
+                keys = self._keys_for(record)
+                length = record[F_LENGTH] or 0
+                seconds = record[F_TIMESTAMP] // 1000
+                for ring in self.rings.values():
+                    offset = ring.row_for(seconds // ring.resolution)
+                    if offset < 0:
+                        # Too old for this ring; coarser rings may still hold its bucket.
+                        if ring.resolution == 1:
+                            self.late_packets += 1
+                        continue
+                    for key in keys:
+                        ring.bytes[offset + key] += length
+                        ring.packets[offset + key] += 1
+            self.packets += len(records)
+
+    # --- Queries ---
+
+    def distribution(self, dimension: str, start_s: float, end_s: float):
+        """
+        Returns {value: (bytes, packets)} for `dimension` over [start_s, end_s),
+        or None when the rings no longer (or not yet) cover that window.
+        """
+        for resolution, ring in sorted(self.rings.items()):
+            if (end_s - start_s) / resolution > MAX_BUCKETS_PER_QUERY:
+                continue
+            with self._lock:
+                if not ring.covers(start_s):
+                    continue
+                byte_totals, packet_totals = ring.totals(start_s, end_s)
+            return {
+                value: (byte_totals[KEY_INDEX[(dimension, value)]], packet_totals[KEY_INDEX[(dimension, value)]])
+                for value in DIMENSIONS[dimension]
+            }
+        return None
+
+    # --- Persistence ---
+
+    def tick(self):
+        if time.monotonic() - self._last_flush < self.flush_interval:
+            return
+        self._last_flush = time.monotonic()
+        self.flush()
+
+    def flush(self):
+        """Upserts every closed, not yet flushed 1 min and 1 h bucket into traffic_rollups."""
+        rows = []
+        marks = {}
+        with self._lock:
+            now_s = time.time()
+            for resolution in PERSISTED_RESOLUTIONS:
+                ring = self.rings[resolution]
+                pending = ring.closed_buckets(now_s)
+                for bucket_id, offset in pending:
+                    bucket = datetime.fromtimestamp(bucket_id * resolution, tz=timezone.utc).replace(tzinfo=None)
+                    for key, (dimension, value) in enumerate(KEYS):
+                        if ring.packets[offset + key]:
+                            rows.append({
+                                "resolution": resolution, "bucket": bucket, "dimension": dimension, "value": value,
+                                "bytes": ring.bytes[offset + key], "packets": ring.packets[offset + key],
+                            })
+                if pending:
+                    marks[resolution] = pending[-1][0]
+
+        if rows:
+            table = models.TrafficRollup.__table__
+            statement = insert(table).values(rows)
+            # Adding rather than overwriting keeps partial buckets from before a restart.
+            statement = statement.on_conflict_do_update(
+                constraint="uq_traffic_rollups_bucket",
+                set_={"bytes": table.c.bytes + statement.excluded.bytes, "packets": table.c.packets + statement.excluded.packets},
+            )
+            try:
+                with SessionLocal() as db:
+                    db.execute(statement)
+                    self._apply_retention(db, marks)
+                    db.commit()
+            except Exception as e:
+                self.flush_errors += 1
+                logger.error(f"Failed to flush {len(rows)} traffic rollup rows: {e}")
+                return
+            self.rows_flushed += len(rows)
+
+        with self._lock:
+            for resolution, bucket_id in marks.items():
+                self.rings[resolution].flushed_through = bucket_id
+
+    def _apply_retention(self, db, marks: dict):
+        # Only worth doing when an hour bucket was just closed, i.e. about once an hour.
+        if 3600 not in marks:
+            return
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        for resolution, days in self.retention_days.items():
+            cutoff = now - timedelta(days=days)
+            db.query(models.TrafficRollup).filter(
+                models.TrafficRollup.resolution == resolution,
+                models.TrafficRollup.bucket < cutoff,
+            ).delete(synchronize_session=False)
+
+    def close(self):
+        self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "packets": self.packets,
+            "late_packets": self.late_packets,
+            "rows_flushed": self.rows_flushed,
+            "flush_errors": self.flush_errors,
+            "flushed_through": {
+                resolution: ring.flushed_through for resolution, ring in self.rings.items() if resolution in PERSISTED_RESOLUTIONS
+            },
+        }
+
+
+def stored_distribution(db, dimension: str, start: datetime, end: datetime) -> dict:
+    """
+    Reads {value: (bytes, packets)} for `dimension` over [start, end) from
+    traffic_rollups, using hourly buckets for windows longer than two days.
+    """
+    resolution = 3600 if (end - start).total_seconds() > 2 * 86400 else 60
+    rollup = models.TrafficRollup
+    rows = (
+        db.query(rollup.value, func.sum(rollup.bytes), func.sum(rollup.packets))
+        .filter(
+            rollup.resolution == resolution,
+            rollup.dimension == dimension,
+            rollup.bucket >= start,
+            rollup.bucket < end,
+        )
+        .group_by(rollup.value)
+        .all()
+    )
+    return {value: (int(total_bytes or 0), int(total_packets or 0)) for value, total_bytes, total_packets in rows}
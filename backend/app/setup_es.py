@@ -0,0 +1,33 @@
+# backend/app/setup_es.py
+"""
+One-shot Elasticsearch setup, run by the 'es-setup' service in docker-compose.
+
+Filebeat ships Suricata events through the netguard-suricata-eve ingest
+pipeline and drops any event sent before that pipeline exists, so Filebeat
+only starts once this script has installed it and exited successfully.
+"""
+import sys
+import time
+
+try:
+    print("--- Elasticsearch Setup ---")
+    from app.services import alert_service
+
+    for attempt in range(1, 31):
+        try:
+            alert_service.install_ingest_pipeline()
+            break
+        except Exception as e:
+            if attempt == 30:
+                raise
+            print(f"🟡 Elasticsearch not ready ({e}), retrying in 5 seconds...")
+            time.sleep(5)
+
+    print(f"✅ Ingest pipeline '{alert_service.SURICATA_PIPELINE}' installed.")
+
+except ImportError as e:
+    print(f"❌ ImportError: Failed to import a necessary module. Error: {e}", file=sys.stderr)
+    sys.exit(1)
+except Exception as e:
+    print(f"❌ Could not install the Elasticsearch ingest pipeline: {e}", file=sys.stderr)
+    sys.exit(1)
@@ -21,3 +21,8 @@ class AppState:
 app_state = AppState()
 app_state.vulnerability_scan_in_progress = False
 app_state.active_host_ips = []
+app_state.packet_pipeline = None
+app_state.packet_producer_stats = None
+
+app_state.traffic_sketches = None
+app_state.traffic_rollups = None
\ No newline at end of file
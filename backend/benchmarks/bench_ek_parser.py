@@ -0,0 +1,65 @@
+# backend/benchmarks/bench_ek_parser.py
+"""
+Microbenchmark for the tshark -T ek line parsers.
+
+Compares the previous per-packet parser (full json.loads plus an ISO timestamp
+per packet), the "json" parser mode and the "fast" selective parser on a
+recording of EK output. Run from the 'backend' directory:
+
+    python benchmarks/bench_ek_parser.py [path/to/recording.ndjson] [--repeat N]
+
+A recording can be made on a sensor with: tshark -i eth0 -l -T ek -c 10000 > capture.ndjson
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.ek_parser import parse_ek_line_fast, parse_ek_line_json
+
+DEFAULT_SAMPLE = os.path.join(os.path.dirname(__file__), "data", "ek_sample.ndjson")
+
+
+def parse_ek_line_previous(line: bytes):
+    """The parser as it was before epoch-millisecond timestamps: formats the time per packet."""
+    record = parse_ek_line_json(line)
+    if record is None:
+        return None
+    return (datetime.fromtimestamp(record[0] / 1000, tz=timezone.utc).isoformat(),) + record[1:]
+
+
+def run(parser, lines, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for line in lines:
+            parser(line)
+    elapsed = time.perf_counter() - started
+    return len(lines) * repeat / elapsed
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("recording", nargs="?", default=DEFAULT_SAMPLE)
+    arg_parser.add_argument("--repeat", type=int, default=0, help="Passes over the recording (default: ~200k lines).")
+    args = arg_parser.parse_args()
+
+    with open(args.recording, "rb") as f:
+        lines = [line.rstrip(b"\n") for line in f if line.strip()]
+    repeat = args.repeat or max(1, 200_000 // len(lines))
+
+    # Both parsers must agree before their speed means anything.
+    mismatches = sum(1 for line in lines if parse_ek_line_fast(line) != parse_ek_line_json(line))
+    print(f"{len(lines)} lines from {args.recording}, {repeat} passes, {mismatches} parser mismatches")
+
+    baseline = None
+    for name, parser in (("previous", parse_ek_line_previous), ("json", parse_ek_line_json), ("fast", parse_ek_line_fast)):
+        rate = run(parser, lines, repeat)
+        baseline = baseline or rate
+        print(f"{name:>10}: {rate:12,.0f} lines/s  ({rate / baseline:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# backend/benchmarks/bench_index_template.py
+"""
+Compares the previous packet index layout with the managed index template.
+
+Indexes the same synthetic packets into two scratch indices, one with the old
+mapping and default settings and one with the template settings from
+app/services/es_indices.py (index sorting on @timestamp, best_compression,
+doc-values-only fields), force-merges both and reports:
+
+- disk usage per million packets
+- latency of the UI's "latest 100 packets" query (p50 / p95)
+
+Needs a reachable Elasticsearch. Run from the 'backend' directory:
+
+    python benchmarks/bench_index_template.py [--es http://localhost:9200] [--docs 1000000]
+
+The scratch indices are deleted afterwards.
+
+No results have been recorded yet: the disk and p95 gains of the template are
+unmeasured until this is run against a real cluster.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from elasticsearch import Elasticsearch, helpers
+
+from app.services.es_indices import PACKET_INDEX_MAPPING, INDEX_SETTINGS
+from app.services.packet_transport import format_timestamp
+
+BASELINE_INDEX = "bench-netguard-packets-baseline"
+TEMPLATE_INDEX = "bench-netguard-packets-template"
+
+# The mapping as it was before the index template.
+BASELINE_MAPPING = {
+    "properties": {
+        field: {"type": spec["type"]} for field, spec in PACKET_INDEX_MAPPING["properties"].items()
+    }
+}
+
+LATEST_QUERY = {
+    "size": 100,
+    "track_total_hits": False,
+    "sort": [{"@timestamp": {"order": "desc"}}],
+    "query": {"match_all": {}},
+}
+
+
+def synthetic_packets(count: int, seed: int = 7):
+    """Packets with roughly the shape of real traffic: few local hosts, many peers, common ports."""
+    rng = random.Random(seed)
+    start_ms = int(time.time() * 1000) - count  # About one packet per millisecond.
+    local_hosts = [f"192.168.1.{i}" for i in range(2, 60)]
+    ports = [443] * 8 + [80] * 3 + [53] * 4 + [22, 123, 3389, 8080]
+    for i in range(count):
+        local, remote = rng.choice(local_hosts), f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+        outbound = rng.random() < 0.5
+        service_port, client_port = rng.choice(ports), rng.randint(32768, 60999)
+        protocol = "UDP" if service_port in (53, 123) else "TCP"
+        yield {
+            "@timestamp": format_timestamp(start_ms + i),
+            "source_ip": local if outbound else remote,
+            "destination_ip": remote if outbound else local,
+            "length": rng.choice((54, 60, 66, 1514, rng.randint(60, 1514))),
+            "ttl": rng.choice((64, 128, 255, rng.randint(30, 64))),
+            "protocol": protocol,
+            "source_mac": "00:1a:2b:3c:4d:5e",
+            "destination_mac": "00:5e:4d:3c:2b:1a",
+            "source_port": client_port if outbound else service_port,
+            "destination_port": service_port if outbound else client_port,
+            "tcp_flags": rng.choice((0x10, 0x18, 0x02, 0x12, 0x11)) if protocol == "TCP" else None,
+        }
+
+
+def load(es: Elasticsearch, index: str, body: dict, docs: int) -> float:
+    es.indices.delete(index=index, ignore_unavailable=True)
+    es.indices.create(index=index, **body)
+    started = time.perf_counter()
+    for ok, item in helpers.streaming_bulk(
+        es, ({"_index": index, "_source": doc} for doc in synthetic_packets(docs)),
+        chunk_size=5000, raise_on_error=False,
+    ):
+        if not ok:
+            raise RuntimeError(f"Indexing failed: {item}")
+    elapsed = time.perf_counter() - started
+    es.indices.refresh(index=index)
+    es.indices.forcemerge(index=index, max_num_segments=1, request_timeout=3600)
+    es.indices.refresh(index=index)
+    return docs / elapsed
+
+
+def store_bytes(es: Elasticsearch, index: str) -> int:
+    stats = es.indices.stats(index=index, metric="store")
+    return stats["indices"][index]["primaries"]["store"]["size_in_bytes"]
+
+
+def query_latency(es: Elasticsearch, index: str, runs: int) -> tuple:
+    timings = []
+    for _ in range(runs):
+        # request_cache=False so every run does the actual work.
+        response = es.search(index=index, request_cache=False, **LATEST_QUERY)
+        timings.append(response["took"])
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--es", default=os.getenv("ELASTICSEARCH_URI", "http://localhost:9200"))
+    arg_parser.add_argument("--docs", type=int, default=1_000_000)
+    arg_parser.add_argument("--queries", type=int, default=200)
+    args = arg_parser.parse_args()
+
+    es = Elasticsearch(args.es, request_timeout=120)
+    layouts = (
+        ("previous", BASELINE_INDEX, {"settings": {"number_of_replicas": 0}, "mappings": BASELINE_MAPPING}),
+        ("template", TEMPLATE_INDEX, {"settings": {**INDEX_SETTINGS, "index.auto_expand_replicas": "0-0"},
+                                      "mappings": {"dynamic": False, **PACKET_INDEX_MAPPING}}),
+    )
+
+    print(f"{args.docs:,} synthetic packets per index, {args.queries} queries each")
+    results = {}
+    try:
+        for name, index, body in layouts:
+            rate = load(es, index, body, args.docs)
+            size_per_million = store_bytes(es, index) / args.docs * 1_000_000
+            p50, p95 = query_latency(es, index, args.queries)
+            results[name] = (size_per_million, p50, p95)
+            print(f"{name:>10}: {size_per_million / 2**20:8.1f} MiB per million packets, "
+                  f"latest-100 query p50 {p50:.1f} ms / p95 {p95:.1f} ms, indexed at {rate:,.0f} docs/s")
+    finally:
+        for _, index, _ in layouts:
+            es.indices.delete(index=index, ignore_unavailable=True)
+
+    before, after = results["previous"], results["template"]
+    print(f"{'change':>10}: disk {after[0] / before[0] - 1:+.0%}, p95 {after[2] / max(before[2], 0.001) - 1:+.0%}")
+
+
+if __name__ == "__main__":
+    main()
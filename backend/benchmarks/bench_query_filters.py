@@ -0,0 +1,93 @@
+# backend/benchmarks/bench_query_filters.py
+"""
+Repeated-dashboard-query benchmark: scored query_string vs compiled filters.
+
+Runs the same investigation search over and over in two forms:
+
+- "query_string": the previous body, the Lucene string in bool.must (scored)
+- "filters": the structured filters compiled by app/services/query_filters.py,
+  everything in bool.filter (unscored, cacheable)
+
+and reports p50 / p95 of the time Elasticsearch spent ('took'). The shard
+request cache is bypassed so the numbers show the query itself and the node
+filter cache, not a memoized response. Needs a reachable Elasticsearch with
+packet data. Run from the 'backend' directory:
+
+    python benchmarks/bench_query_filters.py [--es http://localhost:9200] [--index 'netguard-packets-*'] [--runs 500]
+
+No results have been recorded yet: the latency gain of filter context is
+unmeasured until this is run against a cluster with real packet data.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from elasticsearch import Elasticsearch
+
+from app.services.query_filters import QueryFilters, compile_filters
+
+# A typical dashboard panel: web traffic of one subnet, larger packets only.
+LUCENE = "protocol:TCP AND destination_port:(80 OR 443) AND source_ip:\"192.168.1.0/24\" AND length:>=100"
+FILTERS = QueryFilters(protocols=["TCP"], destination_ports=["80", "443"], source_ips=["192.168.1.0/24"], min_bytes=100)
+TIME_RANGE = {"range": {"@timestamp": {"gte": "now-24h/h", "lte": "now/h"}}}
+SORT = [{"@timestamp": {"order": "desc"}}]
+
+
+def query_string_body() -> dict:
+    return {
+        "size": 100,
+        "sort": SORT,
+        "query": {"bool": {
+            "must": {"query_string": {"query": LUCENE, "analyze_wildcard": True, "time_zone": "UTC"}},
+            "filter": TIME_RANGE,
+        }},
+    }
+
+
+def filters_body() -> dict:
+    return {
+        "size": 100,
+        "sort": SORT,
+        "track_total_hits": False,
+        "query": {"bool": {"filter": [TIME_RANGE] + compile_filters(FILTERS, "netguard-packets")}},
+    }
+
+
+def measure(es: Elasticsearch, index: str, build_body, runs: int) -> tuple:
+    took, build_us = [], []
+    for _ in range(runs):
+        started = time.perf_counter()
+        body = build_body()
+        build_us.append((time.perf_counter() - started) * 1e6)
+        response = es.search(index=index, request_cache=False, ignore_unavailable=True, **body)
+        took.append(response["took"])
+    took.sort()
+    return statistics.median(took), took[max(0, int(len(took) * 0.95) - 1)], statistics.mean(build_us), response["hits"]["hits"]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--es", default=os.getenv("ELASTICSEARCH_URI", "http://localhost:9200"))
+    arg_parser.add_argument("--index", default="netguard-packets-*")
+    arg_parser.add_argument("--runs", type=int, default=500)
+    args = arg_parser.parse_args()
+
+    es = Elasticsearch(args.es, request_timeout=60)
+    print(f"{args.runs} runs per form against '{args.index}'")
+    results = {}
+    for name, build_body in (("query_string", query_string_body), ("filters", filters_body)):
+        measure(es, args.index, build_body, 20)  # Warm up caches and connections.
+        p50, p95, build_us, hits = measure(es, args.index, build_body, args.runs)
+        results[name] = (p50, p95, hits)
+        print(f"{name:>13}: p50 {p50:6.1f} ms  p95 {p95:6.1f} ms  (body built in {build_us:.1f} us)")
+
+    same = [h["_id"] for h in results["query_string"][2]] == [h["_id"] for h in results["filters"][2]]
+    print(f"same top hits: {same}; p95 change: {results['filters'][1] / max(results['query_string'][1], 0.001) - 1:+.0%}")
+
+
+if __name__ == "__main__":
+    main()
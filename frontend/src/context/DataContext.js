@@ -14,7 +14,7 @@ export const DataProvider = ({ children }) => {
     const [hosts, setHosts] = useState([]);
     const [alerts, setAlerts] = useState([]);
     const [threatOrigins, setThreatOrigins] = useState([]);
-    const [connections, setConnections] = useState([]);
+    const [trafficHistogram, setTrafficHistogram] = useState([]);
     
     // --- 1. ADD a new state for the protocol data ---
     const [protocolDistribution, setProtocolDistribution] = useState([]);
@@ -37,7 +37,8 @@ export const DataProvider = ({ children }) => {
             fetchAndSet("/api/hosts/", setHosts, "Hosts");
             fetchAndSet("/api/security/alerts", setAlerts, "Alerts");
             fetchAndSet("/api/threat-intel/origins", setThreatOrigins, "Threats");
-            fetchAndSet("/api/zeek/connections", setConnections, "Connections");
+            // Bytes per protocol in 15s buckets, aggregated by Elasticsearch.
+            fetchAndSet("/api/packets/histogram?hours=1&interval=15s&by=protocol", setTrafficHistogram, "TrafficHistogram");
             // --- 2. ADD the fetch call for our new chart ---
             fetchAndSet("/api/packets/protocol-distribution", setProtocolDistribution, "ProtocolDistribution");
         }
@@ -52,9 +53,10 @@ export const DataProvider = ({ children }) => {
     }, []);
 
     useEffect(() => {
-        if (lastJsonMessage && lastJsonMessage.type === 'packet_data') {
-            const newPacket = lastJsonMessage.data;
-            setPackets(p => [newPacket, ...p].slice(0, MAX_PACKETS_IN_LIST));
+        if (lastJsonMessage && lastJsonMessage.type === 'packet_batch') {
+            // Frames hold the newest packets of one tick, oldest first.
+            const newPackets = [...lastJsonMessage.data].reverse();
+            setPackets(p => [...newPackets, ...p].slice(0, MAX_PACKETS_IN_LIST));
         }
     }, [lastJsonMessage]);
     
@@ -63,29 +65,9 @@ export const DataProvider = ({ children }) => {
     }, [hosts]);
 
     const protocolTrafficTimeline = useMemo(() => {
-        if (!connections || connections.length === 0) return [];
-        
-        const BUCKET_INTERVAL_MS = 15 * 1000; 
-
-        const buckets = connections.reduce((acc, conn) => {
-            const timestamp = new Date(conn.ts * 1000).getTime();
-            const bucketStart = Math.floor(timestamp / BUCKET_INTERVAL_MS) * BUCKET_INTERVAL_MS;
-
-            if (!acc[bucketStart]) {
-                acc[bucketStart] = { time: bucketStart };
-            }
-
-            const protocol = (conn.proto || 'unknown').toUpperCase();
-            const totalBytes = (conn.orig_bytes || 0) + (conn.resp_bytes || 0);
-
-            acc[bucketStart][protocol] = (acc[bucketStart][protocol] || 0) + totalBytes;
-            
-            return acc;
-        }, {});
-        
-        return Object.values(buckets).sort((a, b) => a.time - b.time);
-
-    }, [connections]);
+        if (!trafficHistogram || trafficHistogram.length === 0) return [];
+        return trafficHistogram.map(bucket => ({ time: bucket.time, ...(bucket.breakdown || {}) }));
+    }, [trafficHistogram]);
 
     const value = { 
         packets, 